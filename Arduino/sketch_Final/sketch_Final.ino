@@ -10,6 +10,44 @@
 // EEPROM addresses
 const int EE_ADDR_SPM = 0;    // float = 4 bytes
 const int EE_ADDR_OFFSET = 4; // long  = 4 bytes
+const int EE_ADDR_BUS = 8;    // byte  = bus address
+
+// --- ADDRESSED LINK ---
+// Address 0 = stand-alone pump on its own port: plain commands and replies.
+// Address 1..254 = pump on a shared link: only "@<addr>:<command>" lines are
+// accepted and every output line is prefixed with "@<addr>:".
+// Boards still transmit whenever they have output (telemetry runs on its own
+// timer) and are never polled, so the link must bring each board's output to
+// the host on a path no other transmitter drives. Half-duplex (2-wire RS-485)
+// and multi-drop return lines are NOT supported: two boards, or a board and
+// the host, would talk over each other and the lines would be lost.
+byte bus_address = 0;
+
+// Print wrapper that adds the bus prefix at the start of each output line
+class BusPrint : public Print {
+public:
+  size_t write(uint8_t c) {
+    if (line_start && bus_address != 0) {
+      Serial.write('@'); Serial.print(bus_address); Serial.write(':');
+    }
+    line_start = (c == '\n');
+    return Serial.write(c);
+  }
+private:
+  bool line_start = true;
+};
+BusPrint Out;
+
+// Strip the "@<addr>:" prefix of a line addressed to us; false if it is not for us
+bool accept_bus_command(String &command) {
+  if (command.startsWith("@")) {
+    int sep = command.indexOf(':');
+    if (sep < 0 || command.substring(1, sep).toInt() != bus_address) return false;
+    command = command.substring(sep + 1);
+    return true;
+  }
+  return bus_address == 0;   // on a shared link, unaddressed lines are not for us
+}
 
 void saveCalibration(float spm) {
   EEPROM.put(EE_ADDR_SPM, spm);
@@ -34,6 +72,9 @@ AccelStepper stepper(AccelStepper::DRIVER, STEP_PIN, DIR_PIN);
 // --- SOFTWARE LIMITS ---
 const long MAX_STEPS = 45000*20; // Set based on your hardware: measure full stroke in steps!
 const long MIN_STEPS = 0;     // If zero is "fully retracted"
+const float MAX_STEP_RATE = 4000.0;  // steps/s AccelStepper can sustain on a 16 MHz AVR
+
+#define FIRMWARE_VERSION "2.0"
 
 
 // ========== Calibration Values ==========
@@ -59,7 +100,8 @@ enum DeviceStatus {
   IDLE,
   DISPENSING,
   CANCELLED,
-  ERROR
+  ERROR,
+  RETRACTING
 };
 
 DeviceStatus current_status = IDLE;
@@ -68,30 +110,131 @@ float current_volume = 0.0;
 float current_rate = 0.0;
 float progress_percent = 0.0;
 unsigned long last_status_update = 0;
-const unsigned long STATUS_UPDATE_INTERVAL = 50; // Update every 50ms for smoother updates
+unsigned long status_update_interval = 50; // ms between progress updates, host-tunable with SET_INTERVAL
+const unsigned long MIN_STATUS_INTERVAL = 20;
+const unsigned long MAX_STATUS_INTERVAL = 5000;
 
 
 // Detect a jam if you haven’t reached your target after a reasonable time:
 const unsigned long MOVE_TIMEOUT = 30000; // 30 s max per move
 unsigned long moveStartTime = 0;
 
+// Retract (refill) move, run from loop() like a dispense
+long retract_start_position = 0;
+
 // Dispensing variables
 long target_position = 0;
 long start_position = 0;
 unsigned long dispense_start_time = 0;
 float dispensed_volume = 0.0;
 
+// --- TIMED RATE SEGMENTS (flow profiles) ---
+// The host queues "SEG:<duration_ms>,<rate_ml_min>" ahead of time. During a
+// dispense each segment starts when the previous one ends, timed by millis()
+// here, so USB and host scheduling jitter do not move the rate changes.
+#define SEG_CAPACITY 16
+unsigned long seg_duration[SEG_CAPACITY];
+float seg_rate[SEG_CAPACITY];
+byte seg_head = 0;
+byte seg_count = 0;
+bool seg_active = false;
+unsigned long seg_started = 0;
+unsigned long seg_current_duration = 0;
+unsigned long seg_index = 0;
+bool seg_hold = false;      // rate 0: hold position without ending the dispense
+
 // ----------------Improve stepper heating-----------------
 void set_motor_enabled(bool enabled) {
   motor_enabled = enabled;
   digitalWrite(ENABLE_PIN, enabled ? LOW : HIGH); // For most drivers: LOW=ON, HIGH=OFF
 }
 
+// Clamp a target to the software limits, and say so instead of stopping short silently
+long clamp_target(long target) {
+  long clamped = constrain(target, MIN_STEPS, MAX_STEPS);
+  if (clamped != target) {
+    Out.print("WARNING: Target clamped from "); Out.print(target);
+    Out.print(" to "); Out.println(clamped);
+  }
+  return clamped;
+}
+
 void startMove(long target) {
   moveStartTime = millis();     // reset timeout timer
   stepper.moveTo(target);       // or stepper.move(steps);
 }
 
+// Change the speed of the running dispense; rate 0 holds position
+void apply_rate(float rate) {
+  current_rate = rate;
+  if (rate <= 0) {
+    seg_hold = true;
+    return;
+  }
+  float speed_steps_per_sec = (rate / 60.0) * steps_per_ml;
+  // Ramp with the faster of the two speeds so slowing down is as quick as speeding up
+  stepper.setAcceleration(max(speed_steps_per_sec, stepper.maxSpeed()) * 2);
+  stepper.setMaxSpeed(speed_steps_per_sec);
+  seg_hold = false;
+}
+
+void clear_segments() {
+  seg_head = 0;
+  seg_count = 0;
+  seg_active = false;
+  seg_hold = false;
+  seg_index = 0;
+}
+
+// SEG:<duration_ms>,<rate_ml_min>
+void handle_segment_command(String command) {
+  int comma = command.indexOf(',');
+  if (comma <= 4) {
+    Out.println("ERROR: Invalid SEG format. Use SEG:duration_ms,rate");
+    return;
+  }
+  if (seg_count >= SEG_CAPACITY) {
+    Out.println("ERROR: Segment queue full");
+    return;
+  }
+  long duration = command.substring(4, comma).toInt();
+  float rate = command.substring(comma + 1).toFloat();
+  if (duration <= 0 || rate < 0) {
+    Out.println("ERROR: Segment needs duration > 0 and rate >= 0");
+    return;
+  }
+  if (rate / 60.0 * steps_per_ml > MAX_STEP_RATE) {
+    Out.println("ERROR: Rate exceeds the maximum step rate");
+    return;
+  }
+  byte slot = (seg_head + seg_count) % SEG_CAPACITY;
+  seg_duration[slot] = duration;
+  seg_rate[slot] = rate;
+  seg_count++;
+  Out.print("SEG_QUEUED: "); Out.println(SEG_CAPACITY - seg_count);
+}
+
+// Start the next queued segment when the current one ends (called while dispensing)
+void run_segments() {
+  unsigned long now = millis();
+  if (seg_active && now - seg_started < seg_current_duration) return;
+  if (seg_count == 0) {
+    if (seg_active) {
+      seg_active = false;
+      Out.println("SEG_UNDERRUN");   // keeps the last rate
+    }
+    return;
+  }
+  // Back to back: the next segment starts where the last one ended, not when we noticed
+  seg_started = seg_active ? seg_started + seg_current_duration : now;
+  seg_current_duration = seg_duration[seg_head];
+  apply_rate(seg_rate[seg_head]);
+  seg_head = (seg_head + 1) % SEG_CAPACITY;
+  seg_count--;
+  seg_active = true;
+  Out.print("SEG_START: "); Out.print(seg_index++); Out.print(","); Out.println(current_rate, 3);
+}
+
 
 // ----------------- SETUP -----------------
 void setup() {
@@ -101,6 +244,9 @@ void setup() {
 
   Serial.begin(115200);
 
+  bus_address = EEPROM.read(EE_ADDR_BUS);
+  if (bus_address == 255) bus_address = 0;   // erased EEPROM
+
   // Stepper configuration
   stepper.setMaxSpeed(200);       // steps/sec (tune for your hardware)
   stepper.setAcceleration(100);    // steps/sec^2
@@ -122,9 +268,9 @@ void setup() {
   
   // Startup status
   send_status();
-  Serial.println("Ready for DISPENSE:<vol_ml>,<rate_ml_per_min> or CANCEL or STATUS");
-  Serial.print("MICROSTEPPING MODE: 1/"); Serial.println(microstep);
-  Serial.print("steps_per_rev = "); Serial.println(steps_per_rev);
+  Out.println("Ready for DISPENSE:<vol_ml>,<rate_ml_per_min> or CANCEL or STATUS");
+  Out.print("MICROSTEPPING MODE: 1/"); Out.println(microstep);
+  Out.print("steps_per_rev = "); Out.println(steps_per_rev);
 }
 
 // ----------------- LOOP -----------------
@@ -132,8 +278,18 @@ void loop() {
   // --- Handle Serial commands ---
   if (Serial.available()) {
     String command = Serial.readStringUntil('\n');
+    unsigned long received_ms = millis();
     command.trim();
-    Serial.print("[COMMAND RECEIVED] >"); Serial.print(command); Serial.println("<"); // Adding this for debugging
+
+    if (!accept_bus_command(command)) command = "";   // line for another pump
+    if (command.startsWith("SYNC:")) {
+      // Clock sync: reply at once, before the echo, with the time the line arrived
+      Out.print("SYNC: "); Out.print(command.substring(5)); Out.print(","); Out.println(received_ms);
+      command = "";
+    }
+    if (command.length() > 0) {
+      Out.print("[COMMAND RECEIVED] >"); Out.print(command); Out.println("<"); // Adding this for debugging
+    }
 
     if (command.startsWith("DISPENSE:")) {
       handle_dispense_command(command);
@@ -141,17 +297,22 @@ void loop() {
       handle_cancel_command();
     } else if (command == "STATUS") {
       send_status();
+    } else if (command == "GET_CONFIG") {
+      send_config();
+    } else if (command == "GET_POS") {
+      // Lets the host resync the plunger position after a reconnect
+      Out.print("POSITION: "); Out.println(stepper.currentPosition());
     } else if (command == "TEST") {
-      Serial.println("TEST COMMAND: Move exactly 3 full revolutions");
+      Out.println("TEST COMMAND: Move exactly 3 full revolutions");
 
       long steps_to_move = 3 * steps_per_rev;    // This is 9600 for 1/16 microstep
-      Serial.print("steps_per_rev = "); Serial.println(steps_per_rev);
-      Serial.print("steps_to_move = "); Serial.println(steps_to_move);
+      Out.print("steps_per_rev = "); Out.println(steps_per_rev);
+      Out.print("steps_to_move = "); Out.println(steps_to_move);
 
       start_position = stepper.currentPosition();
       target_position = start_position + steps_to_move;
-      Serial.print("start_position = "); Serial.println(start_position);
-      Serial.print("target_position = "); Serial.println(target_position);
+      Out.print("start_position = "); Out.println(start_position);
+      Out.print("target_position = "); Out.println(target_position);
 
       set_motor_enabled(true);
       startMove(target_position);
@@ -168,28 +329,62 @@ void loop() {
       float vol = command.substring(8).toFloat();     // user sends mL remaining
       long steps = vol * steps_per_ml;
       stepper.setCurrentPosition(steps);               // now position matches real plunger
-      Serial.print("Offset set: "); Serial.print(vol); Serial.println(" mL");
+      Out.print("Offset set: "); Out.print(vol); Out.println(" mL");
       saveOffset(stepper.currentPosition());
     }
 
     else if (command == "RETRACT") {
-      long pos = stepper.currentPosition();
-      if (pos != 0) {
-        startMove(0);
-        while (stepper.distanceToGo() != 0) { stepper.run(); }
-      }
-      set_motor_enabled(false);
-      Serial.println("RETRACT_COMPLETE");
-      
+      handle_retract_command();
     }
 
     else if (command.startsWith("SET_POS:")) {
       long p = command.substring(8).toInt();
       stepper.setCurrentPosition(p);
-      Serial.print("Position set to "); Serial.println(p);
+      Out.print("Position set to "); Out.println(p);
       saveOffset(stepper.currentPosition());  // ← persist the new zero offset
     }
 
+    else if (command.startsWith("SET_ADDR:")) {
+      // Assign the bus address (do this with one pump on the link)
+      long address = command.substring(9).toInt();
+      if (address < 0 || address > 254) {
+        Out.println("ERROR: Address must be 0-254");
+      } else {
+        EEPROM.update(EE_ADDR_BUS, (byte)address);
+        bus_address = (byte)address;
+        Out.print("ADDRESS_SET: "); Out.println(bus_address);
+      }
+    }
+
+    else if (command.startsWith("SEG:")) {
+      handle_segment_command(command);
+    }
+
+    else if (command == "SEG_CLEAR") {
+      clear_segments();
+      Out.println("SEG_CLEARED");
+    }
+
+    else if (command.startsWith("SET_RATE:")) {
+      float rate = command.substring(9).toFloat();
+      if (current_status != DISPENSING) {
+        Out.println("ERROR: SET_RATE needs an active dispense");
+      } else if (rate < 0) {
+        Out.println("ERROR: Rate cannot be negative");
+      } else if (rate / 60.0 * steps_per_ml > MAX_STEP_RATE) {
+        Out.println("ERROR: Rate exceeds the maximum step rate");
+      } else {
+        apply_rate(rate);
+        Out.print("RATE_SET: "); Out.println(current_rate, 3);
+      }
+    }
+
+    else if (command.startsWith("SET_INTERVAL:")) {
+      long interval = command.substring(13).toInt();
+      status_update_interval = constrain(interval, (long)MIN_STATUS_INTERVAL, (long)MAX_STATUS_INTERVAL);
+      Out.print("INTERVAL_SET: "); Out.println(status_update_interval);
+    }
+
     else if (command.startsWith("CALIBRATE:")) {
       handle_calibrate_command(command);
     }
@@ -203,11 +398,13 @@ void loop() {
     // room for more states
   }
 
-  // --- Stepper runs always ---
-  stepper.run();
+  // --- Stepper runs always (unless a rate-0 segment holds it) ---
+  if (!seg_hold) stepper.run();
 
   // --- Dispense logic ---
   if (current_status == DISPENSING) {
+    run_segments();
+
     // Progress tracking
     long total_distance = target_position - start_position;
     long current_pos = stepper.currentPosition();
@@ -222,11 +419,13 @@ void loop() {
     stepper.stop();
     stepper.setCurrentPosition(stepper.currentPosition());
     current_status = CANCELLED;
-    Serial.println("DISPENSE_CANCELLED");
+    Out.println("DISPENSE_CANCELLED");
     progress_percent = 0.0;
     dispensed_volume = 0.0;
     send_status();
     set_motor_enabled(false); // help with heating issue
+    saveOffset(stepper.currentPosition());  // survive a reset (e.g. the host reopening the port)
+    clear_segments();
     return;
 }
 
@@ -234,36 +433,110 @@ void loop() {
     // Check for completion
     if (stepper.distanceToGo() == 0) {
       current_status = IDLE;
-      Serial.println("DISPENSE_COMPLETE");
+      Out.println("DISPENSE_COMPLETE");
       progress_percent = 100.0;
       dispensed_volume = current_volume;
       send_status();
       set_motor_enabled(false);
+      saveOffset(stepper.currentPosition());  // survive a reset (e.g. the host reopening the port)
+      clear_segments();
     }
 
-    // Send progress every STATUS_UPDATE_INTERVAL
-    if ((millis() - last_status_update) >= STATUS_UPDATE_INTERVAL) {
-      send_progress_update();
+    // Send progress every status_update_interval (detailed, so the host sees the position)
+    if ((millis() - last_status_update) >= status_update_interval) {
+      send_comprehensive_update();
       last_status_update = millis();
     }
   }
+
+  // --- Retract logic ---
+  if (current_status == RETRACTING) {
+    run_retract();
+  }
+}
+
+// --- RETRACT ---
+// Moves back to 0 without blocking loop(), so STATUS, CANCEL and telemetry keep working
+void handle_retract_command() {
+  if (current_status == DISPENSING || current_status == RETRACTING) {
+    Out.println("ERROR: Pump is moving. Send CANCEL first.");
+    return;
+  }
+  retract_start_position = stepper.currentPosition();
+  if (retract_start_position == 0) {
+    set_motor_enabled(false);
+    Out.println("RETRACT_COMPLETE");
+    return;
+  }
+  set_motor_enabled(true);
+  startMove(0);
+  current_status = RETRACTING;
+  cancel_requested = false;
+  progress_percent = 0.0;
+  dispense_start_time = millis();
+  last_status_update = 0;
+  Out.print("RETRACT_STARTED: "); Out.print(retract_start_position); Out.println("steps");
+}
+
+void run_retract() {
+  long current_pos = stepper.currentPosition();
+  if (retract_start_position != 0) {
+    progress_percent = (float)(retract_start_position - current_pos) / (float)retract_start_position * 100.0;
+  }
+
+  if (cancel_requested) {
+    stepper.stop();
+    stepper.setCurrentPosition(current_pos);
+    cancel_requested = false;
+    current_status = CANCELLED;
+    Out.println("RETRACT_CANCELLED");
+    send_status();
+    set_motor_enabled(false);
+    saveOffset(current_pos);
+    return;
+  }
+
+  if (stepper.distanceToGo() == 0) {
+    current_status = IDLE;
+    progress_percent = 100.0;
+    Out.println("RETRACT_COMPLETE");
+    send_status();
+    set_motor_enabled(false);
+    saveOffset(current_pos);
+    return;
+  }
+
+  if ((millis() - last_status_update) >= status_update_interval) {
+    // RETRACT_PROGRESS: <percent>%,<position>steps,<speed>mL/min,<millis>ms
+    float speed_ml_min = (-stepper.speed() / steps_per_ml) * 60.0;
+    Out.print("RETRACT_PROGRESS: ");
+    Out.print(progress_percent, 1);
+    Out.print("%,");
+    Out.print(current_pos);
+    Out.print("steps,");
+    Out.print(speed_ml_min, 1);
+    Out.print("mL/min,");
+    Out.print(millis());
+    Out.println("ms");
+    last_status_update = millis();
+  }
 }
 
 
 
 // --- RAPID DISPENSE ---
 void handle_rapid_dispense_command(String command) {
-  if (current_status == DISPENSING) {
-    Serial.println("ERROR: Already dispensing. Send CANCEL first.");
+  if (current_status == DISPENSING || current_status == RETRACTING) {
+    Out.println("ERROR: Already dispensing. Send CANCEL first.");
     return;
   }
   int colonIndex = command.indexOf(':');
   if (colonIndex > 0) {
     float volume = command.substring(colonIndex + 1).toFloat();
-    Serial.print("[DEBUG] Parsed rapid dispense volume: "); Serial.println(volume, 3);
+    Out.print("[DEBUG] Parsed rapid dispense volume: "); Out.println(volume, 3);
 
     if (volume <= 0) {
-      Serial.println("ERROR: Volume must be positive.");
+      Out.println("ERROR: Volume must be positive.");
       current_status = ERROR;
       send_status();
       return;
@@ -277,22 +550,21 @@ void handle_rapid_dispense_command(String command) {
     dispensed_volume = 0.0;
     dispense_start_time = millis();
 
-    Serial.print("RAPID_DISPERSE_START: ");
-    Serial.print(volume, 2);
-    Serial.println(" mL");
+    Out.print("RAPID_DISPERSE_START: ");
+    Out.print(volume, 2);
+    Out.println(" mL");
 
     long steps_to_move = volume * steps_per_ml;
-    Serial.print("[DEBUG] steps_per_ml: "); Serial.println(steps_per_ml, 3);
-    Serial.print("[DEBUG] steps_to_move: "); Serial.println(steps_to_move);
+    Out.print("[DEBUG] steps_per_ml: "); Out.println(steps_per_ml, 3);
+    Out.print("[DEBUG] steps_to_move: "); Out.println(steps_to_move);
 
     start_position = stepper.currentPosition();
     long next_target = start_position + steps_to_move;
-    if (next_target > MAX_STEPS) next_target = MAX_STEPS;
-    if (next_target < MIN_STEPS) next_target = MIN_STEPS;
+    next_target = clamp_target(next_target);
     target_position = next_target;
 
-    Serial.print("[DEBUG] start_position: "); Serial.println(start_position);
-    Serial.print("[DEBUG] next_target: "); Serial.println(next_target);
+    Out.print("[DEBUG] start_position: "); Out.println(start_position);
+    Out.print("[DEBUG] next_target: "); Out.println(next_target);
 
     float max_speed = 2000; // steps/sec (adjust as needed)
     float max_accel = 4000; // steps/sec^2
@@ -302,13 +574,13 @@ void handle_rapid_dispense_command(String command) {
     startMove(next_target); 
     
 
-    Serial.print("[DEBUG] stepper max speed: "); Serial.println(max_speed);
-    Serial.print("[DEBUG] stepper accel: "); Serial.println(max_accel);
-    Serial.print("[DEBUG] current_status: "); Serial.println(current_status == DISPENSING ? "DISPENSING" : "NOT DISPENSING");
+    Out.print("[DEBUG] stepper max speed: "); Out.println(max_speed);
+    Out.print("[DEBUG] stepper accel: "); Out.println(max_accel);
+    Out.print("[DEBUG] current_status: "); Out.println(current_status == DISPENSING ? "DISPENSING" : "NOT DISPENSING");
 
     send_status();
   } else {
-    Serial.println("ERROR: Invalid RAPID_DISPERSE format. Use RAPID_DISPERSE:<vol_ml>");
+    Out.println("ERROR: Invalid RAPID_DISPERSE format. Use RAPID_DISPERSE:<vol_ml>");
     current_status = ERROR;
     send_status();
   }
@@ -319,7 +591,11 @@ void handle_rapid_dispense_command(String command) {
 // --- DISPENSE ---
 void handle_dispense_command(String command) {
   if (current_status == DISPENSING) {
-    Serial.println("ERROR: Already dispensing. Send CANCEL first.");
+    Out.println("ERROR: Already dispensing. Send CANCEL first.");
+    return;
+  }
+  if (current_status == RETRACTING) {
+    Out.println("ERROR: Retracting. Send CANCEL first.");
     return;
   }
 
@@ -329,7 +605,13 @@ void handle_dispense_command(String command) {
     float rate = command.substring(commaIndex + 1).toFloat();
 
     if (volume <= 0 || rate <= 0) {
-      Serial.println("ERROR: Volume and rate must be positive");
+      Out.println("ERROR: Volume and rate must be positive");
+      current_status = ERROR;
+      send_status();
+      return;
+    }
+    if (rate / 60.0 * steps_per_ml > MAX_STEP_RATE) {
+      Out.println("ERROR: Rate exceeds the maximum step rate");
       current_status = ERROR;
       send_status();
       return;
@@ -351,22 +633,22 @@ void handle_dispense_command(String command) {
     set_motor_enabled(true);              // enable first
 
     // Debug prints (NOW the variables are defined!)
-    Serial.print("steps_to_move = "); Serial.println(steps_to_move);
-    Serial.print("speed_steps_per_sec = "); Serial.println(speed_steps_per_sec, 3);
+    Out.print("steps_to_move = "); Out.println(steps_to_move);
+    Out.print("speed_steps_per_sec = "); Out.println(speed_steps_per_sec, 3);
 
     // Clamp to max steps allowed
     start_position = stepper.currentPosition();
     long next_target = start_position + steps_to_move;
-    if (next_target > MAX_STEPS) next_target = MAX_STEPS;
-    if (next_target < MIN_STEPS) next_target = MIN_STEPS;
+    next_target = clamp_target(next_target);
     target_position = next_target;
     startMove(next_target);
+    run_segments();   // a queued flow profile takes over the rate right away
 
 
     send_status();
 
   } else {
-    Serial.println("ERROR: Invalid DISPENSE format. Use DISPENSE:volume,rate");
+    Out.println("ERROR: Invalid DISPENSE format. Use DISPENSE:volume,rate");
     current_status = ERROR;
     send_status();
   }
@@ -377,42 +659,64 @@ void handle_dispense_command(String command) {
 
 // --- CANCEL ---
 void handle_cancel_command() {
-  if (current_status == DISPENSING) {
+  if (current_status == DISPENSING || current_status == RETRACTING) {
     cancel_requested = true;
-    Serial.println("CANCEL_REQUESTED");
+    Out.println("CANCEL_REQUESTED");
   } else {
-    Serial.println("INFO: No active dispensing to cancel");
+    Out.println("INFO: No active dispensing to cancel");
   }
 }
 
+// --- Device profile for the host (GET_CONFIG) ---
+// CONFIG: key=value,... so the host can check and convert commands before sending them
+void send_config() {
+  Out.print("CONFIG: version="); Out.print(FIRMWARE_VERSION);
+  Out.print(",steps_per_ml="); Out.print(steps_per_ml, 3);
+  Out.print(",microstep="); Out.print(microstep);
+  Out.print(",steps_per_rev="); Out.print(steps_per_rev, 0);
+  Out.print(",min_steps="); Out.print(MIN_STEPS);
+  Out.print(",max_steps="); Out.print(MAX_STEPS);
+  Out.print(",max_step_rate="); Out.print(MAX_STEP_RATE, 0);
+  Out.print(",seg_capacity="); Out.print(SEG_CAPACITY);
+  Out.print(",min_interval="); Out.print(MIN_STATUS_INTERVAL);
+  Out.print(",max_interval="); Out.print(MAX_STATUS_INTERVAL);
+  Out.print(",address="); Out.println(bus_address);
+}
+
 // --- Simple status/progress output ---
 void send_status() {
-  Serial.print("STATUS: ");
+  Out.print("STATUS: ");
   switch (current_status) {
     case IDLE:
-      Serial.println("IDLE");
+      Out.println("IDLE");
       break;
     case DISPENSING:
-      Serial.print("DISPENSING - ");
-      Serial.print(current_volume);
-      Serial.print("mL @ ");
-      Serial.print(current_rate);
-      Serial.print("mL/min - ");
-      Serial.print(progress_percent, 1);
-      Serial.println("%");
+      Out.print("DISPENSING - ");
+      Out.print(current_volume);
+      Out.print("mL @ ");
+      Out.print(current_rate);
+      Out.print("mL/min - ");
+      Out.print(progress_percent, 1);
+      Out.println("%");
       break;
     case CANCELLED:
-      Serial.println("CANCELLED");
+      Out.println("CANCELLED");
       break;
     case ERROR:
-      Serial.println("ERROR");
+      Out.println("ERROR");
+      break;
+    case RETRACTING:
+      Out.print("RETRACTING - ");
+      Out.print(progress_percent, 1);
+      Out.println("%");
       break;
   }
 }
 
 // --- PROGRESS/DETAILS ---
 void send_comprehensive_update() {
-  unsigned long elapsed_time = millis() - dispense_start_time;
+  unsigned long sample_ms = millis();   // lets the host place the sample on its own clock
+  unsigned long elapsed_time = sample_ms - dispense_start_time;
   float elapsed_minutes = elapsed_time / 60000.0;
   float remaining_volume = current_volume - dispensed_volume;
   float estimated_remaining_time = 0;
@@ -424,35 +728,37 @@ void send_comprehensive_update() {
   float current_speed = stepper.speed(); // steps per second
   float current_speed_ml_min = (current_speed / steps_per_ml) * 60.0;
 
-  Serial.print("PROGRESS_DETAILED: ");
-  Serial.print(progress_percent, 1);
-  Serial.print("%,");
-  Serial.print(dispensed_volume, 2);
-  Serial.print("mL,");
-  Serial.print(remaining_volume, 2);
-  Serial.print("mL,");
-  Serial.print(elapsed_minutes, 1);
-  Serial.print("min,");
-  Serial.print(estimated_remaining_time, 1);
-  Serial.print("min,");
-  Serial.print(current_speed_ml_min, 1);
-  Serial.print("mL/min,");
-  Serial.print(stepper.currentPosition());
-  Serial.print("steps,");
-  Serial.print(stepper.distanceToGo());
-  Serial.println("steps_remaining");
+  Out.print("PROGRESS_DETAILED: ");
+  Out.print(progress_percent, 1);
+  Out.print("%,");
+  Out.print(dispensed_volume, 2);
+  Out.print("mL,");
+  Out.print(remaining_volume, 2);
+  Out.print("mL,");
+  Out.print(elapsed_minutes, 1);
+  Out.print("min,");
+  Out.print(estimated_remaining_time, 1);
+  Out.print("min,");
+  Out.print(current_speed_ml_min, 1);
+  Out.print("mL/min,");
+  Out.print(stepper.currentPosition());
+  Out.print("steps,");
+  Out.print(stepper.distanceToGo());
+  Out.print("steps_remaining,");
+  Out.print(sample_ms);
+  Out.println("ms");
 
   send_progress_update();
 }
 
 void send_progress_update() {
-  Serial.print("PROGRESS: ");
-  Serial.print(progress_percent, 1);
-  Serial.print("% - ");
-  Serial.print(dispensed_volume, 2);
-  Serial.print("/");
-  Serial.print(current_volume);
-  Serial.println("mL");
+  Out.print("PROGRESS: ");
+  Out.print(progress_percent, 1);
+  Out.print("% - ");
+  Out.print(dispensed_volume, 2);
+  Out.print("/");
+  Out.print(current_volume);
+  Out.println("mL");
 }
 
 
@@ -460,27 +766,27 @@ void send_progress_update() {
 // --- CALIBRATION HANDLERS ---
 void handle_calibrate_command(String command) {
   if (calib_in_progress) {
-    Serial.println("ERROR: Calibration already in progress!");
+    Out.println("ERROR: Calibration already in progress!");
     return;
   }
 
   int colonIndex = command.indexOf(':');
   if (colonIndex <= 0) {
-    Serial.println("ERROR: Invalid CALIBRATE format. Use CALIBRATE:<vol_ml>");
+    Out.println("ERROR: Invalid CALIBRATE format. Use CALIBRATE:<vol_ml>");
     return;
   }
 
   // 1) Parse and validate volume
   calib_target_vol = command.substring(colonIndex + 1).toFloat();
   if (calib_target_vol <= 0) {
-    Serial.println("ERROR: Calibration volume must be positive");
+    Out.println("ERROR: Calibration volume must be positive");
     return;
   }
 
   // 2) Notify user
-  Serial.print("CALIBRATION: Dispensing ");
-  Serial.print(calib_target_vol, 3);
-  Serial.println(" mL. Please prepare your scale.");
+  Out.print("CALIBRATION: Dispensing ");
+  Out.print(calib_target_vol, 3);
+  Out.println(" mL. Please prepare your scale.");
 
   // 3) Mark calibration in progress
   calib_in_progress      = true;
@@ -518,26 +824,26 @@ void handle_calibrate_command(String command) {
 
 void handle_actual_mass_command(String command) {
   if (!calib_in_progress || !calib_waiting_for_mass) {
-    Serial.println("ERROR: No calibration awaiting mass input.");
+    Out.println("ERROR: No calibration awaiting mass input.");
     return;
   }
   int colonIndex = command.indexOf(':');
   if (colonIndex > 0) {
     float actual_grams = command.substring(colonIndex + 1).toFloat();
     if (actual_grams <= 0) {
-      Serial.println("ERROR: Mass must be positive.");
+      Out.println("ERROR: Mass must be positive.");
       return;
     }
     calib_end_pos = stepper.currentPosition();
     long steps_moved = abs(calib_end_pos - calib_start_pos);
     float new_steps_per_ml = steps_moved / actual_grams; // 1g = 1mL for water
 
-    Serial.print("Measured steps moved: "); Serial.println(steps_moved);
-    Serial.print("Measured actual mass (g): "); Serial.println(actual_grams, 3);
+    Out.print("Measured steps moved: "); Out.println(steps_moved);
+    Out.print("Measured actual mass (g): "); Out.println(actual_grams, 3);
 
-    Serial.print("CALIBRATION COMPLETE: steps_per_ml = ");
-    Serial.println(new_steps_per_ml, 5);
-    Serial.println("You can now update steps_per_ml in your code.");
+    Out.print("CALIBRATION COMPLETE: steps_per_ml = ");
+    Out.println(new_steps_per_ml, 5);
+    Out.println("You can now update steps_per_ml in your code.");
     saveCalibration(new_steps_per_ml);
     saveOffset(stepper.currentPosition());
     calib_in_progress = false;
@@ -545,7 +851,7 @@ void handle_actual_mass_command(String command) {
     current_status = IDLE;         // (optional)
     set_motor_enabled(false);      // (optional)
   } else {
-    Serial.println("ERROR: Invalid ACTUAL_MASS format. Use ACTUAL_MASS:<grams>");
+    Out.println("ERROR: Invalid ACTUAL_MASS format. Use ACTUAL_MASS:<grams>");
   }
 }
 
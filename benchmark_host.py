@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Host Pipeline Benchmarks
+=======================================================
+
+This script benchmarks the host side of the manager against simulated
+pumps (see pump_simulator.py) at several fleet sizes, and compares the
+results with a stored JSON baseline.
+
+Metrics:
+- parse_lines_per_s: handle_arduino_message throughput
+- drain_ms_per_100_lines: cost of draining the message queue
+- apply_us_per_sample: cost of applying one progress sample to the GUI
+- connect_ms_per_pump: time to connect a pump window
+- round_trip_ms: STATUS command to STATUS reply, median over pumps
+- telemetry_lines_per_s: lines received from the fleet while every pump dispenses
+- interlock_us_per_sample: interlock check of one progress sample (see interlock.py)
+
+With --pumps-per-link N the pumps share simulated links N at a time
+("SIM1@1".."SIM1@N", see pump_multiplexer.py) instead of one port each.
+
+Each fleet logs to a temporary directory with the metrics endpoint and
+trigger input off, so benchmark dispenses never reach the lab's log store
+or dispense ledger.
+
+Usage:
+    python benchmark_host.py                  # run and compare with the baseline
+    python benchmark_host.py --save-baseline  # run and store a new baseline
+    python benchmark_host.py --pumps 1 10     # only some fleet sizes
+    python benchmark_host.py --pumps 8 --pumps-per-link 8   # one shared link
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tkinter as tk
+
+from pump_manager import PumpManager
+from interlock import parse_rule
+
+FLEET_SIZES = (1, 10, 100)
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Allowed relative change before a metric counts as a regression
+DEFAULT_THRESHOLD = 0.25
+
+# Metric name -> True when higher is better
+METRICS = {
+    'parse_lines_per_s': True,
+    'drain_ms_per_100_lines': False,
+    'apply_us_per_sample': False,
+    'connect_ms_per_pump': False,
+    'round_trip_ms': False,
+    'telemetry_lines_per_s': True,
+    'interlock_us_per_sample': False,
+}
+
+SAMPLE_LINES = (
+    "PROGRESS_DETAILED: 42.0%,2.10mL,2.90mL,0.2min,0.3min,10.0mL/min,13440steps,18560steps_remaining,123456ms",
+    "PROGRESS: 42.0% - 2.10/5.00mL",
+    "STATUS: DISPENSING - 5.00mL @ 10.00mL/min - 42.0%",
+)
+
+PARSE_LINES_TOTAL = 3000
+ROUND_TRIP_TIMEOUT = 2.0
+TELEMETRY_SECONDS = 2.0
+INTERLOCK_SAMPLES_TOTAL = 20000
+
+# A fleet-wide flow cap and vessel limit that never trip, plus a per-pump reserve
+INTERLOCK_RULES = ("total_flow() <= 1000000", "vessel() <= 1000000", "reserve() >= 0")
+
+
+class HostBenchmark:
+    """
+    One fleet of simulated pumps inside a fresh manager.
+    """
+
+    def __init__(self, pump_count, pumps_per_link=1):
+        """
+        Create the manager and its pump windows.
+
+        Args:
+            pump_count: Number of simulated pumps
+            pumps_per_link: Pumps sharing each simulated link (1 = own port)
+        """
+        self.root = tk.Tk()
+        self.root.withdraw()
+        # Benchmark dispenses stay out of the lab's log store and ledger
+        self.log_dir = tempfile.mkdtemp(prefix="pump_bench_")
+        self.manager = PumpManager(self.root, log_dir=self.log_dir, listeners=False)
+        self.pumps = []
+        for i in range(pump_count):
+            pump = self.manager.add_pump(f"Bench {i + 1}")
+            if pumps_per_link > 1:
+                pump.port_var.set(f"SIM{i // pumps_per_link + 1}@{i % pumps_per_link + 1}")
+            else:
+                pump.port_var.set(f"SIM{i + 1}")
+            pump.window.withdraw()
+            self.pumps.append(pump)
+        self.root.update()
+
+    def close(self):
+        """Disconnect every pump, destroy the manager and remove its logs"""
+        self.manager.on_closing()
+        shutil.rmtree(self.log_dir, ignore_errors=True)
+
+    def connect(self):
+        """Connect every pump; returns ms per pump"""
+        start = time.perf_counter()
+        for pump in self.pumps:
+            pump.connect_to_arduino()
+        return (time.perf_counter() - start) * 1000 / len(self.pumps)
+
+    def parse(self):
+        """Feed telemetry straight into handle_arduino_message; returns lines/s"""
+        per_pump = max(len(SAMPLE_LINES), PARSE_LINES_TOTAL // len(self.pumps))
+        start = time.perf_counter()
+        for pump in self.pumps:
+            for i in range(per_pump):
+                pump.handle_arduino_message(SAMPLE_LINES[i % len(SAMPLE_LINES)])
+        elapsed = time.perf_counter() - start
+        return per_pump * len(self.pumps) / elapsed
+
+    def drain(self):
+        """Queue 100 lines per pump and drain them; returns ms per 100 lines"""
+        for pump in self.pumps:
+            for i in range(100):
+                pump.message_queue.put(SAMPLE_LINES[i % len(SAMPLE_LINES)])
+        start = time.perf_counter()
+        for pump in self.pumps:
+            pump.drain_messages()
+        # Log records are written by the pipeline thread; wait for them, then time the view
+        time.sleep(0.1)
+        for pump in self.pumps:
+            pump.log_view.update_widget()
+        return (time.perf_counter() - start - 0.1) * 1000 / len(self.pumps)
+
+    def apply(self):
+        """Apply progress samples to the display; returns microseconds per sample"""
+        samples = max(100, 1000 // len(self.pumps))
+        start = time.perf_counter()
+        for i in range(samples):
+            for pump in self.pumps:
+                pump.show_progress(i % 100, 0.05 * i, 5.0, 0.1, 0.2, 10.0, 1000 + i)
+            self.root.update_idletasks()
+        return (time.perf_counter() - start) * 1e6 / (samples * len(self.pumps))
+
+    def round_trip(self):
+        """STATUS to STATUS reply for each pump; returns the median in ms"""
+        times = []
+        for pump in self.pumps:
+            replied = threading.Event()
+            reply_time = []
+
+            def on_line(message, received_at):
+                if message.startswith("STATUS:") and not replied.is_set():
+                    reply_time.append(received_at)
+                    replied.set()
+
+            pump.add_line_listener(on_line)
+            sent_at = time.perf_counter()
+            pump.send_command("STATUS")
+            replied.wait(ROUND_TRIP_TIMEOUT)
+            pump.remove_line_listener(on_line)
+            if reply_time:
+                times.append((reply_time[0] - sent_at) * 1000)
+        return statistics.median(times) if times else float("inf")
+
+    def telemetry(self):
+        """Dispense on every pump; returns lines received per second"""
+        counts = [0]
+        lock = threading.Lock()
+
+        def on_line(message, received_at):
+            with lock:
+                counts[0] += 1
+
+        for pump in self.pumps:
+            pump.add_line_listener(on_line)
+            pump.send_command("DISPENSE:100,10")
+        time.sleep(TELEMETRY_SECONDS)
+        for pump in self.pumps:
+            pump.remove_line_listener(on_line)
+            pump.send_command("CANCEL")
+        time.sleep(0.1)
+        for pump in self.pumps:
+            pump.drain_messages()
+        return counts[0] / TELEMETRY_SECONDS
+
+    def interlock(self):
+        """Check progress samples against fleet-wide rules; returns microseconds per sample"""
+        interlocks = self.manager.interlocks
+        interlocks.set_rules(parse_rule(text) for text in INTERLOCK_RULES)
+        slots = [interlocks.slots[pump.pump_id] for pump in self.pumps]
+        for slot in slots:
+            interlocks.on_line(slot, "steps_to_move = 32000", time.perf_counter())
+        per_pump = max(1, INTERLOCK_SAMPLES_TOTAL // len(self.pumps))
+        start = time.perf_counter()
+        for i in range(per_pump):
+            for slot in slots:
+                interlocks.on_line(slot, SAMPLE_LINES[0], start)
+        elapsed = time.perf_counter() - start
+        for slot in slots:
+            interlocks.on_line(slot, "DISPENSE_CANCELLED", start)
+        interlocks.set_rules(())
+        return elapsed * 1e6 / (per_pump * len(self.pumps))
+
+    def run(self):
+        """Run every benchmark; returns {metric: value}"""
+        results = {'connect_ms_per_pump': self.connect()}
+        # Let the boot banners arrive so they do not pollute the round trips
+        time.sleep(0.2)
+        for pump in self.pumps:
+            pump.drain_messages()
+        results['parse_lines_per_s'] = self.parse()
+        results['drain_ms_per_100_lines'] = self.drain()
+        results['apply_us_per_sample'] = self.apply()
+        results['round_trip_ms'] = self.round_trip()
+        results['telemetry_lines_per_s'] = self.telemetry()
+        results['interlock_us_per_sample'] = self.interlock()
+        return results
+
+
+def run_benchmarks(fleet_sizes, pumps_per_link=1):
+    """
+    Run the suite at each fleet size.
+
+    Returns:
+        {key: {metric: value}}, keyed "10" or "10@8" (8 pumps per link)
+    """
+    results = {}
+    for size in fleet_sizes:
+        key = f"{size}@{pumps_per_link}" if pumps_per_link > 1 else str(size)
+        bench = HostBenchmark(size, pumps_per_link)
+        try:
+            results[key] = bench.run()
+        finally:
+            bench.close()
+        print(f"{key:>6} pumps: " + ", ".join(
+            f"{name}={value:.2f}" for name, value in results[key].items()))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline.
+
+    Returns:
+        List of regression descriptions (empty if none)
+    """
+    regressions = []
+    for size, metrics in results.items():
+        for name, value in metrics.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if METRICS[name]:
+                regressed = value < base * (1 - threshold)
+            else:
+                regressed = value > base * (1 + threshold)
+            if regressed:
+                regressions.append(f"{name} @ {size} pumps: {value:.2f} (baseline {base:.2f})")
+    return regressions
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the pump manager host pipeline")
+    parser.add_argument("--pumps", type=int, nargs="+", default=list(FLEET_SIZES),
+                        help="fleet sizes to run")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative regression (default 0.25)")
+    parser.add_argument("--pumps-per-link", type=int, default=1,
+                        help="pumps sharing each simulated serial link (default 1)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.pumps, args.pumps_per_link)
+
+    if args.save_baseline:
+        # Keep the stored results of fleet sizes this run did not cover
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                saved = json.load(f)['results']
+        saved.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(),
+                       'results': saved}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Campaign Window Module
+=====================================================
+
+This module contains the CampaignWindow class which plans a sequence of
+dispenses on one pump against its syringe (SyringeModel.plan_campaign):
+which dispenses need a refill first and when each one starts. Nothing is
+sent to the pump.
+
+Features:
+- One dispense per line: "<volume mL>, <rate mL/min>[, <repeat>]"
+- Refill points from the current plunger position
+- Total volume, dispensing time and number of refills
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+
+def parse_campaign(text):
+    """
+    Parse campaign lines ("#" starts a comment).
+
+    Args:
+        text: One "<volume>, <rate>[, <repeat>]" per line
+
+    Returns:
+        List of (volume mL, rate mL/min), repeats expanded
+
+    Raises:
+        ValueError: A line is malformed; the message names it
+    """
+    dispenses = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        fields = [field.strip() for field in line.split(",")]
+        try:
+            if len(fields) not in (2, 3):
+                raise ValueError("expected volume, rate[, repeat]")
+            volume, rate = float(fields[0]), float(fields[1])
+            repeat = int(fields[2]) if len(fields) == 3 else 1
+            if volume <= 0 or rate <= 0 or repeat < 1:
+                raise ValueError("volume, rate and repeat must be positive")
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}")
+        dispenses.extend([(volume, rate)] * repeat)
+    return dispenses
+
+
+class CampaignWindow:
+    """
+    Refill planner for a sequence of dispenses on one pump.
+    """
+
+    def __init__(self, pump):
+        """
+        Initialize the campaign window.
+
+        Args:
+            pump: PumpWindow whose syringe and device profile are used
+        """
+        self.pump = pump
+        self.create_window()
+
+    def create_window(self):
+        """Create the campaign window"""
+        self.window = tk.Toplevel()
+        self.window.title(f"Campaign Plan - {self.pump.name}")
+        self.window.geometry("520x480")
+
+        main_frame = ttk.Frame(self.window, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        input_frame = ttk.LabelFrame(main_frame, text="Dispenses (volume mL, rate mL/min[, repeat])",
+                                     padding=10)
+        input_frame.pack(fill="x")
+        self.input_text = tk.Text(input_frame, height=6, width=50)
+        self.input_text.pack(fill="x")
+        self.input_text.insert("1.0", f"{self.pump.volume_var.get()}, {self.pump.rate_var.get()}\n")
+        ttk.Button(input_frame, text="Plan", command=self.plan).pack(anchor="e", pady=(5, 0))
+
+        columns = ("#", "Volume (mL)", "Rate (mL/min)", "Starts at (min)", "Refill first")
+        self.plan_tree = ttk.Treeview(main_frame, columns=columns, show="headings")
+        for column, width in zip(columns, (40, 90, 100, 110, 80)):
+            self.plan_tree.heading(column, text=column)
+            self.plan_tree.column(column, width=width)
+        self.plan_tree.pack(fill="both", expand=True, pady=10)
+
+        self.summary_var = tk.StringVar(value="")
+        ttk.Label(main_frame, textvariable=self.summary_var, justify="left",
+                  wraplength=480).pack(anchor="w")
+
+    def plan(self):
+        """Plan the dispenses entered and show where the refills fall"""
+        syringe = self.pump.syringe
+        try:
+            dispenses = parse_campaign(self.input_text.get("1.0", "end"))
+            for volume, rate in dispenses:
+                self.pump.profile.check_dispense(volume, rate)
+            plan = syringe.plan_campaign(dispenses)
+        except ValueError as e:
+            messagebox.showerror("Invalid Campaign", str(e))
+            return
+
+        self.plan_tree.delete(*self.plan_tree.get_children())
+        for number, ((volume, rate), step) in enumerate(zip(dispenses, plan), 1):
+            self.plan_tree.insert("", "end", values=(
+                number, f"{volume:g}", f"{rate:g}", f"{step['start_minute']:.1f}",
+                "Yes" if step['refill_before'] else ""))
+
+        total_volume = sum(volume for volume, _ in dispenses)
+        total_minutes = sum(volume / rate for volume, rate in dispenses)
+        refills = sum(1 for step in plan if step['refill_before'])
+        lines = [f"{len(dispenses)} dispense(s), {total_volume:.3f} mL over "
+                 f"{total_minutes:.1f} min of dispensing, {refills} refill(s)"]
+        if not syringe.is_known:
+            lines.append("Plunger position unknown: planned from a freshly refilled syringe")
+        self.summary_var.set("\n".join(lines))
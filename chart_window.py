@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Chart Window Module
+==================================================
+
+This module contains the FleetChartWindow class which overlays the flow
+rate and delivered volume of every open pump on two strip charts (see
+strip_chart.py).
+
+Features:
+- One line per pump, added and removed as pumps open and close
+- Legend with the pump names
+- 1 min to 8 h spans, history kept while switching
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+from strip_chart import StripChart, SPAN_LABELS, DEFAULT_SPAN
+
+UPDATE_INTERVAL_MS = 250
+
+
+class FleetChartWindow:
+    """
+    Flow and volume of all pumps on shared charts.
+    """
+
+    def __init__(self, pump_windows):
+        """
+        Initialize the chart window.
+
+        Args:
+            pump_windows: The manager's dict of pump_id -> PumpWindow (read live)
+        """
+        self.pump_windows = pump_windows
+        self.legend = {}
+        self.create_window()
+        self.update_charts()
+
+    def create_window(self):
+        """Create the chart window"""
+        self.window = tk.Toplevel()
+        self.window.title("Fleet Charts")
+        self.window.geometry("500x330")
+
+        main_frame = ttk.Frame(self.window, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        span_frame = ttk.Frame(main_frame)
+        span_frame.pack(fill="x")
+        ttk.Label(span_frame, text="Span:").pack(side="left")
+        self.span_var = tk.StringVar(value=DEFAULT_SPAN)
+        span_combo = ttk.Combobox(span_frame, textvariable=self.span_var, values=SPAN_LABELS,
+                                  state="readonly", width=8)
+        span_combo.pack(side="left", padx=5)
+        span_combo.bind("<<ComboboxSelected>>", self.set_span)
+        ttk.Button(span_frame, text="Clear", command=self.clear).pack(side="right")
+
+        self.flow_chart = StripChart(main_frame, "Flow (mL/min)")
+        self.flow_chart.canvas.pack(anchor="w", pady=(5, 0))
+        self.volume_chart = StripChart(main_frame, "Delivered (mL)")
+        self.volume_chart.canvas.pack(anchor="w", pady=(5, 0))
+
+        self.legend_frame = ttk.Frame(main_frame)
+        self.legend_frame.pack(fill="x", pady=(5, 0))
+
+    def update_charts(self):
+        """Sample every pump, and follow pumps being opened, closed or renamed"""
+        if not self.window.winfo_exists():
+            return
+
+        pumps = dict(self.pump_windows)
+        for pump_id in list(self.legend):
+            if pump_id not in pumps:
+                self.flow_chart.remove_series(pump_id)
+                self.volume_chart.remove_series(pump_id)
+                self.legend.pop(pump_id)[1].destroy()
+        flows = {}
+        volumes = {}
+        for pump_id, pump in pumps.items():
+            if pump_id not in self.legend:
+                self.add_pump(pump_id, pump)
+            name, label = self.legend[pump_id]
+            if name != pump.name:
+                label.config(text=pump.name)
+                self.legend[pump_id] = (pump.name, label)
+            flows[pump_id], volumes[pump_id] = pump.chart_values()
+        self.flow_chart.add(flows)
+        self.volume_chart.add(volumes)
+
+        self.window.after(UPDATE_INTERVAL_MS, self.update_charts)
+
+    def add_pump(self, pump_id, pump):
+        """Add a line for a pump to both charts and the legend"""
+        self.flow_chart.add_series(pump_id)
+        color = self.flow_chart.series[pump_id].color
+        self.volume_chart.add_series(pump_id, color)
+        label = tk.Label(self.legend_frame, text=pump.name, foreground=color)
+        label.pack(side="left", padx=(0, 10))
+        self.legend[pump_id] = (pump.name, label)
+
+    def set_span(self, event=None):
+        for chart in (self.flow_chart, self.volume_chart):
+            chart.set_span(self.span_var.get())
+
+    def clear(self):
+        for chart in (self.flow_chart, self.volume_chart):
+            chart.clear()
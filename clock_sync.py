@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Clock Sync Module
+================================================
+
+This module contains the ClockSync class which maps an Arduino's millis()
+timestamps onto the host's time.perf_counter() timeline.
+
+Telemetry used to be stamped with the time the host read the line, which
+includes USB buffering and the reader thread's idle sleep, so samples from
+different pumps could not be lined up closely. The firmware now stamps
+PROGRESS_DETAILED with millis() and answers SYNC:<token> with
+"SYNC: <token>,<millis>". Each exchange gives the device-host offset at
+the middle of the round trip, good to half the round-trip time. As in NTP,
+the exchanges with the shortest round trips are trusted most: a line is
+fitted through the exchanges, weighted by their round trip, which also
+follows the drift of the Arduino's resonator (up to a few thousand ppm).
+
+Features:
+- Offset and drift estimated continuously from SYNC round trips
+- Minimum-delay filtering of exchanges
+- millis() wraparound and device reset handling
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import collections
+import itertools
+import threading
+
+# Exchanges kept for the estimate
+SYNC_WINDOW = 32
+
+# Drift is only fitted once the trusted exchanges span this long (seconds)
+MIN_DRIFT_SPAN = 5.0
+
+# millis() is an unsigned long: wraps after ~49.7 days
+MILLIS_WRAP = 2 ** 32
+
+# A jump backwards larger than this (ms) is a reset, not reordering
+RESET_JUMP_MS = 1000
+
+# Exchanges are weighted by 1 / (round trip + this)^2 (seconds)
+RTT_FLOOR = 0.0002
+
+
+class ClockSync:
+    """
+    Offset and drift of one Arduino's clock relative to the host.
+    """
+
+    def __init__(self, window=SYNC_WINDOW):
+        """
+        Initialize the estimator.
+
+        Args:
+            window: Number of recent exchanges to estimate from
+        """
+        self.window = window
+        self.lock = threading.Lock()
+        self.tokens = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        """Forget every exchange (new connection or the Arduino restarted)"""
+        with self.lock:
+            self.pending = {}
+            self.samples = collections.deque(maxlen=self.window)
+            self.exchanges = 0
+            self.offset = None      # device - host at reference (s)
+            self.drift = 0.0        # change of offset per host second
+            self.reference = 0.0
+            self.error = None       # estimated uncertainty (s)
+            self.last_raw = None
+            self.wraps = 0
+
+    @property
+    def synced(self):
+        return self.offset is not None
+
+    def request(self):
+        """Next SYNC command line"""
+        return f"SYNC:{next(self.tokens)}"
+
+    def written(self, command, written_at):
+        """
+        Note when a SYNC line actually left the host.
+
+        Args:
+            command: Line written (anything but SYNC is ignored)
+            written_at: perf_counter time of the write
+        """
+        if command.startswith("SYNC:"):
+            with self.lock:
+                self.pending[int(command[5:])] = written_at
+                # A pump that never answers must not grow the table
+                if len(self.pending) > self.window:
+                    del self.pending[min(self.pending)]
+
+    def handle_reply(self, message, received_at):
+        """
+        Line listener: take a "SYNC: <token>,<millis>" reply.
+
+        Args:
+            message: Received line (anything but a SYNC reply is ignored)
+            received_at: perf_counter time the line was read
+        """
+        if not message.startswith("SYNC: "):
+            return
+        token, _, device_ms = message[6:].partition(",")
+        try:
+            token = int(token)
+            device_ms = int(device_ms)
+        except ValueError:
+            return
+        with self.lock:
+            written_at = self.pending.pop(token, None)
+            # Replies come back in order, so the requests before this one were lost
+            for lost in [t for t in self.pending if t < token]:
+                del self.pending[lost]
+        if written_at is not None:
+            self.add_exchange(written_at, device_ms, received_at)
+
+    def add_exchange(self, written_at, device_ms, received_at):
+        """
+        Add one round trip and update the estimate.
+
+        Args:
+            written_at: Host time the request was written (s)
+            device_ms: millis() in the reply
+            received_at: Host time the reply was read (s)
+        """
+        with self.lock:
+            device = self._device_seconds(device_ms)
+            middle = (written_at + received_at) / 2
+            self.samples.append((middle, device - middle, received_at - written_at))
+            self.exchanges += 1
+            self._fit()
+
+    def to_host(self, device_ms):
+        """
+        Host perf_counter time of a device millis() timestamp.
+
+        Returns:
+            Seconds on the host timeline, or None before the first exchange
+            and for stamps from before the Arduino last restarted
+        """
+        with self.lock:
+            if self.offset is None:
+                return None
+            wraps = self.wraps
+            if self.last_raw - device_ms > MILLIS_WRAP // 2:
+                wraps += 1
+            elif self.last_raw - device_ms > RESET_JUMP_MS:
+                return None
+            device = (device_ms + wraps * MILLIS_WRAP + 0.5) / 1000.0
+            # device = host + offset + drift * (host - reference)
+            return (device - self.offset + self.drift * self.reference) / (1.0 + self.drift)
+
+    def _device_seconds(self, device_ms):
+        """Unwrapped device time of a SYNC reply in seconds (lock held)"""
+        last = self.last_raw
+        if last is not None and last - device_ms > MILLIS_WRAP // 2:
+            self.wraps += 1
+        elif last is not None and last - device_ms > RESET_JUMP_MS:
+            # The Arduino restarted: earlier exchanges are meaningless
+            self.samples.clear()
+            self.offset = None
+            self.drift = 0.0
+            self.wraps = 0
+        self.last_raw = device_ms
+        # millis() truncates: the true time is on average half a tick later
+        return (device_ms + self.wraps * MILLIS_WRAP + 0.5) / 1000.0
+
+    def _fit(self):
+        """Weighted line fit of offset against host time (lock held)"""
+        weights = [1.0 / (rtt + RTT_FLOOR) ** 2 for _, _, rtt in self.samples]
+        total = sum(weights)
+        self.reference = sum(w * t for w, (t, _, _) in zip(weights, self.samples)) / total
+        mean_offset = sum(w * o for w, (_, o, _) in zip(weights, self.samples)) / total
+
+        times = [t for t, _, _ in self.samples]
+        if len(times) >= 3 and max(times) - min(times) >= MIN_DRIFT_SPAN:
+            spread = sum(w * (t - self.reference) ** 2 for w, t in zip(weights, times))
+            self.drift = sum(w * (t - self.reference) * (o - mean_offset)
+                             for w, (t, o, _) in zip(weights, self.samples)) / spread
+        self.offset = mean_offset
+
+        # Each exchange bounds the offset to within half its round trip
+        self.error = min(rtt / 2 + abs(o - self.offset - self.drift * (t - self.reference))
+                         for t, o, rtt in self.samples)
+
+    def summary(self):
+        """Short text for the pump window"""
+        with self.lock:
+            if self.offset is None:
+                return "clock not synced"
+            return f"clock ±{self.error * 1000:.1f} ms, drift {self.drift * 1e6:+.0f} ppm"
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Device Profile Module
+====================================================
+
+This module contains the DeviceProfile class which caches what a pump's
+firmware reports about itself (GET_CONFIG) and checks commands against it
+before they are sent.
+
+The host used to learn about bad commands only after a round trip, as an
+ERROR line plus a STATUS. The firmware now answers GET_CONFIG with
+"CONFIG: key=value,..." (steps per mL, microstepping, step limits, maximum
+step rate, ...). Each pump window asks for it when it connects and keeps
+the result, so volumes are converted to steps with the firmware's own
+arithmetic, rates above what the stepper can do are refused, and ETAs are
+computed locally. Until the device answers, the profile holds the
+sketch_Final.ino defaults.
+
+Features:
+- GET_CONFIG parsing into a per-pump profile
+- Host-side validation of DISPENSE, SET_RATE, SEG, SET_VOL, SET_POS and
+  SET_INTERVAL with the firmware's error wording
+- Step rounding and maximum feasible rate
+- Local dispense duration estimates
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+from syringe_model import DEFAULT_STEPS_PER_ML, MAX_STEPS, MIN_STEPS, firmware_steps
+from motion_model import MotionModel
+
+# sketch_Final.ino defaults, used until the device answers GET_CONFIG
+DEFAULTS = {
+    'version': "",
+    'steps_per_ml': DEFAULT_STEPS_PER_ML,
+    'microstep': 16,
+    'steps_per_rev': 3200,
+    'min_steps': MIN_STEPS,
+    'max_steps': MAX_STEPS,
+    'max_step_rate': 4000.0,
+    'seg_capacity': 16,
+    'min_interval': 20,
+    'max_interval': 5000,
+    'address': 0,
+}
+
+
+class CommandError(ValueError):
+    """Raised for a command the firmware would reject"""
+
+
+class DeviceProfile:
+    """
+    Cached firmware configuration of one pump.
+    """
+
+    def __init__(self, from_device=False, **values):
+        """
+        Initialize the profile.
+
+        Args:
+            from_device: True when the values came from GET_CONFIG
+            **values: Fields of DEFAULTS to override
+        """
+        self.from_device = from_device
+        for key, default in DEFAULTS.items():
+            setattr(self, key, type(default)(values.get(key, default)))
+
+    @classmethod
+    def parse(cls, message):
+        """
+        Build a profile from a "CONFIG: key=value,..." line.
+
+        Unknown keys are ignored so newer firmware keeps working.
+
+        Raises:
+            ValueError: The line is not a CONFIG reply
+        """
+        if not message.startswith("CONFIG: "):
+            raise ValueError(f"Not a CONFIG line: {message!r}")
+        values = {}
+        for field in message[8:].split(","):
+            key, sep, value = field.partition("=")
+            key = key.strip()
+            if not sep or key not in DEFAULTS:
+                continue
+            if isinstance(DEFAULTS[key], str):
+                values[key] = value.strip()
+            else:
+                values[key] = float(value)
+        return cls(from_device=True, **values)
+
+    @property
+    def max_rate(self):
+        """Fastest feasible rate in mL/min"""
+        return self.max_step_rate / self.steps_per_ml * 60.0
+
+    @property
+    def min_volume(self):
+        """Smallest volume that moves at least one step (mL)"""
+        return 1.0 / self.steps_per_ml
+
+    def steps_for_volume(self, volume):
+        """Steps the firmware moves for a volume"""
+        return firmware_steps(volume, self.steps_per_ml)
+
+    def delivered_volume(self, volume):
+        """Volume actually delivered after the firmware's step rounding (mL)"""
+        return self.steps_for_volume(volume) / self.steps_per_ml
+
+    def apply_to(self, syringe):
+        """
+        Use the firmware's calibration and step limits in a SyringeModel.
+
+        Args:
+            syringe: SyringeModel mirroring this pump
+        """
+        syringe.steps_per_ml = self.steps_per_ml
+        syringe.min_steps = self.min_steps
+        syringe.max_steps = self.max_steps
+
+    def summary(self):
+        """One-line description for the pump log"""
+        source = f"firmware {self.version}" if self.from_device else "defaults"
+        return (f"{self.steps_per_ml:.2f} steps/mL, 1/{self.microstep} microstepping, "
+                f"max {self.max_rate:.2f} mL/min, stroke {self.max_steps - self.min_steps} steps "
+                f"({source})")
+
+    # ----------------- checks -----------------
+
+    def check_rate(self, rate, allow_zero=False):
+        """
+        Raises:
+            CommandError: The rate is negative (or zero) or above max_rate
+        """
+        if rate < 0 or (rate == 0 and not allow_zero):
+            raise CommandError("Rate must be positive" if not allow_zero
+                               else "Rate cannot be negative")
+        if rate > self.max_rate:
+            raise CommandError(f"Rate {rate:g} mL/min exceeds the maximum of "
+                               f"{self.max_rate:.2f} mL/min for this pump")
+
+    def check_dispense(self, volume, rate):
+        """
+        Check a DISPENSE before sending it.
+
+        Returns:
+            Steps the firmware will move
+
+        Raises:
+            CommandError: The firmware would reject or not move for it
+        """
+        if volume <= 0 or rate <= 0:
+            raise CommandError("Volume and rate must be positive")
+        self.check_rate(rate)
+        steps = self.steps_for_volume(volume)
+        if steps < 1:
+            raise CommandError(f"{volume:g} mL is less than one step "
+                               f"({self.min_volume:.5f} mL)")
+        return steps
+
+    def dispense_time(self, volume, rate):
+        """Seconds a dispense takes, including the acceleration ramps"""
+        steps = self.steps_for_volume(volume)
+        return MotionModel(steps / self.steps_per_ml, rate, self.steps_per_ml, 0.0).total_time
+
+    def validate_command(self, command):
+        """
+        Check a command line against the profile.
+
+        Commands the profile knows nothing about pass unchanged.
+
+        Returns:
+            The command to send (SET_INTERVAL is clamped as the firmware would)
+
+        Raises:
+            CommandError: The firmware would answer with an ERROR
+        """
+        name, sep, argument = command.partition(":")
+        if not sep:
+            return command
+        try:
+            if name == "DISPENSE":
+                volume, comma, rate = argument.partition(",")
+                if not comma:
+                    raise CommandError("Invalid DISPENSE format. Use DISPENSE:volume,rate")
+                self.check_dispense(float(volume), float(rate))
+            elif name == "SET_RATE":
+                self.check_rate(float(argument), allow_zero=True)
+            elif name == "SEG":
+                duration, comma, rate = argument.partition(",")
+                if not comma:
+                    raise CommandError("Invalid SEG format. Use SEG:duration_ms,rate")
+                if int(float(duration)) <= 0:
+                    raise CommandError("Segment needs duration > 0 and rate >= 0")
+                self.check_rate(float(rate), allow_zero=True)
+            elif name == "SET_VOL":
+                steps = self.steps_for_volume(float(argument))
+                if not self.min_steps <= steps <= self.max_steps:
+                    raise CommandError(f"{float(argument):g} mL is outside the syringe stroke "
+                                       f"(0-{(self.max_steps - self.min_steps) / self.steps_per_ml:.2f} mL)")
+            elif name == "SET_POS":
+                steps = int(float(argument))
+                if not self.min_steps <= steps <= self.max_steps:
+                    raise CommandError(f"Position {steps} is outside "
+                                       f"{self.min_steps}-{self.max_steps} steps")
+            elif name == "SET_INTERVAL":
+                interval = int(float(argument))
+                return f"SET_INTERVAL:{min(self.max_interval, max(self.min_interval, interval))}"
+        except ValueError as e:
+            if isinstance(e, CommandError):
+                raise
+            raise CommandError(f"Invalid number in {command}")
+        return command
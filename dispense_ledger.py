@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Dispense Ledger Module
+=====================================================
+
+This module contains the DispenseLedger class, an append-only SQLite record
+of every dispense across runs, and FleetCounters, the running totals the
+manager shows without querying the database.
+
+Each dispense adds a 'start' row with the commanded volume and rate, then
+one 'complete', 'cancel' or 'interrupted' row with the volume delivered,
+measured from the plunger position the Arduino reported. Rows are never
+updated or deleted (triggers refuse it). Writes are queued and committed
+in batches on a background thread, as in log_store.py.
+
+Features:
+- Append-only ledger of starts, completions, cancellations and interruptions
+- Aggregates per pump, per syringe and per day
+- Incremental fleet counters for the GUI
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import datetime
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from pump_logging import DEFAULT_LOG_DIR
+
+LEDGER_FILE_NAME = "ledger.sqlite3"
+
+BATCH_SIZE = 100
+BATCH_INTERVAL = 0.5  # seconds
+
+EVENT_START = "start"
+EVENT_COMPLETE = "complete"
+EVENT_CANCEL = "cancel"
+EVENT_INTERRUPTED = "interrupted"
+END_EVENTS = (EVENT_COMPLETE, EVENT_CANCEL, EVENT_INTERRUPTED)
+
+# Columns totals() can group by
+GROUP_COLUMNS = {'pump': "pump_name", 'syringe': "syringe", 'day': "day"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    dispense_id TEXT NOT NULL,
+    pump_id TEXT,
+    pump_name TEXT,
+    syringe TEXT,
+    event TEXT NOT NULL,
+    commanded_ml REAL,
+    delivered_ml REAL,
+    rate REAL
+);
+CREATE INDEX IF NOT EXISTS idx_ledger_pump_day ON ledger (pump_name, day);
+CREATE INDEX IF NOT EXISTS idx_ledger_syringe_day ON ledger (syringe, day);
+CREATE INDEX IF NOT EXISTS idx_ledger_day ON ledger (day);
+CREATE TRIGGER IF NOT EXISTS ledger_no_update BEFORE UPDATE ON ledger
+BEGIN SELECT RAISE(ABORT, 'the dispense ledger is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS ledger_no_delete BEFORE DELETE ON ledger
+BEGIN SELECT RAISE(ABORT, 'the dispense ledger is append-only'); END;
+"""
+
+TOTALS_COLUMNS = ("dispenses", "completed", "cancelled", "interrupted",
+                  "commanded_ml", "delivered_ml")
+
+
+def ledger_day(ts):
+    """Local calendar day of a timestamp, as stored in the ledger"""
+    return datetime.date.fromtimestamp(ts).isoformat()
+
+
+class DispenseLedger:
+    """
+    Append-only dispense ledger in SQLite.
+    """
+
+    def __init__(self, path=None):
+        """
+        Open (or create) the ledger.
+
+        Args:
+            path: Database file (default logs/ledger.sqlite3)
+        """
+        self.path = path or os.path.join(DEFAULT_LOG_DIR, LEDGER_FILE_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        setup = sqlite3.connect(self.path)
+        setup.execute("PRAGMA journal_mode=WAL")
+        setup.executescript(SCHEMA)
+        setup.commit()
+        setup.close()
+
+        self.rows = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+        # Separate connection for queries from the GUI thread
+        self.reader = sqlite3.connect(self.path, check_same_thread=False)
+        self.reader_lock = threading.Lock()
+
+    def record(self, event, dispense_id, pump_id, pump_name, syringe="",
+               commanded_ml=None, delivered_ml=None, rate=None, ts=None):
+        """
+        Queue a ledger row (returns immediately).
+
+        Args:
+            event: EVENT_START, EVENT_COMPLETE, EVENT_CANCEL or EVENT_INTERRUPTED
+            dispense_id: Identifier shared by a dispense's start and end rows
+            pump_id: Pump identifier
+            pump_name: Pump display name
+            syringe: Syringe label entered in the pump window
+            commanded_ml: Commanded volume (mL)
+            delivered_ml: Delivered volume (mL), for end events
+            rate: Commanded rate (mL/min)
+            ts: Unix timestamp (default now)
+
+        Returns:
+            The row as a dict, for FleetCounters.add()
+        """
+        ts = time.time() if ts is None else ts
+        row = {'ts': ts, 'day': ledger_day(ts), 'dispense_id': dispense_id,
+               'pump_id': pump_id, 'pump_name': pump_name, 'syringe': syringe or "",
+               'event': event, 'commanded_ml': commanded_ml, 'delivered_ml': delivered_ml,
+               'rate': rate}
+        self.rows.put(row)
+        return row
+
+    def close(self):
+        """Commit what is queued and close the database"""
+        self.rows.put(None)
+        self.writer.join(5.0)
+        with self.reader_lock:
+            self.reader.close()
+
+    def _write_loop(self):
+        """Insert queued rows in batched transactions"""
+        db = sqlite3.connect(self.path)
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + BATCH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    row = self.rows.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    running = False
+                    break
+                batch.append(row)
+            if batch:
+                with db:
+                    db.executemany(
+                        "INSERT INTO ledger (ts, day, dispense_id, pump_id, pump_name, syringe, "
+                        "event, commanded_ml, delivered_ml, rate) VALUES (:ts, :day, "
+                        ":dispense_id, :pump_id, :pump_name, :syringe, :event, :commanded_ml, "
+                        ":delivered_ml, :rate)", batch)
+        db.close()
+
+    # ----------------- queries -----------------
+
+    def totals(self, group_by=None, start_day=None, end_day=None):
+        """
+        Aggregate the ledger.
+
+        Rows still queued for the writer thread are not included yet.
+
+        Args:
+            group_by: 'pump', 'syringe', 'day' or None for one fleet-wide row
+            start_day: First day to include ("YYYY-MM-DD")
+            end_day: Last day to include ("YYYY-MM-DD")
+
+        Returns:
+            List of (key, dispenses, completed, cancelled, interrupted,
+            commanded_ml, delivered_ml); key is None without group_by
+        """
+        key = GROUP_COLUMNS[group_by] if group_by else "NULL"
+        clauses = []
+        params = []
+        if start_day:
+            clauses.append("day >= ?")
+            params.append(start_day)
+        if end_day:
+            clauses.append("day <= ?")
+            params.append(end_day)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        group = f"GROUP BY {key} ORDER BY {key}" if group_by else ""
+        sql = (f"SELECT {key}, "
+               f"COALESCE(SUM(event = '{EVENT_START}'), 0), "
+               f"COALESCE(SUM(event = '{EVENT_COMPLETE}'), 0), "
+               f"COALESCE(SUM(event = '{EVENT_CANCEL}'), 0), "
+               f"COALESCE(SUM(event = '{EVENT_INTERRUPTED}'), 0), "
+               f"COALESCE(SUM(CASE WHEN event = '{EVENT_START}' THEN commanded_ml END), 0), "
+               f"COALESCE(SUM(CASE WHEN event != '{EVENT_START}' THEN delivered_ml END), 0) "
+               f"FROM ledger {where} {group}")
+        with self.reader_lock:
+            return self.reader.execute(sql, params).fetchall()
+
+    def history(self, pump_name=None, limit=200):
+        """
+        Most recent ledger rows, newest first.
+
+        Returns:
+            List of (ts, pump_name, syringe, event, commanded_ml, delivered_ml, rate)
+        """
+        where = "WHERE pump_name = ?" if pump_name else ""
+        params = [pump_name] if pump_name else []
+        with self.reader_lock:
+            return self.reader.execute(
+                f"SELECT ts, pump_name, syringe, event, commanded_ml, delivered_ml, rate "
+                f"FROM ledger {where} ORDER BY id DESC LIMIT ?", params + [limit]).fetchall()
+
+
+class FleetCounters:
+    """
+    Running fleet totals, kept in step with the ledger without querying it.
+    """
+
+    def __init__(self, ledger=None):
+        """
+        Initialize the counters, seeded from the ledger's history if given.
+
+        Args:
+            ledger: DispenseLedger to read the totals so far from (one query)
+        """
+        self.all_time = dict.fromkeys(TOTALS_COLUMNS, 0)
+        self.today = dict.fromkeys(TOTALS_COLUMNS, 0)
+        self.day = ledger_day(time.time())
+        if ledger is not None:
+            for target, day in ((self.all_time, None), (self.today, self.day)):
+                row = ledger.totals(start_day=day, end_day=day)[0]
+                target.update(zip(TOTALS_COLUMNS, row[1:]))
+
+    def add(self, row):
+        """
+        Count one ledger row.
+
+        Args:
+            row: Dict returned by DispenseLedger.record()
+        """
+        if row['day'] != self.day:
+            self.day = row['day']
+            self.today = dict.fromkeys(TOTALS_COLUMNS, 0)
+        for totals in (self.all_time, self.today):
+            event = row['event']
+            if event == EVENT_START:
+                totals['dispenses'] += 1
+                totals['commanded_ml'] += row['commanded_ml'] or 0.0
+            else:
+                totals[{EVENT_COMPLETE: 'completed', EVENT_CANCEL: 'cancelled',
+                        EVENT_INTERRUPTED: 'interrupted'}[event]] += 1
+                totals['delivered_ml'] += row['delivered_ml'] or 0.0
+
+    def summary(self):
+        """One-line text for the manager window"""
+        return (f"Today: {self.today['dispenses']} dispenses, "
+                f"{self.today['delivered_ml']:.2f} mL delivered  |  "
+                f"All time: {self.all_time['dispenses']} dispenses, "
+                f"{self.all_time['delivered_ml']:.2f} mL")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Emergency Stop Module
+====================================================
+
+This module contains the EmergencyStop class which broadcasts CANCEL to
+every open pump port at once.
+
+The normal Stop All path cancels pumps one after another on the GUI thread
+(log, queue, callback), so stop time grows with pump count. The emergency
+path skips the writer queues and the GUI entirely: one thread per port
+writes CANCEL at the same instant, and the reader threads report each
+pump's DISPENSE_CANCELLED directly. The write still takes the pump
+writer's write lock, so it waits for a line already being written instead
+of interleaving with it.
+
+Features:
+- Parallel CANCEL writes released together by a barrier
+- Per-pump acknowledgement straight from the reader thread
+- Worst-case host-to-stop latency across the fleet
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import threading
+import time
+
+CANCEL_BYTES = b"CANCEL\n"
+
+# Replies that mean the pump is not (or no longer) moving
+STOPPED_REPLIES = ("DISPENSE_CANCELLED", "RETRACT_CANCELLED",
+                   "INFO: No active dispensing to cancel")
+
+DEFAULT_TIMEOUT = 2.0
+
+
+def write_cancel(pump):
+    """
+    Write CANCEL to a pump now, from the calling thread.
+
+    Goes through the pump's writer lock (SerialWriter.write_urgent), and
+    drops every command queued before it, since a queued DISPENSE must not
+    restart the pump.
+
+    Args:
+        pump: PumpWindow
+
+    Raises:
+        ConnectionError: If the pump is not connected
+    """
+    writer = pump.serial_writer
+    if writer is not None:
+        writer.write_urgent(CANCEL_BYTES)
+        return
+    connection = pump.serial_connection
+    if connection is None:
+        raise ConnectionError("not connected")
+    connection.write(CANCEL_BYTES)
+
+
+class EmergencyStopResult:
+    """
+    Outcome of one emergency stop.
+
+    Attributes:
+        latencies: pump name -> seconds from trigger to stop reply (None if no reply)
+        errors: pump name -> write error string
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    @property
+    def worst_case(self):
+        """Largest acknowledged latency in seconds, or None if nothing replied"""
+        acknowledged = [value for value in self.latencies.values() if value is not None]
+        return max(acknowledged) if acknowledged else None
+
+    @property
+    def unacknowledged(self):
+        """Names of pumps that did not confirm the stop in time"""
+        return [name for name, value in self.latencies.items() if value is None]
+
+    def summary(self):
+        """One-line summary for the system log"""
+        worst = self.worst_case
+        worst_text = f"{worst * 1000:.1f} ms" if worst is not None else "n/a"
+        text = (f"Emergency stop: {len(self.latencies) - len(self.unacknowledged)}/"
+                f"{len(self.latencies)} pumps confirmed, worst case {worst_text}")
+        if self.unacknowledged:
+            text += f"; no reply from {', '.join(self.unacknowledged)}"
+        if self.errors:
+            text += f"; write errors on {', '.join(self.errors)}"
+        return text
+
+
+class EmergencyStop:
+    """
+    Broadcast CANCEL to a set of pumps and wait for them to confirm.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        """
+        Initialize the emergency stop.
+
+        Args:
+            timeout: Seconds to wait for every pump to confirm the stop
+        """
+        self.timeout = timeout
+
+    def trigger(self, pumps):
+        """
+        Stop every pump with an open port. Blocks until all confirm or timeout,
+        so call it from a worker thread, never from Tk.
+
+        Args:
+            pumps: Iterable of PumpWindow objects
+
+        Returns:
+            EmergencyStopResult
+        """
+        targets = [pump for pump in pumps if pump.serial_connection is not None]
+        result = EmergencyStopResult()
+        if not targets:
+            return result
+
+        acknowledged = {pump.pump_id: threading.Event() for pump in targets}
+        ack_times = {}
+        listeners = {}
+
+        for pump in targets:
+            def on_line(message, received_at, pump_id=pump.pump_id):
+                if message in STOPPED_REPLIES and not acknowledged[pump_id].is_set():
+                    ack_times[pump_id] = received_at
+                    acknowledged[pump_id].set()
+            listeners[pump.pump_id] = on_line
+            pump.add_line_listener(on_line)
+
+        barrier = threading.Barrier(len(targets) + 1)
+
+        def cancel(pump):
+            barrier.wait()
+            try:
+                write_cancel(pump)
+            except Exception as e:
+                result.errors[pump.name] = str(e)
+                acknowledged[pump.pump_id].set()
+
+        writers = [threading.Thread(target=cancel, args=(pump,), daemon=True)
+                   for pump in targets]
+        for thread in writers:
+            thread.start()
+
+        barrier.wait()
+        started_at = time.perf_counter()
+        deadline = started_at + self.timeout
+
+        try:
+            for pump in targets:
+                acknowledged[pump.pump_id].wait(max(0.0, deadline - time.perf_counter()))
+        finally:
+            for pump in targets:
+                pump.remove_line_listener(listeners[pump.pump_id])
+
+        for pump in targets:
+            received_at = ack_times.get(pump.pump_id)
+            result.latencies[pump.name] = (received_at - started_at
+                                           if received_at is not None else None)
+        return result
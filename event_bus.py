@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Event Bus Module
+===============================================
+
+This module contains the EventBus class which carries pump events
+(connect, dispense start/complete, retract, link loss, ...) from the pump
+windows to everything that wants them.
+
+Pump windows used to call one manager_callback(event_type, pump_id, data)
+that the manager handled inline with an if/elif chain, so every consumer
+ran on the GUI thread and a misspelt event type was silently ignored. Now
+a PumpWindow publishes a PumpEvent; publish() checks the event type and its
+data keys against EVENT_FIELDS, then hands the event to each subscription's
+bounded queue and returns. Subscribers choose how they are called:
+
+- DELIVER_POLL: the subscriber drains the queue itself (the manager does it
+  from a Tk after() loop, so tree updates stay on the GUI thread)
+- DELIVER_THREAD: a worker thread per subscription calls the handler
+  (recorders, exporters, analytics)
+- DELIVER_ASYNCIO: events are queued on an asyncio loop (network servers)
+
+A full queue drops its oldest event and counts it, so a slow subscriber
+loses events rather than blocking the pump or the GUI.
+
+Features:
+- Typed events with per-type required data keys
+- Per-subscription bounded queues with drop counting
+- Polled, threaded and asyncio delivery
+- Subscription by event type
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import asyncio
+import queue
+import threading
+import time
+
+from pump_logging import log_event, SOURCE_MANAGER
+
+# Event type -> data keys every event of that type carries
+EVENT_FIELDS = {
+    'connect': ('port',),
+    'disconnect': (),
+    'rename': ('old_name', 'new_name'),
+    'close': (),
+    'link_lost': ('error',),
+    'reconnect': ('port', 'downtime'),
+    'dispense_start': ('dispense_id', 'volume', 'rate', 'syringe'),
+    'dispense_cancel': (),
+    'dispense_complete': ('dispense_id', 'volume', 'delivered', 'syringe'),
+    'dispense_cancelled': ('dispense_id', 'volume', 'delivered', 'syringe'),
+    'dispense_interrupted': ('dispense_id', 'volume', 'dispensed', 'syringe'),
+    'retract_start': (),
+    'retract_progress': ('progress',),
+    'retract_cancel': (),
+    'retract_complete': ('position',),
+    'retract_cancelled': ('position',),
+    'syringe': ('available', 'refill_minutes'),
+    'interlock': ('rule', 'error'),
+}
+
+DELIVER_POLL = "poll"
+DELIVER_THREAD = "thread"
+DELIVER_ASYNCIO = "asyncio"
+
+DEFAULT_QUEUE_SIZE = 1000
+
+# Worker threads get this long to finish their queue on close (seconds)
+CLOSE_TIMEOUT = 2.0
+
+_STOP = object()
+
+
+class PumpEvent:
+    """
+    One event reported by a pump window.
+    """
+
+    __slots__ = ('kind', 'pump_id', 'pump_name', 'data', 'time', 'mono')
+
+    def __init__(self, kind, pump_id, pump_name, data=None):
+        """
+        Initialize the event.
+
+        Args:
+            kind: Event type, a key of EVENT_FIELDS
+            pump_id: Unique identifier of the pump
+            pump_name: Display name of the pump when the event happened
+            data: Dict with at least the keys EVENT_FIELDS lists for the type
+
+        Raises:
+            ValueError: Unknown event type or missing data keys
+        """
+        if kind not in EVENT_FIELDS:
+            raise ValueError(f"Unknown pump event type: {kind!r}")
+        data = data or {}
+        missing = [key for key in EVENT_FIELDS[kind] if key not in data]
+        if missing:
+            raise ValueError(f"{kind} event without {', '.join(missing)}")
+        self.kind = kind
+        self.pump_id = pump_id
+        self.pump_name = pump_name
+        self.data = data
+        self.time = time.time()
+        self.mono = time.monotonic()
+
+    def __repr__(self):
+        return f"PumpEvent({self.kind!r}, {self.pump_name!r}, {self.data!r})"
+
+
+class Subscription:
+    """
+    One subscriber's bounded queue and delivery.
+    """
+
+    def __init__(self, bus, handler, kinds, delivery, maxsize, name, loop=None):
+        """
+        Initialize the subscription (use EventBus.subscribe).
+
+        Args:
+            bus: EventBus the subscription belongs to
+            handler: Called with each PumpEvent (DELIVER_THREAD, optional for
+                DELIVER_ASYNCIO, where it may be a coroutine function)
+            kinds: Event types wanted, or None for all
+            delivery: DELIVER_POLL, DELIVER_THREAD or DELIVER_ASYNCIO
+            maxsize: Events queued before the oldest is dropped
+            name: Name for logs and the worker thread
+            loop: asyncio loop for DELIVER_ASYNCIO
+        """
+        self.bus = bus
+        self.handler = handler
+        self.kinds = frozenset(kinds) if kinds is not None else None
+        self.delivery = delivery
+        self.maxsize = maxsize
+        self.name = name
+        self.loop = loop
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self.worker = None
+        self.task = None
+
+        if delivery == DELIVER_ASYNCIO:
+            # Only touched on the loop's thread after this
+            self.queue = asyncio.Queue(maxsize)
+            if handler is not None:
+                self.loop.call_soon_threadsafe(self._start_async_delivery)
+        else:
+            self.queue = queue.Queue(maxsize)
+        if delivery == DELIVER_THREAD:
+            self.worker = threading.Thread(target=self._deliver_loop, name=f"events-{name}",
+                                           daemon=True)
+            self.worker.start()
+
+    def wants(self, event):
+        return self.kinds is None or event.kind in self.kinds
+
+    def offer(self, event):
+        """Queue an event without blocking (publisher thread)"""
+        if self.delivery == DELIVER_ASYNCIO:
+            try:
+                self.loop.call_soon_threadsafe(self._put_async, event)
+            except RuntimeError:
+                self.dropped += 1  # the loop has closed
+            return
+        self._put(self.queue, event)
+
+    def _put(self, target, event):
+        """Put on a queue.Queue, dropping the oldest event when full"""
+        while True:
+            try:
+                target.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    target.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    # ----------------- DELIVER_POLL -----------------
+
+    def drain(self, limit=None):
+        """
+        Events queued so far (DELIVER_POLL).
+
+        Args:
+            limit: Most events to return, to keep one GUI tick short
+
+        Returns:
+            List of PumpEvent, oldest first
+        """
+        events = []
+        while limit is None or len(events) < limit:
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _STOP:
+                events.append(event)
+        self.delivered += len(events)
+        return events
+
+    # ----------------- DELIVER_THREAD -----------------
+
+    def _deliver_loop(self):
+        """Call the handler for each queued event (worker thread)"""
+        while True:
+            event = self.queue.get()
+            if event is _STOP:
+                return
+            try:
+                self.handler(event)
+            except Exception as e:
+                log_event(f"Event subscriber {self.name} failed on {event.kind}: {e}",
+                          SOURCE_MANAGER, event.pump_id, event.pump_name)
+            self.delivered += 1
+
+    # ----------------- DELIVER_ASYNCIO -----------------
+
+    def _start_async_delivery(self):
+        self.task = self.loop.create_task(self._async_deliver_loop())
+
+    def _put_async(self, event):
+        """Put on the asyncio queue, dropping the oldest event when full (loop thread)"""
+        if self.closed and event is not _STOP:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        """
+        Next event (DELIVER_ASYNCIO without a handler).
+
+        Returns:
+            PumpEvent, or None once the subscription is closed
+        """
+        event = await self.queue.get()
+        if event is _STOP:
+            return None
+        self.delivered += 1
+        return event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    async def _async_deliver_loop(self):
+        """Call (or await) the handler for each queued event"""
+        while True:
+            event = await self.get()
+            if event is None:
+                return
+            try:
+                result = self.handler(event)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                log_event(f"Event subscriber {self.name} failed on {event.kind}: {e}",
+                          SOURCE_MANAGER, event.pump_id, event.pump_name)
+
+    # ----------------- closing -----------------
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Stop delivery. Worker threads first finish what is queued.
+
+        Args:
+            timeout: Seconds to wait for the worker thread
+        """
+        if self.closed:
+            return
+        self.bus.unsubscribe(self)
+        self.closed = True
+        if self.delivery == DELIVER_ASYNCIO:
+            try:
+                self.loop.call_soon_threadsafe(self._put_async, _STOP)
+            except RuntimeError:
+                pass
+            return
+        self._put(self.queue, _STOP)
+        if self.worker is not None and self.worker is not threading.current_thread():
+            self.worker.join(timeout)
+
+    def summary(self):
+        """Short text for logs"""
+        return f"{self.name}: {self.delivered} delivered, {self.dropped} dropped"
+
+
+class EventBus:
+    """
+    Publish/subscribe hub for pump events.
+    """
+
+    def __init__(self):
+        """Initialize the bus with no subscribers"""
+        # Replaced, never mutated, so publish() needs no lock
+        self.subscriptions = ()
+        self.lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, handler=None, kinds=None, delivery=DELIVER_THREAD,
+                  maxsize=DEFAULT_QUEUE_SIZE, name=None, loop=None):
+        """
+        Add a subscriber.
+
+        Args:
+            handler: Called with each PumpEvent; not used with DELIVER_POLL
+            kinds: Iterable of event types to receive, or None for all
+            delivery: DELIVER_POLL, DELIVER_THREAD or DELIVER_ASYNCIO
+            maxsize: Events queued before the oldest is dropped
+            name: Name for logs (default: the handler's name)
+            loop: asyncio loop for DELIVER_ASYNCIO (default: the running loop)
+
+        Returns:
+            Subscription; close() it to unsubscribe
+
+        Raises:
+            ValueError: Unknown event type or delivery, or no handler for
+                DELIVER_THREAD
+        """
+        if kinds is not None:
+            unknown = set(kinds) - set(EVENT_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown pump event types: {', '.join(sorted(unknown))}")
+        if delivery not in (DELIVER_POLL, DELIVER_THREAD, DELIVER_ASYNCIO):
+            raise ValueError(f"Unknown delivery: {delivery!r}")
+        if delivery == DELIVER_THREAD and handler is None:
+            raise ValueError("Threaded subscriptions need a handler")
+        if delivery == DELIVER_ASYNCIO and loop is None:
+            loop = asyncio.get_running_loop()
+        if name is None:
+            name = getattr(handler, '__name__', delivery)
+
+        subscription = Subscription(self, handler, kinds, delivery, maxsize, name, loop)
+        with self.lock:
+            self.subscriptions = self.subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscriber (Subscription.close() does this)"""
+        with self.lock:
+            self.subscriptions = tuple(s for s in self.subscriptions if s is not subscription)
+
+    def publish(self, event):
+        """
+        Hand an event to every interested subscriber. Never blocks.
+
+        Args:
+            event: PumpEvent
+        """
+        self.published += 1
+        for subscription in self.subscriptions:
+            if subscription.wants(event):
+                subscription.offer(event)
+
+    def close(self):
+        """Close every subscription, letting worker threads finish their queues"""
+        for subscription in self.subscriptions:
+            subscription.close()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Fault Injection Test
+===================================================
+
+This script feeds the serial line framing (see line_framer.py) with
+telemetry that has been damaged the way real links damage it, and checks
+that the readers survive, recover and keep up.
+
+Checks:
+- split: the stream arrives in random chunks from 1 byte up; every line
+  must come out exactly once, unchanged
+- drop / duplicate / corrupt: single bytes are lost, doubled or replaced
+  with random values; no exception, every line returned is printable
+  ASCII within the length bound, and most lines survive
+- noise: bursts of binary garbage (some longer than a line, some without
+  a newline) arrive between lines; the lines around them are recovered
+- throughput: lines per second through the framer with noise injected,
+  compared with a clean stream
+- end_to_end: a PumpClient on a simulated pump whose port injects noise
+  bursts and splits reads completes every dispense
+
+Usage:
+    python fault_injection.py
+    python fault_injection.py --lines 200000 --seed 7
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import argparse
+import collections
+import random
+import sys
+import time
+
+from line_framer import LineFramer
+from pump_client import PumpClient
+from pump_simulator import SimulatedSerial
+
+DEFAULT_LINES = 50000
+
+# Probability per byte
+BYTE_FAULT_RATE = 0.001
+# Probability per line of a noise burst before it
+NOISE_BURST_RATE = 0.01
+NOISE_BURST_LENGTH = (1, 600)
+
+# Fraction of lines that must come out unchanged
+MIN_INTACT = {'drop': 0.8, 'duplicate': 0.8, 'corrupt': 0.8, 'noise': 0.95}
+
+# Noisy throughput must stay above this fraction of clean throughput
+MIN_THROUGHPUT_RATIO = 0.7
+
+READ_CHUNK = 4096
+
+END_TO_END_DISPENSES = 5
+DISPENSE_TIMEOUT = 10.0
+
+
+def telemetry_lines(count, rng):
+    """Realistic firmware output: mostly progress telemetry"""
+    lines = []
+    for i in range(count):
+        progress = (i % 1000) / 10.0
+        kind = i % 10
+        if kind < 6:
+            lines.append(f"PROGRESS_DETAILED: {progress:.1f}%,{progress / 20:.2f}mL,"
+                         f"{5 - progress / 20:.2f}mL,0.2min,0.3min,{rng.uniform(1, 30):.1f}mL/min,"
+                         f"{int(progress * 320)}steps,{32000 - int(progress * 320)}steps_remaining,"
+                         f"{123456 + i * 50}ms")
+        elif kind < 8:
+            lines.append(f"PROGRESS: {progress:.1f}% - {progress / 20:.2f}/5.00mL")
+        elif kind == 8:
+            lines.append(f"STATUS: DISPENSING - 5.00mL @ 10.00mL/min - {progress:.1f}%")
+        else:
+            lines.append(f"SYNC: {i},{123456 + i * 50}")
+    return lines
+
+
+def encode(lines):
+    return "".join(line + "\r\n" for line in lines).encode()
+
+
+def noise_burst(rng):
+    """Random bytes that end in a non-printable byte or a newline"""
+    data = bytes(rng.randrange(256) for _ in range(rng.randint(*NOISE_BURST_LENGTH)))
+    return data + (b"\n" if rng.random() < 0.5 else b"\xff")
+
+
+class FaultInjector:
+    """
+    Damages a byte stream.
+    """
+
+    def __init__(self, rng, drop=0.0, duplicate=0.0, corrupt=0.0, noise=0.0):
+        """
+        Args:
+            rng: random.Random
+            drop, duplicate, corrupt: Probability per byte
+            noise: Probability per line of a noise burst before it
+        """
+        self.rng = rng
+        self.drop = drop
+        self.duplicate = duplicate
+        self.corrupt = corrupt
+        self.noise = noise
+        self.faults = collections.Counter()
+
+    def damage_bytes(self, data):
+        """Drop, duplicate and corrupt single bytes"""
+        rate = self.drop + self.duplicate + self.corrupt
+        if not rate:
+            return data
+        rng = self.rng
+        out = bytearray()
+        # Jump from fault to fault instead of rolling for every byte
+        position = 0
+        while True:
+            gap = int(rng.expovariate(rate)) if rate < 1 else 0
+            if position + gap >= len(data):
+                out += data[position:]
+                return bytes(out)
+            out += data[position:position + gap]
+            position += gap
+            roll = rng.random() * rate
+            if roll < self.drop:
+                self.faults['drop'] += 1
+            elif roll < self.drop + self.duplicate:
+                out += data[position:position + 1] * 2
+                self.faults['duplicate'] += 1
+            else:
+                out.append(rng.randrange(256))
+                self.faults['corrupt'] += 1
+            position += 1
+
+    def add_noise(self, data):
+        """Insert noise bursts after line endings"""
+        if not self.noise:
+            return data
+        parts = data.split(b"\n")
+        out = []
+        for part in parts:
+            out.append(part)
+            if self.rng.random() < self.noise:
+                out[-1] = part + b"\n" + noise_burst(self.rng).rstrip(b"\n")
+                self.faults['noise'] += 1
+        return b"\n".join(out)
+
+    def damage(self, data):
+        return self.damage_bytes(self.add_noise(data))
+
+    def chunks(self, data, largest=READ_CHUNK):
+        """Split into random read sizes, 1 byte to largest"""
+        position = 0
+        while position < len(data):
+            size = self.rng.randint(1, largest)
+            yield data[position:position + size]
+            position += size
+
+
+class FaultySerial:
+    """
+    pyserial-compatible wrapper that injects faults into received bytes.
+    """
+
+    def __init__(self, connection, injector, largest_read=64):
+        self.connection = connection
+        self.injector = injector
+        self.largest_read = largest_read
+        self.pending = b""
+
+    @property
+    def port(self):
+        return self.connection.port
+
+    @property
+    def in_waiting(self):
+        if not self.pending and self.connection.in_waiting:
+            self.pending = self.injector.damage(self.connection.read(self.connection.in_waiting))
+        return min(len(self.pending), self.injector.rng.randint(1, self.largest_read))
+
+    def read(self, size=1):
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    def write(self, data):
+        return self.connection.write(data)
+
+    def reset_input_buffer(self):
+        self.pending = b""
+        self.connection.reset_input_buffer()
+
+    def close(self):
+        self.connection.close()
+
+
+def run_framer(data, chunks):
+    """Feed chunks to a new framer; returns (framer, lines, seconds)"""
+    framer = LineFramer()
+    lines = []
+    start = time.perf_counter()
+    for chunk in chunks:
+        lines.extend(framer.feed(chunk))
+    return framer, lines, time.perf_counter() - start
+
+
+def intact_fraction(expected, received):
+    """Fraction of expected lines that came out unchanged (as a multiset)"""
+    matched = collections.Counter(expected) & collections.Counter(received)
+    return sum(matched.values()) / len(expected)
+
+
+def well_formed(framer, lines):
+    """Every returned line is printable ASCII within the bound"""
+    return all(line.isascii() and line.isprintable() and len(line) <= framer.max_length
+               for line in lines)
+
+
+# ----------------- checks -----------------
+
+def check_split(lines, rng):
+    injector = FaultInjector(rng)
+    framer, received, _ = run_framer(None, injector.chunks(encode(lines)))
+    ok = received == lines and framer.dropped == 0
+    return ok, f"{len(received)}/{len(lines)} lines, {framer.dropped} dropped"
+
+
+def check_byte_faults(lines, rng, kind):
+    injector = FaultInjector(rng, **{kind: BYTE_FAULT_RATE})
+    data = injector.damage(encode(lines))
+    framer, received, _ = run_framer(data, injector.chunks(data))
+    intact = intact_fraction(lines, received)
+    ok = well_formed(framer, received) and intact >= MIN_INTACT[kind]
+    return ok, (f"{injector.faults[kind]} {kind} faults, {intact:.1%} lines intact, "
+                f"{framer.malformed} malformed, {framer.salvaged} salvaged, "
+                f"{framer.oversized} oversized")
+
+
+def check_noise(lines, rng):
+    injector = FaultInjector(rng, noise=NOISE_BURST_RATE)
+    data = injector.damage(encode(lines))
+    framer, received, _ = run_framer(data, injector.chunks(data))
+    intact = intact_fraction(lines, received)
+    ok = well_formed(framer, received) and intact >= MIN_INTACT['noise'] and framer.dropped > 0
+    return ok, (f"{injector.faults['noise']} bursts, {intact:.1%} lines intact, "
+                f"{framer.malformed} malformed, {framer.salvaged} salvaged, "
+                f"{framer.oversized} oversized")
+
+
+def check_throughput(lines, rng):
+    clean = encode(lines)
+    _, _, clean_seconds = run_framer(clean, FaultInjector(rng).chunks(clean))
+    injector = FaultInjector(rng, corrupt=BYTE_FAULT_RATE, noise=NOISE_BURST_RATE)
+    noisy = injector.damage(clean)
+    _, _, noisy_seconds = run_framer(noisy, injector.chunks(noisy))
+    clean_rate = len(lines) / clean_seconds
+    noisy_rate = len(lines) / noisy_seconds
+    ok = noisy_rate >= clean_rate * MIN_THROUGHPUT_RATIO
+    return ok, f"clean {clean_rate:,.0f} lines/s, noisy {noisy_rate:,.0f} lines/s"
+
+
+def check_end_to_end(rng):
+    injector = FaultInjector(rng, noise=0.05)
+    connection = FaultySerial(SimulatedSerial("SIM1"), injector)
+    results = []
+    with PumpClient("faulty", port="SIM1", connection=connection) as pump:
+        for _ in range(END_TO_END_DISPENSES):
+            results.append(pump.dispense(0.02, 10).result(DISPENSE_TIMEOUT))
+        framer = pump.link.framer
+        alive = pump.link.reader.is_alive()
+    completed = sum(result.completed for result in results)
+    ok = alive and completed == END_TO_END_DISPENSES
+    return ok, (f"{completed}/{END_TO_END_DISPENSES} dispenses completed through "
+                f"{injector.faults['noise']} bursts, {framer.lines} lines, "
+                f"{framer.dropped} frames dropped, reader {'alive' if alive else 'dead'}")
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Fault-injection test of the serial line framing")
+    parser.add_argument("--lines", type=int, default=DEFAULT_LINES, help="telemetry lines per check")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lines = telemetry_lines(args.lines, rng)
+    checks = [
+        ("split", lambda: check_split(lines, rng)),
+        ("drop", lambda: check_byte_faults(lines, rng, 'drop')),
+        ("duplicate", lambda: check_byte_faults(lines, rng, 'duplicate')),
+        ("corrupt", lambda: check_byte_faults(lines, rng, 'corrupt')),
+        ("noise", lambda: check_noise(lines, rng)),
+        ("throughput", lambda: check_throughput(lines, rng)),
+        ("end_to_end", lambda: check_end_to_end(rng)),
+    ]
+    failures = 0
+    for name, check in checks:
+        try:
+            ok, detail = check()
+        except Exception as e:
+            ok, detail = False, f"raised {type(e).__name__}: {e}"
+        failures += not ok
+        print(f"{'PASS' if ok else 'FAIL'} {name:>10}: {detail}", flush=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
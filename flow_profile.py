@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Flow Profile Module
+==================================================
+
+This module compiles multi-pump flow profiles (gradients, ratio changes)
+into per-pump rate setpoints and runs them on the pumps.
+
+A profile is a piecewise-linear composition over time (the fraction of the
+total flow each pump delivers) plus a total flow. compile_profile() samples
+it on a segment grid with NumPy into a FlowProfile: a (pumps x segments)
+array of rates in mL/min. ProfileRunner streams each pump's segments as
+SEG:<duration_ms>,<rate> lines a few segments ahead of time; the Arduino
+switches rates on its own clock, so timing does not depend on the host or
+the USB link. Achieved composition is tracked from the positions in the
+PROGRESS_DETAILED telemetry.
+
+Features:
+- Linear A->B gradients with optional holds, and arbitrary ratio programs
+- Vectorized compilation to timed rate segments
+- Lookahead streaming that keeps the firmware segment queue filled
+- Achieved vs target composition from telemetry
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import threading
+
+import numpy as np
+
+from pump_window import parse_number
+
+DEFAULT_SEGMENT_SECONDS = 1.0
+MIN_SEGMENT_SECONDS = 0.05
+
+# Segments queued on the Arduino ahead of the running one (firmware holds 16)
+DEFAULT_LOOKAHEAD = 8
+
+
+class FlowProfile:
+    """
+    Rate setpoints for several pumps on a shared segment grid.
+    """
+
+    def __init__(self, edges, rates):
+        """
+        Initialize the profile.
+
+        Args:
+            edges: Segment boundaries in seconds from the start, length n + 1;
+                rounded to whole milliseconds as the firmware runs them
+            rates: Rates in mL/min, shape (pumps, n)
+        """
+        edges = np.round(np.asarray(edges, dtype=float) * 1000.0) / 1000.0
+        rates = np.atleast_2d(np.asarray(rates, dtype=float))
+        keep = np.diff(edges) > 0
+        self.edges = np.concatenate([edges[:1], edges[1:][keep]])
+        self.rates = rates[:, keep]
+
+    @property
+    def pump_count(self):
+        return self.rates.shape[0]
+
+    @property
+    def durations(self):
+        """Segment lengths in seconds"""
+        return np.diff(self.edges)
+
+    @property
+    def duration(self):
+        """Total length in seconds"""
+        return float(self.edges[-1] - self.edges[0])
+
+    def volumes(self):
+        """Volume each pump delivers over the profile (mL)"""
+        return self.rates @ self.durations / 60.0
+
+    def total_flow(self):
+        """Combined rate per segment (mL/min)"""
+        return self.rates.sum(axis=0)
+
+    def composition(self):
+        """Fraction of the total flow per pump and segment, shape (pumps, n)"""
+        total = self.total_flow()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, self.rates / total, 0.0)
+
+    def composition_at(self, times):
+        """
+        Target composition at the given times.
+
+        Args:
+            times: Seconds from the start (array-like)
+
+        Returns:
+            Array of shape (pumps, len(times))
+        """
+        index = np.searchsorted(self.edges, np.asarray(times, dtype=float), side="right") - 1
+        index = np.clip(index, 0, self.rates.shape[1] - 1)
+        return self.composition()[:, index]
+
+    def nominal_rate(self, pump):
+        """Positive rate for the DISPENSE line; the first segment overrides it at once"""
+        peak = float(self.rates[pump].max())
+        return peak if peak > 0 else 1.0
+
+    def segment_commands(self, pump):
+        """SEG:<duration_ms>,<rate> lines for one pump"""
+        milliseconds = np.diff(np.round(self.edges * 1000.0).astype(np.int64))
+        return [f"SEG:{ms},{rate:.4f}" for ms, rate in zip(milliseconds, self.rates[pump])]
+
+
+def compile_profile(points, total_flow, segment_seconds=DEFAULT_SEGMENT_SECONDS):
+    """
+    Compile a piecewise-linear composition program into rate segments.
+
+    Args:
+        points: [(time_s, [fraction per pump]), ...] in time order; fractions
+            are normalized to sum to 1. Repeat a time for a step change.
+        total_flow: Combined flow in mL/min, constant or one value per point
+        segment_seconds: Segment length; breakpoints always fall on an edge
+
+    Returns:
+        FlowProfile
+    """
+    if segment_seconds < MIN_SEGMENT_SECONDS:
+        raise ValueError(f"Segments must be at least {MIN_SEGMENT_SECONDS * 1000:.0f} ms")
+    times = np.array([point[0] for point in points], dtype=float)
+    fractions = np.array([point[1] for point in points], dtype=float)
+    if len(times) < 2 or np.any(np.diff(times) < 0):
+        raise ValueError("A profile needs at least two points in time order")
+    if np.any(fractions < 0):
+        raise ValueError("Fractions cannot be negative")
+    sums = fractions.sum(axis=1, keepdims=True)
+    if np.any(sums <= 0):
+        raise ValueError("Every point needs at least one pump with a positive fraction")
+    fractions = fractions / sums
+    totals = np.broadcast_to(np.asarray(total_flow, dtype=float), times.shape)
+    if np.any(totals < 0):
+        raise ValueError("Total flow cannot be negative")
+
+    start, end = times[0], times[-1]
+    edges = np.union1d(np.arange(start, end, segment_seconds), times)
+    middles = (edges[:-1] + edges[1:]) / 2
+
+    # Sample each segment at its middle; np.interp takes the later side of a step
+    rates = np.empty((fractions.shape[1], len(middles)))
+    flow = np.interp(middles, times, totals)
+    for pump in range(fractions.shape[1]):
+        rates[pump] = np.interp(middles, times, fractions[:, pump]) * flow
+    return FlowProfile(edges - start, rates)
+
+
+def compile_gradient(total_flow, duration_s, start_fractions, end_fractions,
+                     hold_start_s=0.0, hold_end_s=0.0, segment_seconds=DEFAULT_SEGMENT_SECONDS):
+    """
+    Compile a linear gradient, e.g. 100% A -> 100% B.
+
+    Args:
+        total_flow: Combined flow in mL/min
+        duration_s: Length of the ramp in seconds
+        start_fractions: Composition at the start of the ramp, one value per pump
+        end_fractions: Composition at the end of the ramp
+        hold_start_s: Seconds to hold the start composition first
+        hold_end_s: Seconds to hold the end composition afterwards
+        segment_seconds: Segment length
+
+    Returns:
+        FlowProfile
+    """
+    points = [(0.0, start_fractions)]
+    if hold_start_s > 0:
+        points.append((hold_start_s, start_fractions))
+    points.append((hold_start_s + duration_s, end_fractions))
+    if hold_end_s > 0:
+        points.append((hold_start_s + duration_s + hold_end_s, end_fractions))
+    return compile_profile(points, total_flow, segment_seconds)
+
+
+class ProfileRunner:
+    """
+    Runs a FlowProfile on a set of pump windows.
+    """
+
+    def __init__(self, pumps, profile, lookahead=DEFAULT_LOOKAHEAD):
+        """
+        Initialize the runner.
+
+        Args:
+            pumps: PumpWindows, one per profile row
+            profile: FlowProfile
+            lookahead: Segments kept queued on each Arduino
+        """
+        if len(pumps) != profile.pump_count:
+            raise ValueError(f"The profile has {profile.pump_count} pumps, got {len(pumps)}")
+        self.pumps = pumps
+        self.profile = profile
+        self.lookahead = lookahead
+        self.commands = [profile.segment_commands(i) for i in range(len(pumps))]
+        self.volumes = profile.volumes()
+
+        self.lock = threading.Lock()
+        self.sent = [0] * len(pumps)
+        self.started = [0] * len(pumps)
+        self.segment_times = [[] for _ in pumps]    # (perf_counter, segment index)
+        self.samples = [[] for _ in pumps]          # (perf_counter, position in steps)
+        self.start_positions = [None] * len(pumps)
+        self.done = [False] * len(pumps)
+        self.underruns = 0
+        self.listeners = []
+        self.finished = threading.Event()
+
+    def start(self):
+        """
+        Check the pumps, queue the first segments and start every pump.
+
+        Raises:
+            ValueError: A pump is not ready, has nothing to deliver or cannot
+                reach one of its rates, or its DISPENSE could not be sent
+                (the pumps already started are cancelled then)
+            SyringeLimitError: A pump's syringe cannot deliver its volume
+        """
+        targets = []
+        for pump, volume in zip(self.pumps, self.volumes):
+            if not pump.is_connected or pump.is_dispensing:
+                raise ValueError(f"{pump.name} is not connected and idle")
+            if volume <= 0:
+                raise ValueError(f"{pump.name} delivers nothing in this profile")
+            fastest = float(self.profile.rates[len(targets)].max())
+            if fastest > pump.profile.max_rate:
+                raise ValueError(f"{pump.name} needs {fastest:.2f} mL/min, above its maximum "
+                                 f"of {pump.profile.max_rate:.2f} mL/min")
+            targets.append(pump.syringe.check_dispense(round(float(volume), 4)))
+
+        for i, pump in enumerate(self.pumps):
+            listener = self.make_listener(i)
+            self.listeners.append(listener)
+            pump.add_line_listener(listener)
+            self.start_positions[i] = pump.syringe.position
+            pump.send_command("SEG_CLEAR")
+            with self.lock:
+                self.top_up(i)
+
+        # Back to back so the pumps start within a few ms of each other
+        for i, pump in enumerate(self.pumps):
+            pump.begin_dispense(round(float(self.volumes[i]), 4), self.profile.nominal_rate(i),
+                                track_motion=False)
+            if not pump.is_dispensing:
+                self.abort_start(i)
+                raise ValueError(f"DISPENSE not sent to {pump.name}; gradient not started")
+            pump.dispense_target_position = targets[i]
+
+    def abort_start(self, failed):
+        """Undo a start that failed at pump index failed: cancel the pumps before it"""
+        for i, pump in enumerate(self.pumps):
+            if i < failed:
+                pump.cancel_dispense()
+            else:
+                pump.send_command("SEG_CLEAR")  # segments queued for a dispense that never came
+        self.detach()
+
+    def stop(self):
+        """Cancel every pump in the profile"""
+        for pump in self.pumps:
+            if pump.is_dispensing:
+                pump.cancel_dispense()
+
+    def detach(self):
+        """Stop listening to the pumps (done automatically once every pump has finished)"""
+        for pump, listener in zip(self.pumps, self.listeners):
+            pump.remove_line_listener(listener)
+        self.listeners = []
+
+    def top_up(self, i):
+        """Send segments until lookahead are queued ahead of the running one (lock held)"""
+        commands = self.commands[i]
+        while self.sent[i] < len(commands) and self.sent[i] - self.started[i] < self.lookahead:
+            self.pumps[i].send_command(commands[self.sent[i]])
+            self.sent[i] += 1
+
+    def make_listener(self, i):
+        """Line listener for pump i (runs on its reader thread)"""
+        def on_line(message, received_at):
+            if message.startswith("SEG_START: "):
+                index = int(parse_number(message[11:]))
+                with self.lock:
+                    self.started[i] = index + 1
+                    self.segment_times[i].append((received_at, index))
+                    self.top_up(i)
+            elif message.startswith("PROGRESS_DETAILED:"):
+                parts = message[18:].split(',')
+                if len(parts) >= 8:
+                    with self.lock:
+                        self.samples[i].append((self.pumps[i].telemetry_time(parts, received_at),
+                                                parse_number(parts[6])))
+            elif message == "SEG_UNDERRUN":
+                with self.lock:
+                    if self.sent[i] < len(self.commands[i]):
+                        self.underruns += 1
+                    elif not self.done[i] and self.profile.rates[i, -1] <= 0:
+                        # Profile over, holding at rate 0 a few steps short of the
+                        # target (rounding): end the dispense where it is
+                        self.pumps[i].send_command("CANCEL")
+            elif message in ("DISPENSE_COMPLETE", "DISPENSE_CANCELLED"):
+                finished = False
+                with self.lock:
+                    self.done[i] = True
+                    if message == "DISPENSE_COMPLETE" and self.start_positions[i] is not None:
+                        steps = self.volumes[i] * self.pumps[i].syringe.steps_per_ml
+                        self.samples[i].append((received_at, self.start_positions[i] + steps))
+                    finished = all(self.done)
+                if finished:
+                    self.detach()
+                    self.finished.set()
+        return on_line
+
+    def start_time(self):
+        """perf_counter time the first segment was reported started (earliest pump)"""
+        firsts = [times[0][0] for times in self.segment_times if times]
+        return min(firsts) if firsts else None
+
+    def progress(self):
+        """(segments started, segments total) summed over the pumps"""
+        with self.lock:
+            return sum(self.started), sum(len(commands) for commands in self.commands)
+
+    def start_skew(self):
+        """Spread of the pumps' first-segment reports in seconds (host-observed)"""
+        firsts = [times[0][0] for times in self.segment_times if times]
+        return max(firsts) - min(firsts) if len(firsts) > 1 else 0.0
+
+    def achieved_composition(self, resolution_s=None):
+        """
+        Composition actually delivered, from the telemetry positions.
+
+        Args:
+            resolution_s: Grid spacing (default: the profile's median segment)
+
+        Returns:
+            Dict with 'times' (s from start, grid middles), 'achieved' and
+            'target' (pumps x len(times)), 'delivered' (mL per pump) and
+            'max_error' (largest absolute composition difference), or None
+            before any telemetry arrived
+        """
+        t0 = self.start_time()
+        with self.lock:
+            samples = [list(pump_samples) for pump_samples in self.samples]
+        if t0 is None or not all(samples):
+            return None
+
+        resolution_s = resolution_s or float(np.median(self.profile.durations))
+        end = max(pump_samples[-1][0] for pump_samples in samples) - t0
+        if end < resolution_s:
+            return None
+        grid = np.arange(0.0, end, resolution_s)
+        grid = np.append(grid, end)
+        volumes = np.empty((len(samples), len(grid)))
+        for i, pump_samples in enumerate(samples):
+            data = np.array(pump_samples)
+            start = self.start_positions[i]
+            if start is None:
+                start = data[0, 1]
+            spm = self.pumps[i].syringe.steps_per_ml
+            volumes[i] = np.interp(grid, np.concatenate([[0.0], data[:, 0] - t0]),
+                                   np.concatenate([[0.0], (data[:, 1] - start) / spm]))
+
+        flow = np.diff(volumes, axis=1)
+        total = flow.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            achieved = np.where(total > 0, flow / total, np.nan)
+        middles = (grid[:-1] + grid[1:]) / 2
+        target = self.profile.composition_at(middles)
+        error = np.abs(achieved - target)
+        return {
+            'times': middles,
+            'achieved': achieved,
+            'target': target,
+            'delivered': volumes[:, -1],
+            'max_error': float(np.nanmax(error)) if np.any(np.isfinite(error)) else None,
+        }
+
+    def summary(self):
+        """Text summary of the run so far"""
+        started, total = self.progress()
+        lines = [f"Segments: {started}/{total}, underruns: {self.underruns}, "
+                 f"start skew: {self.start_skew() * 1000:.0f} ms"]
+        result = self.achieved_composition()
+        if result is not None:
+            delivered = ", ".join(f"{pump.name} {volume:.3f}/{target:.3f} mL" for pump, volume, target
+                                  in zip(self.pumps, result['delivered'], self.volumes))
+            lines.append(f"Delivered: {delivered}")
+            if result['max_error'] is not None:
+                lines.append(f"Max composition error: {result['max_error'] * 100:.1f}%")
+        return "\n".join(lines)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Interlock Module
+===============================================
+
+This module contains the InterlockEngine class which checks fleet-wide
+safety rules on every telemetry sample and cancels the pumps that break
+them.
+
+Rules are written one per line, in a file named by PUMP_INTERLOCKS
+(default interlocks.txt in the working directory). Pump names in
+parentheses; no names means every pump:
+
+    # combined flow of the two acid pumps
+    total_flow(Acid 1, Acid 2) <= 20
+    # never both at once
+    exclusive(Acid 1, Base)
+    # everything delivered into the reactor since the manager started
+    vessel(Pump 1, Pump 2) <= 45
+    # keep 0.5 mL in every syringe
+    reserve() >= 0.5
+
+Each rule compiles to a check bound to the pumps it names, and each pump
+keeps a tuple of the checks it takes part in. A PROGRESS_DETAILED line is
+parsed on the reader thread. The pump's flow, delivered volume and
+position are updated, and only that pump's checks run. Sums over a rule's
+pumps are kept as running totals, so a check costs a few comparisons
+whatever the fleet size. A violation writes CANCEL to the offending
+pumps from the reader thread, as the emergency stop does (ahead of their
+writer queues, which are cleared), once the engine lock is released. The
+GUI hears about it afterwards through an 'interlock' pump event. A
+cancelled pump keeps counting towards every rule until it reports
+DISPENSE_CANCELLED, and CANCEL is sent again on each sample that still
+breaks a rule, so a lost or failed CANCEL is retried and the other pumps
+are never checked against totals that leave a moving pump out.
+
+Offending pumps:
+- total_flow: the most recently started pumps, until the rest fit the cap
+- exclusive: every pump but the one that started first
+- vessel: every pump of the rule that is dispensing
+- reserve: the pump whose syringe is low
+
+Samples arrive every report interval, so a dispense can run for one
+interval plus the cancel latency before it is stopped.
+
+Features:
+- Text rules compiled to per-pump checks with running totals
+- Checks on the reader thread on every sample, no GUI round trip
+- Direct CANCEL writes to the offending pumps only
+- Trip count and sample-to-cancel latency
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import os
+import re
+import threading
+import time
+
+from emergency_stop import write_cancel
+from event_bus import PumpEvent
+from pump_window import parse_number
+
+DEFAULT_RULES_FILE = "interlocks.txt"
+
+# Running totals are re-summed before tripping, so rounding never trips a rule
+TOLERANCE = 1e-9
+
+RULE_PATTERN = re.compile(r"^(\w+)\s*\(([^)]*)\)\s*(?:(<=|>=)\s*([-+]?\d*\.?\d+))?$")
+
+# Sample-to-cancel latencies kept for summary()
+LATENCY_HISTORY = 1000
+
+# Field positions in a PROGRESS_DETAILED line
+DISPENSED_FIELD = 1
+SPEED_FIELD = 5
+POSITION_FIELD = 6
+
+
+def rules_file():
+    """Rules file from PUMP_INTERLOCKS (default interlocks.txt)"""
+    return os.environ.get("PUMP_INTERLOCKS", DEFAULT_RULES_FILE)
+
+
+class PumpSlot:
+    """
+    Interlock state of one pump, written under the engine lock.
+
+    Attributes:
+        active: True from "steps_to_move" (DISPENSE accepted) until the
+            dispense ends
+        stopping: True once the interlock has sent CANCEL, until the
+            dispense ends
+        flow: Last reported speed (mL/min)
+        dispensed: Volume of the current dispense so far (mL)
+        delivered: Volume of finished dispenses (mL)
+        checks: Rules this pump takes part in
+    """
+
+    def __init__(self, pump):
+        self.pump = pump
+        self.active = False
+        self.stopping = False
+        self.started = 0.0
+        self.target = 0.0
+        self.flow = 0.0
+        self.dispensed = 0.0
+        self.delivered = 0.0
+        self.position = None
+        self.checks = ()
+
+
+class Rule:
+    """
+    Base class for compiled rules.
+
+    Subclasses keep running totals in update() and return the offending
+    slots from violations().
+    """
+
+    def __init__(self, text, names, limit):
+        """
+        Args:
+            text: Rule as written, for logs
+            names: Pump names, or an empty list for every pump
+            limit: Numeric limit (None for exclusive)
+        """
+        self.text = text
+        self.names = names
+        self.limit = limit
+        self.slots = ()
+        self.trips = 0
+
+    def bind(self, slots_by_name):
+        """
+        Attach the rule to its pumps.
+
+        Args:
+            slots_by_name: Dict of pump name -> PumpSlot
+
+        Returns:
+            Names that matched no pump
+        """
+        if self.names:
+            self.slots = tuple(slots_by_name[name] for name in self.names if name in slots_by_name)
+            missing = [name for name in self.names if name not in slots_by_name]
+        else:
+            self.slots = tuple(slots_by_name.values())
+            missing = []
+        self.reset()
+        return missing
+
+    def reset(self):
+        """Recompute the running totals from the slots"""
+
+    def update(self, slot, d_flow, d_volume):
+        """A slot's flow or volume changed"""
+
+    def violations(self, slot):
+        """Slots to cancel after a sample from slot (empty when the rule holds)"""
+        return ()
+
+
+class TotalFlowRule(Rule):
+    """total_flow(pumps) <= limit mL/min"""
+
+    def reset(self):
+        self.total = sum(slot.flow for slot in self.slots)
+
+    def update(self, slot, d_flow, d_volume):
+        self.total += d_flow
+
+    def violations(self, slot):
+        if self.total <= self.limit + TOLERANCE:
+            return ()
+        self.reset()
+        if self.total <= self.limit + TOLERANCE:
+            return ()
+        # Shed the latest starters until the rest fit
+        offenders = []
+        total = self.total
+        for other in sorted((s for s in self.slots if s.active), key=lambda s: -s.started):
+            if total <= self.limit + TOLERANCE:
+                break
+            offenders.append(other)
+            total -= other.flow
+        return offenders
+
+
+class ExclusiveRule(Rule):
+    """exclusive(pumps): at most one dispensing at a time"""
+
+    def violations(self, slot):
+        active = [other for other in self.slots if other.active]
+        if len(active) < 2:
+            return ()
+        first = min(active, key=lambda s: s.started)
+        return [other for other in active if other is not first]
+
+
+class VesselRule(Rule):
+    """vessel(pumps) <= limit mL delivered in total"""
+
+    def reset(self):
+        self.total = sum(slot.delivered + slot.dispensed for slot in self.slots)
+
+    def update(self, slot, d_flow, d_volume):
+        self.total += d_volume
+
+    def violations(self, slot):
+        if self.total <= self.limit + TOLERANCE:
+            return ()
+        self.reset()
+        if self.total <= self.limit + TOLERANCE:
+            return ()
+        return [other for other in self.slots if other.active]
+
+
+class ReserveRule(Rule):
+    """reserve(pumps) >= limit mL left in each syringe"""
+
+    def violations(self, slot):
+        syringe = slot.pump.syringe
+        if slot.position is None:
+            return ()
+        if (syringe.max_steps - slot.position) / syringe.steps_per_ml < self.limit - TOLERANCE:
+            return (slot,)
+        return ()
+
+
+# Rule name -> (class, comparison it takes)
+RULE_TYPES = {
+    'total_flow': (TotalFlowRule, "<="),
+    'exclusive': (ExclusiveRule, None),
+    'vessel': (VesselRule, "<="),
+    'reserve': (ReserveRule, ">="),
+}
+
+
+def parse_rule(text):
+    """
+    Compile one rule line.
+
+    Args:
+        text: e.g. "total_flow(Pump 1, Pump 2) <= 30"
+
+    Returns:
+        Rule
+
+    Raises:
+        ValueError: Unknown rule or wrong comparison
+    """
+    match = RULE_PATTERN.match(text.strip())
+    if not match:
+        raise ValueError(f"Cannot parse interlock rule: {text!r}")
+    kind, names, comparison, limit = match.groups()
+    if kind not in RULE_TYPES:
+        raise ValueError(f"Unknown interlock rule {kind!r} (use {', '.join(RULE_TYPES)})")
+    rule_class, expected = RULE_TYPES[kind]
+    if comparison != expected:
+        raise ValueError(f"{kind} needs {expected + ' <limit>' if expected else 'no limit'}: {text!r}")
+    names = [name.strip() for name in names.split(",") if name.strip()]
+    if rule_class is ExclusiveRule and len(names) < 2:
+        raise ValueError(f"exclusive needs at least two pumps: {text!r}")
+    return rule_class(text.strip(), names, float(limit) if limit is not None else None)
+
+
+def load_rules(path):
+    """
+    Read a rules file (missing file = no rules).
+
+    Returns:
+        List of Rule
+
+    Raises:
+        ValueError: A line does not parse (with its line number)
+    """
+    if not os.path.exists(path):
+        return []
+    rules = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            try:
+                rules.append(parse_rule(line))
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}")
+    return rules
+
+
+class InterlockEngine:
+    """
+    Checks the rules on every telemetry sample of every watched pump.
+    """
+
+    def __init__(self, event_bus, rules=()):
+        """
+        Initialize the engine.
+
+        Args:
+            event_bus: EventBus to publish 'interlock' events on
+            rules: Initial rules
+        """
+        self.event_bus = event_bus
+        self.rules = list(rules)
+        self.slots = {}  # pump_id -> PumpSlot
+        self.listeners = {}
+        self.lock = threading.Lock()
+        self.trips = 0
+        self.latencies = []  # sample received -> CANCEL written, seconds
+
+    # ----------------- setup (GUI thread) -----------------
+
+    def watch(self, pump):
+        """Start checking a pump window's samples"""
+        slot = PumpSlot(pump)
+        listener = lambda message, received_at: self.on_line(slot, message, received_at)
+        with self.lock:
+            self.slots[pump.pump_id] = slot
+            self.listeners[pump.pump_id] = listener
+        pump.add_line_listener(listener)
+        return self.compile()
+
+    def unwatch(self, pump):
+        """Stop checking a pump window"""
+        listener = self.listeners.pop(pump.pump_id, None)
+        if listener is not None:
+            pump.remove_line_listener(listener)
+        with self.lock:
+            self.slots.pop(pump.pump_id, None)
+        return self.compile()
+
+    def set_rules(self, rules):
+        """Replace the rules"""
+        self.rules = list(rules)
+        return self.compile()
+
+    def compile(self):
+        """
+        Bind the rules to the current pumps (after adding, renaming or
+        closing one).
+
+        Returns:
+            Rule text -> pump names that matched no pump
+        """
+        missing = {}
+        with self.lock:
+            slots_by_name = {slot.pump.name: slot for slot in self.slots.values()}
+            checks = {slot: [] for slot in self.slots.values()}
+            for rule in self.rules:
+                unknown = rule.bind(slots_by_name)
+                if unknown:
+                    missing[rule.text] = unknown
+                for slot in rule.slots:
+                    checks[slot].append(rule)
+            for slot, rules in checks.items():
+                slot.checks = tuple(rules)
+        return missing
+
+    # ----------------- samples (reader threads) -----------------
+
+    def on_line(self, slot, message, received_at):
+        """Line listener: track the pump's dispense and check its rules"""
+        if not slot.checks:
+            return
+        if message.startswith("PROGRESS_DETAILED:"):
+            if not slot.active:
+                return
+            parts = message[18:].split(',')
+            try:
+                dispensed = parse_number(parts[DISPENSED_FIELD])
+                flow = parse_number(parts[SPEED_FIELD])
+                position = parse_number(parts[POSITION_FIELD])
+            except (ValueError, IndexError):
+                return
+            tripped = []
+            with self.lock:
+                if not slot.active:
+                    return
+                self.change(slot, flow, dispensed)
+                slot.position = position
+                for rule in slot.checks:
+                    offenders = rule.violations(slot)
+                    if offenders:
+                        tripped.append((rule, self.trip(rule, offenders)))
+            for rule, cancels in tripped:
+                self.cancel(rule, cancels, received_at)
+        elif message.startswith("steps_to_move = "):
+            with self.lock:
+                # A dispense whose end was never reported still counts as delivered
+                self.change(slot, 0.0, 0.0, slot.dispensed)
+                slot.active = True
+                slot.stopping = False
+                slot.started = received_at
+                try:
+                    slot.target = parse_number(message[16:]) / slot.pump.syringe.steps_per_ml
+                except ValueError:
+                    slot.target = 0.0
+        elif message in ("DISPENSE_COMPLETE", "DISPENSE_CANCELLED"):
+            with self.lock:
+                final = slot.target if message == "DISPENSE_COMPLETE" else slot.dispensed
+                self.change(slot, 0.0, 0.0, final)
+                slot.active = False
+                slot.stopping = False
+
+    def change(self, slot, flow, dispensed, finished=0.0):
+        """Update a slot and the running totals of its rules (engine lock held)"""
+        d_flow = flow - slot.flow
+        d_volume = dispensed + finished - slot.dispensed
+        slot.flow = flow
+        slot.dispensed = dispensed
+        slot.delivered += finished
+        for rule in slot.checks:
+            rule.update(slot, d_flow, d_volume)
+
+    def trip(self, rule, offenders):
+        """
+        Mark the offending pumps as stopping (engine lock held).
+
+        They stay active, with their last flow and volume, until they
+        report the end of the dispense.
+
+        Returns:
+            List of (PumpWindow, first) to cancel once the lock is released;
+            first is False when the pump was already sent CANCEL
+        """
+        cancels = [(slot.pump, not slot.stopping) for slot in offenders]
+        for slot in offenders:
+            slot.stopping = True
+        if any(first for _, first in cancels):
+            rule.trips += 1
+            self.trips += 1
+        return cancels
+
+    def cancel(self, rule, cancels, received_at):
+        """
+        Write CANCEL to tripped pumps and report it (engine lock not held).
+
+        A pump that was already sent CANCEL gets it again, and is reported
+        again only if the write fails.
+        """
+        for pump, first in cancels:
+            error = None
+            try:
+                write_cancel(pump)
+            except Exception as e:
+                error = str(e)
+            if first:
+                self.latencies.append(time.perf_counter() - received_at)
+                del self.latencies[:-LATENCY_HISTORY]
+            if first or error:
+                self.event_bus.publish(PumpEvent('interlock', pump.pump_id, pump.name,
+                                                 {'rule': rule.text, 'error': error}))
+
+    def summary(self):
+        """One-line summary for the system log"""
+        text = f"Interlocks: {len(self.rules)} rule(s), {self.trips} trip(s)"
+        if self.latencies:
+            text += f", last sample-to-cancel {self.latencies[-1] * 1e6:.0f} us"
+        return text
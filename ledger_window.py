@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Ledger Window Module
+===================================================
+
+This module contains the LedgerWindow class which shows dispense ledger
+totals per pump, per syringe or per day, and the most recent entries.
+
+Features:
+- Totals grouped by pump, syringe or day over a date range
+- Recent ledger entries
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import datetime
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+from log_store import parse_time
+from dispense_ledger import ledger_day
+
+GROUP_CHOICES = ("pump", "syringe", "day")
+
+
+class LedgerWindow:
+    """
+    Aggregate view over a DispenseLedger.
+    """
+
+    def __init__(self, ledger):
+        """
+        Initialize the ledger window.
+
+        Args:
+            ledger: DispenseLedger to query
+        """
+        self.ledger = ledger
+        self.create_window()
+        self.refresh()
+
+    def create_window(self):
+        """Create the ledger window"""
+        self.window = tk.Toplevel()
+        self.window.title("Dispense Ledger")
+        self.window.geometry("760x520")
+
+        main_frame = ttk.Frame(self.window, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        filter_frame = ttk.LabelFrame(main_frame, text="Totals", padding=10)
+        filter_frame.pack(fill="x")
+
+        ttk.Label(filter_frame, text="Group by:").grid(row=0, column=0, sticky="w")
+        self.group_var = tk.StringVar(value="pump")
+        ttk.Combobox(filter_frame, textvariable=self.group_var, values=GROUP_CHOICES,
+                     state="readonly", width=10).grid(row=0, column=1, padx=5)
+
+        ttk.Label(filter_frame, text="From:").grid(row=0, column=2, sticky="w", padx=(15, 0))
+        self.start_var = tk.StringVar(value="")
+        ttk.Entry(filter_frame, textvariable=self.start_var, width=14).grid(row=0, column=3, padx=5)
+
+        ttk.Label(filter_frame, text="To:").grid(row=0, column=4, sticky="w", padx=(15, 0))
+        self.end_var = tk.StringVar(value="today")
+        ttk.Entry(filter_frame, textvariable=self.end_var, width=14).grid(row=0, column=5, padx=5)
+
+        ttk.Button(filter_frame, text="Refresh", command=self.refresh).grid(row=0, column=6, padx=10)
+
+        columns = ("Key", "Dispenses", "Completed", "Cancelled", "Interrupted",
+                   "Commanded (mL)", "Delivered (mL)")
+        self.totals_tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=8)
+        for column, width in zip(columns, (160, 80, 80, 80, 85, 110, 110)):
+            self.totals_tree.heading(column, text=column)
+            self.totals_tree.column(column, width=width)
+        self.totals_tree.pack(fill="x", pady=10)
+
+        history_frame = ttk.LabelFrame(main_frame, text="Recent Entries", padding=5)
+        history_frame.pack(fill="both", expand=True)
+
+        columns = ("Time", "Pump", "Syringe", "Event", "Commanded", "Delivered", "Rate")
+        self.history_tree = ttk.Treeview(history_frame, columns=columns, show="headings")
+        for column, width in zip(columns, (140, 110, 100, 80, 90, 90, 80)):
+            self.history_tree.heading(column, text=column)
+            self.history_tree.column(column, width=width)
+        history_scroll = ttk.Scrollbar(history_frame, orient="vertical",
+                                       command=self.history_tree.yview)
+        self.history_tree.configure(yscrollcommand=history_scroll.set)
+        self.history_tree.pack(side="left", fill="both", expand=True)
+        history_scroll.pack(side="right", fill="y")
+
+    def parse_day(self, text):
+        """Day string for a date entry ("" = unbounded)"""
+        ts = parse_time(text)
+        return None if ts is None else ledger_day(ts)
+
+    def refresh(self):
+        """Re-run the aggregate and history queries"""
+        try:
+            start_day = self.parse_day(self.start_var.get())
+            end_day = self.parse_day(self.end_var.get())
+        except ValueError:
+            messagebox.showerror("Invalid Date",
+                                 "Use YYYY-MM-DD, today, yesterday or a weekday name")
+            return
+
+        self.totals_tree.delete(*self.totals_tree.get_children())
+        for key, *counts, commanded, delivered in self.ledger.totals(
+                self.group_var.get(), start_day, end_day):
+            self.totals_tree.insert("", "end", values=(key or "-", *counts,
+                                                       f"{commanded:.3f}", f"{delivered:.3f}"))
+
+        self.history_tree.delete(*self.history_tree.get_children())
+        for ts, pump_name, syringe, event, commanded, delivered, rate in self.ledger.history():
+            stamp = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+            self.history_tree.insert("", "end", values=(
+                stamp, pump_name or "-", syringe or "-", event,
+                "" if commanded is None else f"{commanded:.3f}",
+                "" if delivered is None else f"{delivered:.3f}",
+                "" if rate is None else f"{rate:g}"))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Line Framer Module
+=================================================
+
+This module contains the LineFramer class which turns the raw bytes read
+from a pump's serial port into complete text lines.
+
+The reader threads used to call readline() and decode() each result. On
+a read timeout readline() returns whatever has arrived, so half a line
+could be handled as a message and the rest as another. A non-UTF-8 byte
+(electrical noise, or the garbage an Arduino prints while it resets)
+raised inside decode() and killed the reader thread. The readers now read
+whatever is waiting and feed it to a LineFramer, which:
+
+- keeps an incomplete line until its newline arrives
+- accepts only printable ASCII, which is all the firmware prints
+- salvages the clean text after noise at the start of a line
+  (e.g. "\\xff\\x00Ready for DISPENSE...") when it starts like a message
+- drops lines longer than MAX_LINE_LENGTH, and skips to the next newline
+  when noise never ends one
+
+Dropped frames are counted, and the metrics endpoint exports the counts.
+The protocol has no checksums, so a corrupted byte that is still
+printable cannot be detected here. The handlers ignore lines they do not
+recognise.
+
+Features:
+- Reassembly across reads of any size
+- Bounded line length with resync at the next newline
+- Never raises on bad input
+- Counters for lines, malformed, salvaged and oversized frames
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+# Longest firmware line is CONFIG (~180 chars) plus a bus address prefix
+MAX_LINE_LENGTH = 256
+
+# A salvaged tail must be at least this long and start like a message
+MIN_SALVAGE_LENGTH = 3
+
+# Everything the firmware prints: printable ASCII
+PRINTABLE = bytes(range(0x20, 0x7f))
+
+
+class LineFramer:
+    """
+    Byte stream to lines, for one reader thread.
+
+    Attributes:
+        lines: Lines returned
+        malformed: Frames dropped for bytes that are not printable ASCII
+        salvaged: Frames whose clean tail was kept after leading noise
+        oversized: Frames dropped for exceeding max_length
+        bytes_received: Bytes fed
+    """
+
+    def __init__(self, max_length=MAX_LINE_LENGTH):
+        """
+        Initialize the framer.
+
+        Args:
+            max_length: Longest accepted line in bytes, without the line ending
+        """
+        self.max_length = max_length
+        self.buffer = bytearray()
+        self.discarding = False
+        self.lines = 0
+        self.malformed = 0
+        self.salvaged = 0
+        self.oversized = 0
+        self.bytes_received = 0
+
+    def reset(self):
+        """Forget a partial line (new connection); the counters are kept"""
+        self.buffer.clear()
+        self.discarding = False
+
+    def feed(self, data):
+        """
+        Add received bytes.
+
+        Args:
+            data: bytes of any length, possibly empty
+
+        Returns:
+            List of complete lines (str, stripped), oldest first
+        """
+        self.bytes_received += len(data)
+        buffer = self.buffer
+        buffer += data
+        lines = []
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            frame = bytes(buffer[start:end])
+            start = end + 1
+            if self.discarding:
+                # Rest of a line already counted as oversized
+                self.discarding = False
+                continue
+            line = self.decode(frame)
+            if line:
+                lines.append(line)
+        if start:
+            del buffer[:start]
+        if len(buffer) > self.max_length:
+            self.oversized += 1
+            buffer.clear()
+            self.discarding = True
+        return lines
+
+    def decode(self, frame):
+        """
+        Check one frame (without its newline).
+
+        Returns:
+            The line, or None if it is empty or was dropped
+        """
+        if len(frame) > self.max_length:
+            self.oversized += 1
+            return None
+        frame = frame.strip()
+        if not frame:
+            return None
+        if frame.isascii():
+            line = frame.decode("ascii")
+            if line.isprintable():
+                self.lines += 1
+                return line
+        # Noise: keep the clean tail if it looks like the start of a message
+        tail = frame[len(frame.rstrip(PRINTABLE)):].strip()
+        if len(tail) >= MIN_SALVAGE_LENGTH and (tail[:1].isalpha() or tail[:1] == b"@"):
+            self.salvaged += 1
+            self.lines += 1
+            return tail.decode("ascii")
+        self.malformed += 1
+        return None
+
+    @property
+    def dropped(self):
+        """Frames dropped as malformed or oversized"""
+        return self.malformed + self.oversized
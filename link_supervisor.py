@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Link Supervisor Module
+=====================================================
+
+This module contains the LinkSupervisor class which reopens a pump's
+serial port after a read or write error, and the reconciliation of a
+dispense that was running when the link died.
+
+A USB glitch used to leave the pump window marked connected with no
+reader thread. Now the window hands the dead link to a LinkSupervisor,
+which retries with exponential backoff on a background thread. When the
+port is back the window asks for STATUS and GET_POS and reconcile_dispense()
+decides whether the dispense is still running, finished while the link
+was down, or was cut short (usually because reopening the port reset the
+Arduino) and how much of it was delivered.
+
+Features:
+- Reconnect with exponential backoff, off the GUI thread
+- In-flight dispense reconciliation from the reported position
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import queue
+import threading
+import time
+
+# Seconds between reconnect attempts; the last delay repeats until cancelled
+RECONNECT_DELAYS = (0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0)
+
+# Dispensed volume within this of the commanded volume counts as complete (mL)
+COMPLETE_TOLERANCE_ML = 0.001
+
+OUTCOME_CONTINUING = "continuing"
+OUTCOME_COMPLETED = "completed"
+OUTCOME_INTERRUPTED = "interrupted"
+
+
+class LinkSupervisor:
+    """
+    Reopens a dead serial link on a background thread.
+    """
+
+    def __init__(self, open_port, port, delays=RECONNECT_DELAYS):
+        """
+        Initialize the supervisor.
+
+        Args:
+            open_port: Function opening a port by name; raises on failure
+            port: Port to reopen
+            delays: Seconds to wait before each retry
+        """
+        self.open_port = open_port
+        self.port = port
+        self.delays = delays
+        self.attempts = 0
+        self.last_error = None
+        self.lost_at = time.monotonic()
+        self.cancelled = threading.Event()
+        self.results = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        """Start retrying"""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        """Stop retrying (a connection opened meanwhile is closed)"""
+        self.cancelled.set()
+
+    def result(self):
+        """
+        Poll for the reopened connection (GUI thread).
+
+        Returns:
+            Open connection, or None while still retrying
+        """
+        try:
+            return self.results.get_nowait()
+        except queue.Empty:
+            return None
+
+    @property
+    def downtime(self):
+        """Seconds since the link was lost"""
+        return time.monotonic() - self.lost_at
+
+    def _run(self):
+        delay_index = 0
+        while not self.cancelled.is_set():
+            self.attempts += 1
+            try:
+                connection = self.open_port(self.port)
+            except Exception as e:
+                self.last_error = e
+                delay = self.delays[min(delay_index, len(self.delays) - 1)]
+                delay_index += 1
+                self.cancelled.wait(delay)
+                continue
+            if self.cancelled.is_set():
+                connection.close()
+            else:
+                self.results.put(connection)
+            return
+
+
+def reconcile_dispense(inflight, still_dispensing, position, steps_per_ml):
+    """
+    Decide what happened to a dispense while the link was down.
+
+    Args:
+        inflight: Dict with 'volume', 'rate' and 'start_position' (steps)
+            of the dispense that was running when the link died
+        still_dispensing: Whether the Arduino reports DISPENSING now
+        position: Plunger position now (steps), or None if it cannot be
+            trusted (the Arduino reset during the dispense)
+        steps_per_ml: Steps per mL
+
+    Returns:
+        Dict with 'outcome' (continuing, completed or interrupted),
+        'dispensed' and 'remaining' in mL
+    """
+    if still_dispensing:
+        outcome = OUTCOME_CONTINUING
+        dispensed = None
+    elif position is None or inflight['start_position'] is None:
+        # Nothing to measure with; assume the worst and deliver nothing more
+        outcome = OUTCOME_INTERRUPTED
+        dispensed = None
+    else:
+        dispensed = (position - inflight['start_position']) / steps_per_ml
+        dispensed = min(inflight['volume'], max(0.0, dispensed))
+        if inflight['volume'] - dispensed <= COMPLETE_TOLERANCE_ML:
+            outcome = OUTCOME_COMPLETED
+        else:
+            outcome = OUTCOME_INTERRUPTED
+
+    remaining = None if dispensed is None else inflight['volume'] - dispensed
+    return {'outcome': outcome, 'dispensed': dispensed, 'remaining': remaining}
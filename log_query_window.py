@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Log Query Window Module
+======================================================
+
+This module contains the LogQueryWindow class which searches the indexed
+log store by pump, time range and event type.
+
+Features:
+- Pump and event-type filters
+- Time ranges such as "tuesday" to "tuesday" or "2026-10-13 14:00" to "now"
+- Query timing shown with the results
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import datetime
+import time
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+from log_store import parse_time, DEFAULT_QUERY_LIMIT
+
+ALL_PUMPS = "All pumps"
+
+
+class LogQueryWindow:
+    """
+    Search panel over a LogStore.
+    """
+
+    def __init__(self, log_store):
+        """
+        Initialize the query window.
+
+        Args:
+            log_store: LogStore to search
+        """
+        self.log_store = log_store
+        self.pump_ids = {}  # display name: pump_id
+        self.create_window()
+        self.refresh_filters()
+
+    def create_window(self):
+        """Create the query window"""
+        self.window = tk.Toplevel()
+        self.window.title("Log Search")
+        self.window.geometry("800x500")
+
+        main_frame = ttk.Frame(self.window, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        # Filters
+        filter_frame = ttk.LabelFrame(main_frame, text="Filters", padding=10)
+        filter_frame.pack(fill="x")
+
+        ttk.Label(filter_frame, text="Pump:").grid(row=0, column=0, sticky="w")
+        self.pump_var = tk.StringVar(value=ALL_PUMPS)
+        self.pump_combo = ttk.Combobox(filter_frame, textvariable=self.pump_var,
+                                       state="readonly", width=20)
+        self.pump_combo.grid(row=0, column=1, padx=5, sticky="w")
+
+        ttk.Label(filter_frame, text="Event types:").grid(row=0, column=2, sticky="w", padx=(15, 0))
+        self.kinds_var = tk.StringVar(value="ERROR, CANCEL, DISPENSE_CANCELLED")
+        ttk.Entry(filter_frame, textvariable=self.kinds_var, width=35).grid(row=0, column=3, padx=5)
+
+        ttk.Label(filter_frame, text="From:").grid(row=1, column=0, sticky="w", pady=(5, 0))
+        self.start_var = tk.StringVar(value="today")
+        ttk.Entry(filter_frame, textvariable=self.start_var, width=22).grid(
+            row=1, column=1, padx=5, pady=(5, 0), sticky="w")
+
+        ttk.Label(filter_frame, text="To:").grid(row=1, column=2, sticky="w", padx=(15, 0), pady=(5, 0))
+        self.end_var = tk.StringVar(value="now")
+        ttk.Entry(filter_frame, textvariable=self.end_var, width=22).grid(
+            row=1, column=3, padx=5, pady=(5, 0), sticky="w")
+
+        search_btn = ttk.Button(filter_frame, text="Search", command=self.search)
+        search_btn.grid(row=0, column=4, rowspan=2, padx=10)
+
+        self.kinds_hint_var = tk.StringVar()
+        ttk.Label(filter_frame, textvariable=self.kinds_hint_var, foreground="gray").grid(
+            row=2, column=0, columnspan=5, sticky="w", pady=(5, 0))
+
+        # Results
+        results_frame = ttk.Frame(main_frame)
+        results_frame.pack(fill="both", expand=True, pady=10)
+
+        columns = ("Time", "Pump", "Type", "Message")
+        self.results_tree = ttk.Treeview(results_frame, columns=columns, show="headings")
+        for column, width in zip(columns, (150, 110, 140, 380)):
+            self.results_tree.heading(column, text=column)
+            self.results_tree.column(column, width=width)
+
+        results_scroll = ttk.Scrollbar(results_frame, orient="vertical",
+                                       command=self.results_tree.yview)
+        self.results_tree.configure(yscrollcommand=results_scroll.set)
+        self.results_tree.pack(side="left", fill="both", expand=True)
+        results_scroll.pack(side="right", fill="y")
+
+        self.summary_var = tk.StringVar(value="")
+        ttk.Label(main_frame, textvariable=self.summary_var).pack(anchor="w")
+
+        self.window.bind('<Return>', lambda event: self.search())
+
+    def refresh_filters(self):
+        """Load the pump names and event types known to the store"""
+        self.pump_ids = {name or pump_id: pump_id for pump_id, name in self.log_store.pumps()}
+        self.pump_combo['values'] = [ALL_PUMPS] + sorted(self.pump_ids)
+        self.kinds_hint_var.set("Known types: " + ", ".join(self.log_store.kinds()))
+
+    def search(self):
+        """Run the query and show the results"""
+        try:
+            start = parse_time(self.start_var.get())
+            end = parse_time(self.end_var.get(), end=True)
+        except ValueError:
+            messagebox.showerror("Invalid Time",
+                                 "Use YYYY-MM-DD [HH:MM], today, yesterday, now or a weekday name")
+            return
+
+        pump_name = self.pump_var.get()
+        pump_ids = [self.pump_ids[pump_name]] if pump_name in self.pump_ids else None
+        kinds = [kind.strip().upper() for kind in self.kinds_var.get().split(",") if kind.strip()]
+
+        started = time.perf_counter()
+        rows = self.log_store.query(pump_ids, kinds or None, start, end)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self.results_tree.delete(*self.results_tree.get_children())
+        for ts, pump_id, name, direction, kind, message in rows:
+            stamp = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+            self.results_tree.insert("", "end", values=(stamp, name or "-", kind, message))
+
+        limited = " (limit reached)" if len(rows) >= DEFAULT_QUERY_LIMIT else ""
+        self.summary_var.set(f"{len(rows)} events{limited} in {elapsed_ms:.1f} ms")
+        self.refresh_filters()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Log Store Module
+===============================================
+
+This module contains the LogStore class which persists every log event in
+an indexed SQLite database, so a run can be searched instead of scrolled.
+
+The store is a consumer of the logging pipeline (pump_logging.py). Records
+are handed to a writer thread that inserts them in batched transactions;
+the database runs in WAL mode so queries from the GUI never wait for it.
+
+Features:
+- Events keyed by pump, timestamp and parsed message type
+- Batched inserts off the GUI thread
+- Indexed queries by pump, time range and event type
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import datetime
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from pump_logging import DEFAULT_LOG_DIR
+
+STORE_FILE_NAME = "pumps.sqlite3"
+
+BATCH_SIZE = 500
+BATCH_INTERVAL = 0.5  # seconds
+
+DEFAULT_QUERY_LIMIT = 1000
+
+# Message type: leading upper-case token of the payload, e.g. DISPENSE_COMPLETE
+KIND_PATTERN = re.compile(r"([A-Z][A-Z_]*)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    mono REAL,
+    level TEXT,
+    source TEXT,
+    pump_id TEXT,
+    direction TEXT,
+    kind TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_pump_kind_ts ON events (pump_id, kind, ts);
+CREATE INDEX IF NOT EXISTS idx_events_pump_ts ON events (pump_id, ts);
+CREATE INDEX IF NOT EXISTS idx_events_kind_ts ON events (kind, ts);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS pumps (pump_id TEXT PRIMARY KEY, name TEXT);
+CREATE TABLE IF NOT EXISTS kinds (kind TEXT PRIMARY KEY);
+"""
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def classify_message(message):
+    """
+    Split a log message into (direction, kind).
+
+    "Received: DISPENSE_COMPLETE" -> ("rx", "DISPENSE_COMPLETE")
+    "Sent: CANCEL"                -> ("tx", "CANCEL")
+    "Connected to COM3"           -> (None, "LOG")
+    """
+    direction = None
+    payload = message
+    if message.startswith("Received: "):
+        direction, payload = "rx", message[10:]
+    elif message.startswith("Sent: "):
+        direction, payload = "tx", message[6:]
+    match = KIND_PATTERN.match(payload)
+    if direction and match:
+        return direction, match.group(1)
+    return direction, "LOG"
+
+
+def parse_time(text, end=False):
+    """
+    Parse a query time into a Unix timestamp.
+
+    Accepts "YYYY-MM-DD", "YYYY-MM-DD HH:MM[:SS]", "now", "today",
+    "yesterday" and weekday names (the most recent past one, so "tuesday"
+    means last Tuesday). With end=True a bare day means the end of that day.
+
+    Returns:
+        Unix timestamp, or None for an empty string
+    """
+    text = text.strip().lower()
+    if not text:
+        return None
+    if text == "now":
+        return time.time()
+
+    today = datetime.date.today()
+    day = None
+    if text == "today":
+        day = today
+    elif text == "yesterday":
+        day = today - datetime.timedelta(days=1)
+    elif text.removeprefix("last ") in WEEKDAYS:
+        days_back = (today.weekday() - WEEKDAYS.index(text.removeprefix("last "))) % 7 or 7
+        day = today - datetime.timedelta(days=days_back)
+
+    if day is None:
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+            try:
+                return datetime.datetime.strptime(text, fmt).timestamp()
+            except ValueError:
+                pass
+        day = datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+    if end:
+        day += datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, datetime.time()).timestamp()
+
+
+class LogStore(logging.Handler):
+    """
+    Logging consumer that stores records in SQLite and answers queries.
+    """
+
+    def __init__(self, path=None):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: Database file (default logs/pumps.sqlite3)
+        """
+        super().__init__()
+        self.path = path or os.path.join(DEFAULT_LOG_DIR, STORE_FILE_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        setup = sqlite3.connect(self.path)
+        setup.execute("PRAGMA journal_mode=WAL")
+        setup.executescript(SCHEMA)
+        setup.commit()
+        setup.close()
+
+        self.records = queue.SimpleQueue()
+        self.pump_names = {}
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+        # Separate connection for queries from the GUI thread
+        self.reader = sqlite3.connect(self.path, check_same_thread=False)
+        self.reader_lock = threading.Lock()
+
+    def emit(self, record):
+        """Queue a record for the writer thread (called on the listener thread)"""
+        self.records.put(record)
+
+    def close(self):
+        """Write what is queued and close the database"""
+        self.records.put(None)
+        self.writer.join(5.0)
+        with self.reader_lock:
+            self.reader.close()
+        super().close()
+
+    def _write_loop(self):
+        """Insert queued records in batched transactions"""
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA synchronous=NORMAL")
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + BATCH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    record = self.records.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    running = False
+                    break
+                batch.append(record)
+            if batch:
+                self._insert(db, batch)
+        db.close()
+
+    def _insert(self, db, batch):
+        rows = []
+        kinds = set()
+        pumps = {}
+        for record in batch:
+            message = record.getMessage()
+            direction, kind = classify_message(message)
+            pump_id = getattr(record, 'pump_id', None)
+            pump_name = getattr(record, 'pump_name', None)
+            if pump_id and self.pump_names.get(pump_id) != pump_name:
+                pumps[pump_id] = pump_name
+            kinds.add(kind)
+            rows.append((record.created, getattr(record, 'mono', None), record.levelname,
+                         getattr(record, 'source', None), pump_id, direction, kind, message))
+        with db:
+            db.executemany("INSERT INTO events (ts, mono, level, source, pump_id, direction, "
+                           "kind, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            db.executemany("INSERT OR IGNORE INTO kinds (kind) VALUES (?)",
+                           [(kind,) for kind in kinds])
+            db.executemany("INSERT OR REPLACE INTO pumps (pump_id, name) VALUES (?, ?)",
+                           list(pumps.items()))
+        self.pump_names.update(pumps)
+
+    # ----------------- queries -----------------
+
+    def pumps(self):
+        """Known pumps as a list of (pump_id, name)"""
+        with self.reader_lock:
+            return self.reader.execute("SELECT pump_id, name FROM pumps ORDER BY name").fetchall()
+
+    def kinds(self):
+        """Known message types"""
+        with self.reader_lock:
+            return [row[0] for row in self.reader.execute("SELECT kind FROM kinds ORDER BY kind")]
+
+    def query(self, pump_ids=None, kinds=None, start=None, end=None, limit=DEFAULT_QUERY_LIMIT):
+        """
+        Find events, newest first.
+
+        Args:
+            pump_ids: Only these pumps (None = all)
+            kinds: Only these message types (None = all)
+            start: Unix timestamp lower bound (inclusive)
+            end: Unix timestamp upper bound (exclusive)
+            limit: Maximum number of rows
+
+        Returns:
+            List of (ts, pump_id, pump_name, direction, kind, message) tuples
+        """
+        clauses = []
+        params = []
+        if pump_ids:
+            clauses.append(f"e.pump_id IN ({','.join('?' * len(pump_ids))})")
+            params.extend(pump_ids)
+        if kinds:
+            clauses.append(f"e.kind IN ({','.join('?' * len(kinds))})")
+            params.extend(kinds)
+        if start is not None:
+            clauses.append("e.ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("e.ts < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # Pick the index explicitly; the planner has no statistics on a live log
+        if pump_ids and kinds:
+            index = "INDEXED BY idx_events_pump_kind_ts"
+        elif pump_ids:
+            index = "INDEXED BY idx_events_pump_ts"
+        elif kinds:
+            index = "INDEXED BY idx_events_kind_ts"
+        else:
+            index = ""
+        sql = (f"SELECT e.ts, e.pump_id, p.name, e.direction, e.kind, e.message FROM events e "
+               f"{index} LEFT JOIN pumps p ON p.pump_id = e.pump_id {where} "
+               f"ORDER BY e.ts DESC LIMIT ?")
+        with self.reader_lock:
+            return self.reader.execute(sql, params + [limit]).fetchall()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Metrics Module
+=============================================
+
+This module exposes fleet metrics as OpenMetrics text on a local HTTP
+endpoint, so the lab's Prometheus can scrape the pumps.
+
+Every metric value has exactly one writer thread: the writer thread counts
+commands and write latency, the reader thread counts lines and device
+errors, the GUI thread measures reader lag and link losses, and an
+event-bus subscriber thread counts dispenses, cancels and volume. A single
+writer can update a plain int or float without a lock, so the hot paths
+only pay an attribute increment. The HTTP thread reads the values when
+scraped (a scrape may see one counter a step ahead of another, which
+Prometheus tolerates). Gauges such as progress and queue depth are read
+from the pump windows at scrape time and cost nothing in between.
+
+Features:
+- Per-pump counters: commands sent, lines received, errors, dispenses,
+  cancels, volume delivered
+- Per-pump gauges: connected, dispensing, progress, flow, queue depths,
+  reader lag
+- Write latency and reader lag histograms
+- Event bus delivered/dropped counters
+- OpenMetrics text over HTTP (GET /metrics), localhost only by default
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from event_bus import DELIVER_THREAD
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9108
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Histogram bucket upper bounds (seconds)
+WRITE_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+READER_LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+# Metric name -> (type, help); per-pump samples come from FleetMetrics.pump_samples
+METRIC_FAMILIES = {
+    'pump_commands_sent': ("counter", "Commands written to the serial port."),
+    'pump_lines_received': ("counter", "Lines read from the serial port."),
+    'pump_device_errors': ("counter", "ERROR replies from the Arduino."),
+    'pump_link_errors': ("counter", "Serial links lost."),
+    'pump_frames_dropped': ("counter", "Received frames dropped as noise or too long."),
+    'pump_dispenses': ("counter", "Dispenses started."),
+    'pump_dispenses_completed': ("counter", "Dispenses completed."),
+    'pump_cancels': ("counter", "Dispenses cancelled."),
+    'pump_dispenses_interrupted': ("counter", "Dispenses interrupted by a link loss."),
+    'pump_volume_delivered_ml': ("counter", "Volume delivered, measured from the plunger position."),
+    'pump_connected': ("gauge", "1 while the pump is connected."),
+    'pump_dispensing': ("gauge", "1 while the pump is dispensing."),
+    'pump_progress_percent': ("gauge", "Progress of the current dispense."),
+    'pump_flow_ml_per_min': ("gauge", "Current flow reported by the Arduino."),
+    'pump_write_queue_depth': ("gauge", "Commands waiting for the writer thread."),
+    'pump_read_queue_depth': ("gauge", "Received lines waiting for the GUI thread."),
+    'pump_reader_lag_last_seconds': ("gauge", "Age of the oldest line at the last GUI drain."),
+    'pump_write_latency_seconds': ("histogram", "Time from queueing a command to writing it."),
+    'pump_reader_lag_seconds': ("histogram", "Time from reading a line to the GUI handling it."),
+}
+
+
+def metrics_port():
+    """Port from PUMP_METRICS_PORT (default 9108); 0 disables the endpoint"""
+    return int(os.environ.get("PUMP_METRICS_PORT", DEFAULT_PORT))
+
+
+class Histogram:
+    """
+    Cumulative histogram for one writer thread.
+    """
+
+    def __init__(self, bounds):
+        """
+        Args:
+            bounds: Increasing bucket upper bounds; +Inf is added
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def buckets(self):
+        """(upper bound text, cumulative count) pairs ending with +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + (float("inf"),), list(self.counts)):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else f"{bound:g}", total))
+        return result
+
+
+class PumpMetrics:
+    """
+    Counters and histograms for one pump window.
+
+    Attributes are grouped by the only thread that writes them.
+    """
+
+    def __init__(self):
+        """Initialize every value to zero"""
+        # Writer thread
+        self.commands_sent = 0
+        self.write_latency = Histogram(WRITE_LATENCY_BUCKETS)
+        # Reader thread
+        self.lines_received = 0
+        self.device_errors = 0
+        self.first_unhandled = None
+        # GUI thread
+        self.link_errors = 0
+        self.reader_lag = 0.0
+        self.reader_lag_histogram = Histogram(READER_LAG_BUCKETS)
+        # Event bus subscriber thread
+        self.dispenses = 0
+        self.completed = 0
+        self.cancels = 0
+        self.interrupted = 0
+        self.volume_delivered = 0.0
+
+    def command_written(self, latency):
+        """Writer thread: a command's bytes left the host"""
+        self.commands_sent += 1
+        self.write_latency.observe(latency)
+
+    def line_received(self, message, received_at):
+        """Line listener (reader thread)"""
+        self.lines_received += 1
+        if message.startswith("ERROR"):
+            self.device_errors += 1
+        if self.first_unhandled is None:
+            self.first_unhandled = received_at
+
+    def draining(self):
+        """
+        GUI thread, before handling queued lines: the oldest one's age is the
+        reader lag.
+        """
+        received_at = self.first_unhandled
+        if received_at is None:
+            return
+        self.first_unhandled = None
+        self.reader_lag = time.perf_counter() - received_at
+        self.reader_lag_histogram.observe(self.reader_lag)
+
+
+def escape_label(value):
+    """Escape a label value for the exposition format"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class FleetMetrics:
+    """
+    Collects the metrics of every pump window and renders them.
+    """
+
+    def __init__(self, pump_windows, event_bus=None):
+        """
+        Initialize the collector.
+
+        Args:
+            pump_windows: Dict of pump_id -> PumpWindow (the manager's, read live)
+            event_bus: EventBus to count dispense events from
+        """
+        self.pump_windows = pump_windows
+        self.event_bus = event_bus
+        self.subscription = None
+        if event_bus is not None:
+            self.subscription = event_bus.subscribe(
+                self.count_event, kinds=('dispense_start', 'dispense_complete',
+                                         'dispense_cancelled', 'dispense_interrupted'),
+                delivery=DELIVER_THREAD, name="metrics")
+
+    def count_event(self, event):
+        """Event bus subscriber thread: dispense counters"""
+        pump = self.pump_windows.get(event.pump_id)
+        if pump is None:
+            return
+        metrics = pump.metrics
+        data = event.data
+        if event.kind == 'dispense_start':
+            metrics.dispenses += 1
+        elif event.kind == 'dispense_complete':
+            metrics.completed += 1
+            metrics.volume_delivered += data['delivered'] or 0.0
+        elif event.kind == 'dispense_cancelled':
+            metrics.cancels += 1
+            metrics.volume_delivered += data['delivered'] or 0.0
+        elif event.kind == 'dispense_interrupted':
+            metrics.interrupted += 1
+            metrics.volume_delivered += data['dispensed'] or 0.0
+
+    def close(self):
+        if self.subscription:
+            self.subscription.close()
+
+    def pump_samples(self, pump):
+        """
+        Current values for one pump.
+
+        Returns:
+            Dict of metric name -> value or Histogram
+        """
+        metrics = pump.metrics
+        writer = pump.serial_writer
+        return {
+            'pump_commands_sent': metrics.commands_sent,
+            'pump_lines_received': metrics.lines_received,
+            'pump_device_errors': metrics.device_errors,
+            'pump_link_errors': metrics.link_errors,
+            'pump_frames_dropped': pump.framer.dropped,
+            'pump_dispenses': metrics.dispenses,
+            'pump_dispenses_completed': metrics.completed,
+            'pump_cancels': metrics.cancels,
+            'pump_dispenses_interrupted': metrics.interrupted,
+            'pump_volume_delivered_ml': metrics.volume_delivered,
+            'pump_connected': int(pump.is_connected),
+            'pump_dispensing': int(pump.is_dispensing),
+            'pump_progress_percent': pump.current_progress if pump.is_dispensing else 0.0,
+            'pump_flow_ml_per_min': pump.current_speed if pump.is_dispensing else 0.0,
+            'pump_write_queue_depth': writer.depth if writer else 0,
+            'pump_read_queue_depth': pump.message_queue.qsize(),
+            'pump_reader_lag_last_seconds': metrics.reader_lag,
+            'pump_write_latency_seconds': metrics.write_latency,
+            'pump_reader_lag_seconds': metrics.reader_lag_histogram,
+        }
+
+    def render(self):
+        """
+        The whole fleet as OpenMetrics text.
+
+        Returns:
+            str ending with "# EOF"
+        """
+        families = {}
+        for pump in list(self.pump_windows.values()):
+            labels = f'pump_id="{escape_label(pump.pump_id)}",pump="{escape_label(pump.name)}"'
+            for name, value in self.pump_samples(pump).items():
+                families.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (metric_type, help_text) in METRIC_FAMILIES.items():
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"# HELP {name} {help_text}")
+            for labels, value in families.get(name, ()):
+                if metric_type == "counter":
+                    lines.append(f"{name}_total{{{labels}}} {value}")
+                elif metric_type == "gauge":
+                    lines.append(f"{name}{{{labels}}} {value}")
+                else:
+                    for bound, count in value.buckets():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f"{name}_sum{{{labels}}} {value.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {value.count}")
+
+        if self.event_bus is not None:
+            subscriptions = self.event_bus.subscriptions
+            for name, attribute, help_text in (
+                    ("pump_events_delivered", "delivered", "Pump events delivered to a subscriber."),
+                    ("pump_events_dropped", "dropped", "Pump events dropped from a full subscriber queue.")):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"# HELP {name} {help_text}")
+                for subscription in subscriptions:
+                    lines.append(f'{name}_total{{subscriber="{escape_label(subscription.name)}"}} '
+                                 f"{getattr(subscription, attribute)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves GET /metrics from the server's FleetMetrics"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.fleet_metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per scrape is noise
+
+
+class MetricsServer:
+    """
+    HTTP endpoint serving FleetMetrics on a background thread.
+    """
+
+    def __init__(self, fleet_metrics, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Bind the endpoint.
+
+        Args:
+            fleet_metrics: FleetMetrics to render
+            host: Interface to bind (localhost by default)
+            port: TCP port (0 picks a free one)
+
+        Raises:
+            OSError: The port is in use
+        """
+        self.fleet_metrics = fleet_metrics
+        self.httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fleet_metrics = fleet_metrics
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-http",
+                                       daemon=True)
+
+    @property
+    def address(self):
+        """(host, port) actually bound"""
+        return self.httpd.server_address
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the port"""
+        if self.thread.is_alive():
+            self.httpd.shutdown()
+        self.httpd.server_close()
+        self.fleet_metrics.close()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Motion Model Module
+==================================================
+
+This module contains the MotionModel class which predicts a dispense
+between telemetry samples.
+
+The firmware drives the stepper with AccelStepper using a trapezoidal
+profile: max speed = rate * steps_per_ml / 60 and acceleration = 2 x max
+speed. Knowing that, the host can extrapolate dispensed volume, ETA and
+position at display rate and only needs 2-5 Hz telemetry to stay correct.
+
+Features:
+- Trapezoid (or triangle, for short moves) position profile
+- Time-shift correction on every real sample
+- Monotonic display values (never jumps backwards)
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import math
+
+# sketch_Final.ino: stepper.setAcceleration(speed_steps_per_sec * 2)
+DEFAULT_ACCEL_FACTOR = 2.0
+
+
+class MotionModel:
+    """
+    Predicted position of one dispense along its AccelStepper trapezoid.
+    """
+
+    def __init__(self, volume, rate, steps_per_ml, start_time, accel_factor=DEFAULT_ACCEL_FACTOR):
+        """
+        Initialize the motion model.
+
+        Args:
+            volume: Commanded volume in mL
+            rate: Commanded rate in mL/min
+            steps_per_ml: Microsteps per mL
+            start_time: time.monotonic() when the move started
+            accel_factor: Acceleration as a multiple of max speed (per second)
+        """
+        self.volume = volume
+        self.steps_per_ml = steps_per_ml
+        self.start_time = start_time
+        self.time_shift = 0.0
+        self.shown_steps = 0.0
+
+        self.distance = max(0.0, volume * steps_per_ml)
+        self.max_speed = rate / 60.0 * steps_per_ml
+        self.accel = self.max_speed * accel_factor
+
+        # Trapezoid, or a triangle if the move is too short to reach max speed
+        ramp_distance = self.max_speed ** 2 / (2 * self.accel) if self.accel > 0 else 0.0
+        if 2 * ramp_distance >= self.distance:
+            self.ramp_time = math.sqrt(self.distance / self.accel) if self.accel > 0 else 0.0
+            self.peak_speed = self.accel * self.ramp_time
+            self.cruise_time = 0.0
+        else:
+            self.ramp_time = self.max_speed / self.accel
+            self.peak_speed = self.max_speed
+            self.cruise_time = (self.distance - 2 * ramp_distance) / self.max_speed
+        self.total_time = 2 * self.ramp_time + self.cruise_time
+
+    def steps_at(self, t):
+        """Steps moved t seconds into the profile"""
+        if t <= 0:
+            return 0.0
+        if t >= self.total_time:
+            return self.distance
+        ramp_distance = 0.5 * self.accel * self.ramp_time ** 2
+        if t < self.ramp_time:
+            return 0.5 * self.accel * t ** 2
+        if t < self.ramp_time + self.cruise_time:
+            return ramp_distance + self.peak_speed * (t - self.ramp_time)
+        remaining = self.total_time - t
+        return self.distance - 0.5 * self.accel * remaining ** 2
+
+    def speed_at(self, t):
+        """Speed in steps/s t seconds into the profile"""
+        if t <= 0 or t >= self.total_time:
+            return 0.0
+        if t < self.ramp_time:
+            return self.accel * t
+        if t < self.ramp_time + self.cruise_time:
+            return self.peak_speed
+        return self.accel * (self.total_time - t)
+
+    def time_for_steps(self, steps):
+        """Inverse of steps_at: seconds into the profile at which steps were moved"""
+        if steps <= 0:
+            return 0.0
+        if steps >= self.distance:
+            return self.total_time
+        ramp_distance = 0.5 * self.accel * self.ramp_time ** 2
+        if steps < ramp_distance:
+            return math.sqrt(2 * steps / self.accel)
+        if steps < ramp_distance + self.peak_speed * self.cruise_time:
+            return self.ramp_time + (steps - ramp_distance) / self.peak_speed
+        return self.total_time - math.sqrt(2 * (self.distance - steps) / self.accel)
+
+    def correct(self, now, dispensed_volume):
+        """
+        Re-anchor the model on a real telemetry sample.
+
+        Args:
+            now: time.monotonic() when the sample arrived
+            dispensed_volume: Dispensed volume reported by the Arduino, in mL
+        """
+        steps = dispensed_volume * self.steps_per_ml
+        self.time_shift = self.time_for_steps(steps) - (now - self.start_time)
+
+    def predict(self, now):
+        """
+        Extrapolate the dispense to the given time.
+
+        Args:
+            now: time.monotonic()
+
+        Returns:
+            Dict with progress (%), dispensed and remaining (mL), elapsed and
+            eta (min), speed (mL/min) and steps moved since the start
+        """
+        t = now - self.start_time + self.time_shift
+        # Corrections may shift the curve back; the display never does
+        self.shown_steps = max(self.shown_steps, self.steps_at(t))
+        dispensed = self.shown_steps / self.steps_per_ml
+        progress = 100.0 * self.shown_steps / self.distance if self.distance > 0 else 100.0
+        return {
+            'progress': progress,
+            'dispensed': dispensed,
+            'remaining': max(0.0, self.volume - dispensed),
+            'elapsed': (now - self.start_time) / 60.0,
+            'eta': max(0.0, self.total_time - t) / 60.0,
+            'speed': self.speed_at(t) / self.steps_per_ml * 60.0,
+            'steps': self.shown_steps,
+        }
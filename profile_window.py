@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Profile Window Module
+===================================================
+
+This module contains the ProfileWindow class which sets up a linear
+gradient across several connected pumps, runs it with ProfileRunner and
+shows the achieved composition against the target.
+
+Features:
+- Pump selection in profile order
+- Start/end composition, hold times, total flow and segment length
+- Live segment progress and composition error
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+from flow_profile import compile_gradient, ProfileRunner, DEFAULT_SEGMENT_SECONDS
+from syringe_model import SyringeLimitError
+
+UPDATE_INTERVAL_MS = 500
+
+
+class ProfileWindow:
+    """
+    Gradient setup and monitoring window.
+    """
+
+    def __init__(self, pump_windows):
+        """
+        Initialize the profile window.
+
+        Args:
+            pump_windows: Dict of pump_id -> PumpWindow to choose from
+        """
+        self.pump_windows = pump_windows
+        self.runner = None
+        self.create_window()
+
+    def create_window(self):
+        """Create the profile window"""
+        self.window = tk.Toplevel()
+        self.window.title("Flow Profile")
+        self.window.geometry("520x560")
+        self.window.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+        main_frame = ttk.Frame(self.window, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        pump_frame = ttk.LabelFrame(main_frame, text="Pumps (in selection order)", padding=10)
+        pump_frame.pack(fill="x")
+        self.pump_list = tk.Listbox(pump_frame, selectmode="multiple", height=5, exportselection=False)
+        self.pump_list.pack(fill="x")
+        self.pump_ids = [pump_id for pump_id, pump in self.pump_windows.items() if pump.is_connected]
+        for pump_id in self.pump_ids:
+            self.pump_list.insert("end", self.pump_windows[pump_id].name)
+
+        settings_frame = ttk.LabelFrame(main_frame, text="Gradient", padding=10)
+        settings_frame.pack(fill="x", pady=10)
+
+        self.start_var = tk.StringVar(value="100, 0")
+        self.end_var = tk.StringVar(value="0, 100")
+        self.flow_var = tk.StringVar(value="1.0")
+        self.duration_var = tk.StringVar(value="60")
+        self.hold_start_var = tk.StringVar(value="0")
+        self.hold_end_var = tk.StringVar(value="0")
+        self.segment_var = tk.StringVar(value=f"{DEFAULT_SEGMENT_SECONDS:g}")
+        fields = (("Start composition (%):", self.start_var),
+                  ("End composition (%):", self.end_var),
+                  ("Total flow (mL/min):", self.flow_var),
+                  ("Ramp duration (s):", self.duration_var),
+                  ("Hold before ramp (s):", self.hold_start_var),
+                  ("Hold after ramp (s):", self.hold_end_var),
+                  ("Segment length (s):", self.segment_var))
+        for row, (label, variable) in enumerate(fields):
+            ttk.Label(settings_frame, text=label).grid(row=row, column=0, sticky="w", pady=2)
+            ttk.Entry(settings_frame, textvariable=variable, width=20).grid(row=row, column=1,
+                                                                            sticky="w", padx=5)
+
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(fill="x")
+        self.preview_btn = ttk.Button(button_frame, text="Preview", command=self.preview)
+        self.preview_btn.pack(side="left")
+        self.start_btn = ttk.Button(button_frame, text="Start", command=self.start)
+        self.start_btn.pack(side="left", padx=5)
+        self.stop_btn = ttk.Button(button_frame, text="Stop", command=self.stop, state="disabled")
+        self.stop_btn.pack(side="left")
+
+        status_frame = ttk.LabelFrame(main_frame, text="Status", padding=10)
+        status_frame.pack(fill="both", expand=True, pady=10)
+        self.status_var = tk.StringVar(value="Select the pumps in the order of the composition values")
+        ttk.Label(status_frame, textvariable=self.status_var, justify="left",
+                  wraplength=470).pack(anchor="w")
+
+    def selected_pumps(self):
+        """Selected PumpWindows in list order"""
+        return [self.pump_windows[self.pump_ids[i]] for i in self.pump_list.curselection()]
+
+    def build_profile(self):
+        """Compile the gradient from the entries (raises ValueError on bad input)"""
+        pumps = self.selected_pumps()
+        start = [float(value) for value in self.start_var.get().split(",")]
+        end = [float(value) for value in self.end_var.get().split(",")]
+        if len(pumps) < 2:
+            raise ValueError("Select at least two pumps")
+        if len(start) != len(pumps) or len(end) != len(pumps):
+            raise ValueError(f"Give one start and one end value per selected pump ({len(pumps)})")
+        profile = compile_gradient(float(self.flow_var.get()), float(self.duration_var.get()),
+                                   start, end, float(self.hold_start_var.get()),
+                                   float(self.hold_end_var.get()), float(self.segment_var.get()))
+        return pumps, profile
+
+    def preview(self):
+        """Show the per-pump volumes the gradient needs"""
+        try:
+            pumps, profile = self.build_profile()
+        except ValueError as e:
+            messagebox.showerror("Invalid Profile", str(e))
+            return
+        volumes = ", ".join(f"{pump.name} {volume:.3f} mL"
+                            for pump, volume in zip(pumps, profile.volumes()))
+        self.status_var.set(f"{profile.rates.shape[1]} segments over {profile.duration:.1f} s\n"
+                            f"Volumes: {volumes}")
+
+    def start(self):
+        """Compile the gradient and start the pumps"""
+        try:
+            pumps, profile = self.build_profile()
+            runner = ProfileRunner(pumps, profile)
+            runner.start()
+        except (ValueError, SyringeLimitError) as e:
+            messagebox.showerror("Cannot Start Profile", str(e))
+            return
+        self.runner = runner
+        self.start_btn.config(state="disabled")
+        self.stop_btn.config(state="normal")
+        self.update_status()
+
+    def stop(self):
+        """Cancel the running profile"""
+        if self.runner:
+            self.runner.stop()
+
+    def update_status(self):
+        """Refresh the status text until the profile finishes"""
+        if not self.runner or not self.window.winfo_exists():
+            return
+        text = self.runner.summary()
+        if self.runner.finished.is_set():
+            self.status_var.set(f"Finished\n{text}")
+            self.runner = None
+            self.start_btn.config(state="normal")
+            self.stop_btn.config(state="disabled")
+            return
+        self.status_var.set(text)
+        self.window.after(UPDATE_INTERVAL_MS, self.update_status)
+
+    def on_closing(self):
+        """Close the window; a running profile keeps streaming its segments"""
+        self.window.destroy()
@@ -0,0 +1,681 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Pump Client Module
+=================================================
+
+This module contains the PumpClient class, a programmatic interface to the
+pumps for scripts and Jupyter notebooks.
+
+dispense() checks and sends the command, then returns a DispenseFuture
+straight away. The future resolves to a DispenseResult when the Arduino
+reports DISPENSE_COMPLETE or DISPENSE_CANCELLED, and fails with a
+CommandError if the Arduino rejects the command. It is a
+concurrent.futures.Future, so a script can block on result(). It is also
+awaitable, so async code can await it or pass several to asyncio.gather.
+Progress callbacks get each PROGRESS_DETAILED sample on the reader thread.
+
+A client either owns its port, or it attaches to a pump window of a
+running manager (PumpManager.client()) and shares that connection. An
+attached client's dispenses go through the window like a button press, so
+the GUI, the ledger and the metrics track them too.
+
+    with connect("COM3") as pump:
+        result = pump.dispense(0.5, 10, on_progress=print).result()
+
+    with connect_all(["SIM1", "SIM2"]) as pumps:
+        results = await asyncio.gather(*(p.dispense(0.2, 5) for p in pumps))
+
+Features:
+- Futures that resolve on DISPENSE_COMPLETE / DISPENSE_CANCELLED
+- Awaitable futures for asyncio.gather across pumps
+- Live progress callbacks
+- Context-managed connections, one pump or a fleet
+- Batch dispense that sends nothing unless every pump accepts
+- Attaching to a running manager's pump windows
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from device_profile import DeviceProfile, CommandError
+from line_framer import LineFramer
+from pump_logging import log_event, SOURCE_PUMP
+from pump_window import open_port, parse_number
+from serial_writer import SerialWriter
+from syringe_model import SyringeLimitError
+
+# Seconds to wait for the CONFIG reply after opening a port
+CONFIG_TIMEOUT = 2.0
+
+# Seconds to wait for the reader thread when closing
+READER_JOIN_TIMEOUT = 1.0
+
+# PROGRESS_DETAILED fields, in order
+PROGRESS_FIELDS = ('progress', 'dispensed', 'remaining', 'elapsed', 'eta', 'speed', 'position')
+
+STATUS_COMPLETE = "complete"
+STATUS_CANCELLED = "cancelled"
+
+
+class DispenseResult:
+    """
+    Outcome of one dispense.
+
+    Attributes:
+        status: STATUS_COMPLETE or STATUS_CANCELLED
+        delivered: mL delivered; the firmware's rounded volume when complete,
+            the last progress sample when cancelled
+        duration: Seconds from sending the command to the completion line
+        warnings: WARNING lines the Arduino printed (e.g. a clamped target)
+    """
+
+    def __init__(self, volume, rate, status, delivered, duration, warnings):
+        self.volume = volume
+        self.rate = rate
+        self.status = status
+        self.delivered = delivered
+        self.duration = duration
+        self.warnings = warnings
+
+    @property
+    def completed(self):
+        return self.status == STATUS_COMPLETE
+
+    def __repr__(self):
+        return (f"DispenseResult({self.status}, {self.delivered:.4f} of {self.volume} mL "
+                f"in {self.duration:.1f} s)")
+
+
+class DispenseFuture(concurrent.futures.Future):
+    """
+    A running dispense.
+
+    Resolves to a DispenseResult. Awaiting it works on any asyncio loop.
+    cancel() stops the pump rather than abandoning the future: it sends
+    CANCEL and returns False, and the future then resolves with
+    STATUS_CANCELLED. asyncio.wait_for() timeouts therefore stop the pump.
+
+    Attributes:
+        progress: Latest progress sample dict (see PROGRESS_FIELDS), or None
+    """
+
+    def __init__(self, client, volume, rate):
+        super().__init__()
+        self.client = client
+        self.volume = volume
+        self.rate = rate
+        self.progress = None
+        self.started = False
+        self.warnings = []
+        self.sent_at = time.monotonic()
+        self.progress_callbacks = []
+
+    def add_progress_callback(self, callback):
+        """
+        Call callback(sample) for every progress sample (reader thread).
+
+        Args:
+            callback: Must be quick; exceptions are logged and ignored
+        """
+        self.progress_callbacks.append(callback)
+
+    def report_progress(self, sample):
+        self.progress = sample
+        for callback in self.progress_callbacks:
+            try:
+                callback(sample)
+            except Exception as e:
+                log_event(f"Progress callback failed: {e}", SOURCE_PUMP, None, self.client.name)
+
+    def finish(self, message):
+        """Resolve from DISPENSE_COMPLETE / DISPENSE_CANCELLED"""
+        if self.done():
+            return  # the client was closed first
+        if message == "DISPENSE_COMPLETE":
+            status = STATUS_COMPLETE
+            delivered = self.client.profile.delivered_volume(self.volume)
+        else:
+            status = STATUS_CANCELLED
+            delivered = self.progress['dispensed'] if self.progress else 0.0
+        self.set_result(DispenseResult(self.volume, self.rate, status, delivered,
+                                       time.monotonic() - self.sent_at, self.warnings))
+
+    def cancel(self):
+        """Stop the pump; the future resolves with STATUS_CANCELLED"""
+        if not self.done():
+            self.client.cancel()
+        return False
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+
+class SerialLink:
+    """
+    A port owned by one client: writer thread, reader thread and profile.
+    """
+
+    def __init__(self, port, on_line, connection=None):
+        """
+        Open the port and read the firmware configuration.
+
+        Args:
+            port: Port name (see pump_window.open_port)
+            on_line: Called on the reader thread with every received line
+            connection: Already open pyserial-compatible connection to use
+                instead of opening port
+
+        Raises:
+            serial.SerialException / OSError: The port could not be opened
+        """
+        self.port = port
+        self.on_line = on_line
+        self.profile = DeviceProfile()
+        self.configured = threading.Event()
+        self.error = None
+        self.framer = LineFramer()
+        self.connection = connection or open_port(port)
+        self.writer = SerialWriter(self.connection,
+                                   lambda error: self.link_failed(f"Write error: {error}"))
+        self.writer.start()
+        self.reader = threading.Thread(target=self.read, name=f"client-{port}", daemon=True)
+        self.reader.start()
+        self.send("GET_CONFIG")
+        self.configured.wait(CONFIG_TIMEOUT)
+
+    def read(self):
+        """Reader thread"""
+        connection = self.connection
+        while self.connection is connection:
+            try:
+                waiting = connection.in_waiting
+                if waiting:
+                    for message in self.framer.feed(connection.read(waiting)):
+                        self.handle_line(message)
+                else:
+                    time.sleep(0.01)
+            except Exception as e:
+                self.link_failed(f"Read error: {e}")
+                return
+
+    def handle_line(self, message):
+        if message.startswith("CONFIG: "):
+            try:
+                self.profile = DeviceProfile.parse(message)
+            except ValueError:
+                pass
+            self.configured.set()
+        elif message.startswith("Ready for DISPENSE"):
+            self.send("GET_CONFIG")  # the Arduino restarted
+        self.on_line(message)
+
+    def link_failed(self, error):
+        """Writer or reader thread: the port failed"""
+        if self.connection is not None:
+            self.error = error
+            self.on_line(error)
+
+    def send(self, command):
+        """
+        Queue a command.
+
+        Raises:
+            CommandError: The firmware would reject it
+            ConnectionError: The link is closed
+        """
+        command = self.profile.validate_command(command)
+        if self.connection is None or not self.writer.send(command):
+            raise ConnectionError(self.error or f"{self.port} is closed")
+
+    def check_dispense(self, volume, rate):
+        self.profile.check_dispense(volume, rate)
+
+    def start_dispense(self, volume, rate, future):
+        self.send(f"DISPENSE:{volume},{rate}")
+
+    def start_retract(self):
+        self.send("RETRACT")
+
+    def close(self):
+        """Stop the threads and close the port"""
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        self.writer.stop()
+        connection.close()
+        if self.reader is not threading.current_thread():
+            self.reader.join(READER_JOIN_TIMEOUT)
+
+
+class WindowLink:
+    """
+    A pump window's connection, shared with the GUI.
+
+    The window's methods run through call_soon, which must run them on the
+    Tk thread (PumpManager.call_on_gui). Lines arrive through a line listener.
+    """
+
+    def __init__(self, pump_window, on_line, call_soon):
+        self.pump_window = pump_window
+        self.port = pump_window.port
+        self.on_line = on_line
+        self.call_soon = call_soon
+        self.listener = lambda message, received_at: on_line(message)
+        pump_window.add_line_listener(self.listener)
+
+    @property
+    def profile(self):
+        return self.pump_window.profile
+
+    def check_ready(self):
+        pump = self.pump_window
+        if not pump.is_connected or pump.serial_writer is None:
+            raise ConnectionError(f"{pump.name} is not connected")
+        if pump.link_supervisor:
+            raise ConnectionError(f"{pump.name} is reconnecting")
+
+    def send(self, command):
+        self.check_ready()
+        self.profile.validate_command(command)
+        self.call_soon(lambda: self.pump_window.send_command(command))
+
+    def check_dispense(self, volume, rate):
+        self.check_ready()
+        pump = self.pump_window
+        if pump.is_dispensing or pump.is_retracting:
+            raise RuntimeError(f"{pump.name} is busy")
+        pump.profile.check_dispense(volume, rate)
+        try:
+            pump.syringe.check_dispense(volume)
+        except SyringeLimitError as e:
+            raise CommandError(str(e))
+
+    def start_dispense(self, volume, rate, future):
+        pump = self.pump_window
+
+        def begin():
+            # The GUI may have started something since check_dispense()
+            if pump.is_dispensing or pump.is_retracting:
+                future.set_exception(RuntimeError(f"{pump.name} is busy"))
+                return
+            try:
+                pump.dispense_target_position = pump.syringe.check_dispense(volume)
+            except SyringeLimitError as e:
+                future.set_exception(CommandError(str(e)))
+                return
+            pump.begin_dispense(volume, rate)
+            if not pump.is_dispensing:
+                future.set_exception(ConnectionError(f"DISPENSE not sent to {pump.name}"))
+
+        self.call_soon(begin)
+
+    def start_retract(self):
+        self.check_ready()
+        self.call_soon(self.pump_window.start_retract)
+
+    def close(self):
+        """Detach; the window keeps the connection"""
+        self.pump_window.remove_line_listener(self.listener)
+
+
+class PumpClient:
+    """
+    Script interface to one pump. Use connect() or PumpManager.client().
+    """
+
+    def __init__(self, name, port=None, pump_window=None, call_soon=None, connection=None):
+        """
+        Open a port, or attach to a pump window.
+
+        Args:
+            name: Name for logs
+            port: Port to open and own (see pump_window.open_port)
+            pump_window: PumpWindow to share instead
+            call_soon: Runs a function on the Tk thread (with pump_window)
+            connection: Open connection to own instead of opening port
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.active = None
+        self.retracting = None
+        self.waiters = []  # (reply prefix, Future)
+        if pump_window is not None:
+            self.link = WindowLink(pump_window, self.handle_line, call_soon or (lambda f: f()))
+        else:
+            self.link = SerialLink(port, self.handle_line, connection)
+
+    @property
+    def profile(self):
+        """The pump's DeviceProfile"""
+        return self.link.profile
+
+    @property
+    def is_busy(self):
+        return self.active is not None or self.retracting is not None
+
+    # ----------------- commands (any thread) -----------------
+
+    def dispense(self, volume, rate, on_progress=None):
+        """
+        Start a dispense.
+
+        Args:
+            volume: Volume in mL
+            rate: Rate in mL/min
+            on_progress: Called with each progress sample dict (reader thread)
+
+        Returns:
+            DispenseFuture resolving to a DispenseResult
+
+        Raises:
+            CommandError: The firmware or the syringe would reject it
+            RuntimeError: The pump is busy
+            ConnectionError: The pump is not connected
+        """
+        with self.lock:
+            if self.is_busy:
+                raise RuntimeError(f"{self.name} is busy")
+            self.link.check_dispense(volume, rate)
+            future = DispenseFuture(self, volume, rate)
+            if on_progress is not None:
+                future.add_progress_callback(on_progress)
+            self.active = future
+        try:
+            self.link.start_dispense(volume, rate, future)
+        except Exception:
+            self.active = None
+            raise
+        future.add_done_callback(self.dispense_done)
+        return future
+
+    def dispense_done(self, future):
+        with self.lock:
+            if self.active is future:
+                self.active = None
+
+    def cancel(self):
+        """Stop the current dispense or retract"""
+        self.link.send("CANCEL")
+
+    def retract(self):
+        """
+        Pull the plunger back to zero (refill).
+
+        Returns:
+            Future resolving to True when complete, False when cancelled
+        """
+        with self.lock:
+            if self.is_busy:
+                raise RuntimeError(f"{self.name} is busy")
+            self.retracting = concurrent.futures.Future()
+            future = self.retracting
+        try:
+            self.link.start_retract()
+        except Exception:
+            self.retracting = None
+            raise
+        return future
+
+    def query(self, command, prefix):
+        """
+        Send a query and wait for its reply asynchronously.
+
+        Returns:
+            Future resolving to the reply text after the prefix
+        """
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.waiters.append((prefix, future))
+        self.link.send(command)
+        return future
+
+    def status(self):
+        """Future resolving to the STATUS text, such as IDLE or DISPENSING - ..."""
+        return self.query("STATUS", "STATUS:")
+
+    def position(self):
+        """Future resolving to the plunger position in steps"""
+        future = concurrent.futures.Future()
+
+        def convert(reply):
+            try:
+                future.set_result(int(parse_number(reply.result())))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.query("GET_POS", "POSITION: ").add_done_callback(convert)
+        return future
+
+    # ----------------- replies (reader thread) -----------------
+
+    def handle_line(self, message):
+        active = self.active
+        if active is not None:
+            if message.startswith("PROGRESS_DETAILED:"):
+                try:
+                    parts = message[18:].split(',')
+                    sample = {field: parse_number(part) for field, part in zip(PROGRESS_FIELDS, parts)}
+                except ValueError:
+                    return
+                if len(sample) == len(PROGRESS_FIELDS):
+                    active.report_progress(sample)
+                return
+            if message.startswith("steps_to_move = "):
+                active.started = True
+            elif message.startswith("WARNING"):
+                active.warnings.append(message)
+            elif message.startswith("ERROR") and not active.started:
+                self.fail(active, CommandError(message))
+            elif message in ("DISPENSE_COMPLETE", "DISPENSE_CANCELLED"):
+                active.finish(message)
+            elif message.startswith(("Read error:", "Write error:")):
+                self.fail(active, ConnectionError(message))
+
+        retracting = self.retracting
+        if retracting is not None:
+            if message in ("RETRACT_COMPLETE", "RETRACT_CANCELLED"):
+                self.retracting = None
+                if not retracting.done():
+                    retracting.set_result(message == "RETRACT_COMPLETE")
+            elif message.startswith(("ERROR", "Read error:", "Write error:")):
+                self.retracting = None
+                self.fail(retracting, CommandError(message))
+
+        if self.waiters:
+            with self.lock:
+                for waiter in list(self.waiters):
+                    prefix, future = waiter
+                    if message.startswith(prefix):
+                        self.waiters.remove(waiter)
+                        future.set_result(message[len(prefix):].strip())
+
+    def fail(self, future, error):
+        if not future.done():
+            future.set_exception(error)
+
+    # ----------------- closing -----------------
+
+    def close(self):
+        """
+        Close the client. An owned port stops a running dispense first; an
+        attached client only detaches and the GUI keeps tracking it.
+        """
+        active = self.active
+        if isinstance(self.link, SerialLink):
+            if self.is_busy:
+                try:
+                    self.cancel()
+                    if active is not None:
+                        active.exception(timeout=READER_JOIN_TIMEOUT)
+                except Exception:
+                    pass
+        self.link.close()
+        error = ConnectionError(f"{self.name} closed")
+        for future in [active, self.retracting] + [future for _, future in self.waiters]:
+            if future is not None:
+                self.fail(future, error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def __repr__(self):
+        return f"PumpClient({self.name!r}, {self.link.port!r})"
+
+
+def connect(port, name=None):
+    """
+    Open a pump on a port of its own.
+
+    Args:
+        port: Port name; SIM... opens a simulated pump
+        name: Name for logs (default: the port)
+
+    Returns:
+        PumpClient (a context manager)
+    """
+    return PumpClient(name or port, port=port)
+
+
+class PumpFleet:
+    """
+    Several clients used together. Iterable and indexable.
+    """
+
+    def __init__(self, clients):
+        self.clients = list(clients)
+
+    def __iter__(self):
+        return iter(self.clients)
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __getitem__(self, index):
+        return self.clients[index]
+
+    def dispense(self, volumes, rates, on_progress=None):
+        """
+        Start a dispense on every pump, or on none.
+
+        Args:
+            volumes: One volume for all pumps, or one per pump (mL)
+            rates: One rate for all pumps, or one per pump (mL/min)
+            on_progress: Called as on_progress(client, sample)
+
+        Returns:
+            List of DispenseFuture in pump order
+
+        Raises:
+            CommandError, RuntimeError, ConnectionError: A pump would reject
+                its dispense; nothing was sent
+        """
+        count = len(self.clients)
+        volumes = volumes if isinstance(volumes, (list, tuple)) else [volumes] * count
+        rates = rates if isinstance(rates, (list, tuple)) else [rates] * count
+        if len(volumes) != count or len(rates) != count:
+            raise ValueError(f"Need {count} volumes and rates")
+        for client, volume, rate in zip(self.clients, volumes, rates):
+            if client.is_busy:
+                raise RuntimeError(f"{client.name} is busy")
+            try:
+                client.link.check_dispense(volume, rate)
+            except CommandError as e:
+                raise CommandError(f"{client.name}: {e}")
+
+        futures = []
+        try:
+            for client, volume, rate in zip(self.clients, volumes, rates):
+                callback = None
+                if on_progress is not None:
+                    callback = (lambda c: lambda sample: on_progress(c, sample))(client)
+                futures.append(client.dispense(volume, rate, callback))
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    def cancel(self):
+        """Stop every pump"""
+        for client in self.clients:
+            try:
+                client.cancel()
+            except ConnectionError:
+                pass
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def connect_all(ports, names=None):
+    """
+    Open several pumps in parallel (real Arduinos take two seconds each to boot).
+
+    Args:
+        ports: Port names
+        names: Names for logs (default: the ports)
+
+    Returns:
+        PumpFleet (a context manager); if any port fails, the others are
+        closed and the error is raised
+    """
+    names = names or list(ports)
+    with concurrent.futures.ThreadPoolExecutor(max(1, len(ports))) as executor:
+        futures = [executor.submit(connect, port, name) for port, name in zip(ports, names)]
+        concurrent.futures.wait(futures)
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        for future in futures:
+            if not future.exception():
+                future.result().close()
+        raise errors[0]
+    return PumpFleet(future.result() for future in futures)
+
+
+def wait_all(futures, timeout=None):
+    """
+    Wait for dispenses started from synchronous code.
+
+    Args:
+        futures: DispenseFuture objects
+        timeout: Seconds to wait in total (None = no limit)
+
+    Returns:
+        List of DispenseResult in the same order
+
+    Raises:
+        concurrent.futures.TimeoutError: Not all finished in time (the pumps
+            keep running; cancel them if needed)
+    """
+    futures = list(futures)
+    done, pending = concurrent.futures.wait(futures, timeout)
+    if pending:
+        raise concurrent.futures.TimeoutError(f"{len(pending)} dispense(s) still running")
+    return [future.result() for future in futures]
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Logging Module
+=============================================
+
+This module routes every pump and manager log event through one structured,
+asynchronous logging pipeline.
+
+Callers only pay for a queue put: a QueueHandler hands records to a
+background QueueListener, which writes rotating, gzip-compressed JSON-lines
+files and feeds any number of consumers. The Tk log views are just
+consumers that buffer lines until the GUI thread drains them.
+
+Features:
+- JSON-lines records with wall time, monotonic time, source and pump ID
+- Size-based rotation with gzip compression of rotated files
+- Pluggable consumers (Tk views, stores, exporters)
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+
+LOGGER_NAME = "pumps"
+
+DEFAULT_LOG_DIR = os.environ.get("PUMP_LOG_DIR", "logs")
+LOG_FILE_NAME = "pumps.jsonl"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 20
+
+# Lines kept in a Tk log view; older lines are still in the log files
+DEFAULT_VIEW_LINES = 2000
+
+# Record sources
+SOURCE_PUMP = "pump"
+SOURCE_MANAGER = "manager"
+
+logger = logging.getLogger(LOGGER_NAME)
+logger.setLevel(logging.DEBUG)
+logger.propagate = False
+
+_pipeline = None
+
+
+def log_event(message, source, pump_id=None, pump_name=None, level=logging.INFO):
+    """
+    Log one event. Cheap: the record is only queued.
+
+    Args:
+        message: Human-readable message
+        source: SOURCE_PUMP or SOURCE_MANAGER
+        pump_id: Pump the event belongs to, if any
+        pump_name: Display name of that pump
+        level: logging level
+    """
+    logger.log(level, message, extra={'source': source, 'pump_id': pump_id,
+                                      'pump_name': pump_name, 'mono': time.monotonic()})
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        return json.dumps({
+            'time': self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            'mono': round(getattr(record, 'mono', record.created), 6),
+            'level': record.levelname,
+            'source': getattr(record, 'source', None),
+            'pump_id': getattr(record, 'pump_id', None),
+            'pump': getattr(record, 'pump_name', None),
+            'message': record.getMessage(),
+        })
+
+
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that gzips each file as it is rotated out"""
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count,
+                         encoding="utf-8")
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+class FanoutHandler(logging.Handler):
+    """Dispatch records to a changeable set of consumer handlers"""
+
+    def __init__(self):
+        super().__init__()
+        self.consumers = ()
+
+    def add(self, handler):
+        self.consumers = self.consumers + (handler,)
+
+    def remove(self, handler):
+        self.consumers = tuple(h for h in self.consumers if h is not handler)
+
+    def emit(self, record):
+        for handler in self.consumers:
+            try:
+                handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+
+
+class TkLogView(logging.Handler):
+    """
+    Consumer that buffers matching records for a Tk text widget.
+
+    emit() runs on the listener thread; update_widget() must be called from
+    the Tk thread (for example from an after() loop) to insert the lines.
+    """
+
+    def __init__(self, text_widget, source, pump_id=None, max_lines=DEFAULT_VIEW_LINES):
+        """
+        Args:
+            text_widget: Text/ScrolledText widget to append to
+            source: Only show records from this source
+            pump_id: Only show records for this pump (None = any)
+            max_lines: Oldest lines are deleted beyond this many (None = keep all)
+        """
+        super().__init__()
+        self.text_widget = text_widget
+        self.source = source
+        self.pump_id = pump_id
+        self.max_lines = max_lines
+        self.pending = queue.SimpleQueue()
+        self.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", "%H:%M:%S"))
+
+    def emit(self, record):
+        if getattr(record, 'source', None) != self.source:
+            return
+        if self.pump_id is not None and getattr(record, 'pump_id', None) != self.pump_id:
+            return
+        self.pending.put(self.format(record))
+
+    def update_widget(self):
+        """Insert buffered lines into the widget in one go (Tk thread only)"""
+        lines = []
+        try:
+            while True:
+                lines.append(self.pending.get_nowait())
+        except queue.Empty:
+            pass
+        if lines:
+            self.text_widget.insert("end", "\n".join(lines) + "\n")
+            if self.max_lines:
+                excess = self.line_count() - self.max_lines
+                if excess > 0:
+                    self.text_widget.delete("1.0", f"{excess + 1}.0")
+            self.text_widget.see("end")
+
+    def line_count(self):
+        """Lines currently in the widget (Tk thread only)"""
+        return int(self.text_widget.index("end-1c").split(".")[0]) - 1
+
+
+class LogPipeline:
+    """
+    Background logging pipeline: queue -> listener thread -> file + consumers.
+    """
+
+    def __init__(self, log_dir=DEFAULT_LOG_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 backup_count=DEFAULT_BACKUP_COUNT):
+        """
+        Args:
+            log_dir: Directory for the JSON-lines files (None = no file output)
+            max_bytes: Size at which the log file is rotated
+            backup_count: Number of compressed files to keep
+        """
+        self.queue = queue.SimpleQueue()
+        self.fanout = FanoutHandler()
+        handlers = [self.fanout]
+
+        self.file_handler = None
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            self.file_handler = CompressedRotatingFileHandler(
+                os.path.join(log_dir, LOG_FILE_NAME), max_bytes, backup_count)
+            self.file_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(self.file_handler)
+
+        self.queue_handler = logging.handlers.QueueHandler(self.queue)
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers)
+
+    def start(self):
+        logger.addHandler(self.queue_handler)
+        self.listener.start()
+
+    def stop(self):
+        """Flush everything queued so far and stop the listener thread"""
+        logger.removeHandler(self.queue_handler)
+        self.listener.stop()
+        if self.file_handler:
+            self.file_handler.close()
+
+    def add_consumer(self, handler):
+        self.fanout.add(handler)
+
+    def remove_consumer(self, handler):
+        self.fanout.remove(handler)
+
+
+def start_logging(**kwargs):
+    """Start the shared pipeline if it is not running; returns it"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = LogPipeline(**kwargs)
+        _pipeline.start()
+    return _pipeline
+
+
+def stop_logging():
+    """Stop the shared pipeline, flushing pending records"""
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop()
+        _pipeline = None
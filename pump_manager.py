@@ -17,9 +17,42 @@ Version: 2.0
 """
 
 import tkinter as tk
-from tkinter import ttk, scrolledtext, simpledialog
+from tkinter import ttk, scrolledtext, simpledialog, messagebox
+import os
 import uuid
+import queue
+import threading
 from pump_window import PumpWindow
+from emergency_stop import EmergencyStop
+from pump_logging import log_event, start_logging, stop_logging, TkLogView, SOURCE_MANAGER
+from log_store import LogStore, STORE_FILE_NAME
+from log_query_window import LogQueryWindow
+from dispense_ledger import (DispenseLedger, FleetCounters, LEDGER_FILE_NAME, EVENT_START,
+                             EVENT_COMPLETE, EVENT_CANCEL, EVENT_INTERRUPTED)
+from ledger_window import LedgerWindow
+from profile_window import ProfileWindow
+from event_bus import EventBus, DELIVER_POLL, DELIVER_THREAD
+from metrics import FleetMetrics, MetricsServer, metrics_port, DEFAULT_HOST
+from trigger import TriggerInput, trigger_port
+from trigger_window import TriggerWindow
+from chart_window import FleetChartWindow
+from pump_client import PumpClient
+from interlock import InterlockEngine, load_rules, rules_file
+
+# Pump events recorded in the dispense ledger: event type -> (ledger event, delivered key)
+LEDGER_EVENTS = {
+    'dispense_start': (EVENT_START, None),
+    'dispense_complete': (EVENT_COMPLETE, 'delivered'),
+    'dispense_cancelled': (EVENT_CANCEL, 'delivered'),
+    'dispense_interrupted': (EVENT_INTERRUPTED, 'dispensed'),
+}
+
+# Pump events are applied to the tree from the Tk loop at this period
+EVENT_POLL_MS = 50
+EVENTS_PER_TICK = 200
+
+# The GUI must see every event, so its queue is deep
+GUI_EVENT_QUEUE_SIZE = 10000
 
 class PumpManager:
     """
@@ -27,20 +60,109 @@ class PumpManager:
     Arduino syringe pumps.
     """
     
-    def __init__(self, root):
+    def __init__(self, root, log_dir=None, log_store=None, ledger=None, listeners=True):
         """
         Initialize the pump manager.
         
+        Test harnesses pass a temporary log_dir and listeners=False so their
+        simulated dispenses stay out of the lab's log store and ledger.
+        
         Args:
             root: The main tkinter root window
+            log_dir: Directory for the JSON-lines logs, log store and ledger
+                (default logs/ or PUMP_LOG_DIR); only applies if the logging
+                pipeline is not already running
+            log_store: LogStore to use instead of opening one in log_dir
+            ledger: DispenseLedger to use instead of opening one in log_dir
+            listeners: False skips the metrics endpoint and the trigger input
         """
         self.root = root
         self.root.title("Arduino Pump Manager")
-        self.root.geometry("600x500")
+        self.root.geometry("720x500")
         
         # Store pump windows
         self.pump_windows = {}  # pump_id: PumpWindow
         
+        # Emergency stop runs on a worker thread and reports back through this queue
+        self.emergency_stopper = EmergencyStop()
+        self.emergency_results = queue.Queue()
+        
+        # Pump and manager events all go through one background logging pipeline
+        self.log_pipeline = start_logging() if log_dir is None else start_logging(log_dir=log_dir)
+        
+        # Indexed copy of every log event for searching after a run
+        if log_store is None:
+            log_store = LogStore(os.path.join(log_dir, STORE_FILE_NAME) if log_dir else None)
+        self.log_store = log_store
+        self.log_pipeline.add_consumer(self.log_store)
+        
+        # Append-only record of every dispense, with running totals for the GUI
+        if ledger is None:
+            ledger = DispenseLedger(os.path.join(log_dir, LEDGER_FILE_NAME) if log_dir else None)
+        self.ledger = ledger
+        self.fleet_counters = FleetCounters(self.ledger)
+        
+        # Pump windows publish their events here; the tree and the ledger subscribe
+        self.event_bus = EventBus()
+        self.gui_events = self.event_bus.subscribe(kinds=None, delivery=DELIVER_POLL,
+                                                   maxsize=GUI_EVENT_QUEUE_SIZE, name="manager")
+        self.event_bus.subscribe(self.record_dispense, kinds=LEDGER_EVENTS,
+                                 delivery=DELIVER_THREAD, name="ledger")
+        self.event_handlers = {
+            'connect': self.on_pump_connect,
+            'disconnect': self.on_pump_disconnect,
+            'rename': self.on_pump_rename,
+            'close': self.on_pump_close,
+            'link_lost': self.on_link_lost,
+            'reconnect': self.on_reconnect,
+            'dispense_start': self.on_dispense_start,
+            'dispense_cancel': self.on_dispense_cancel,
+            'dispense_complete': self.on_dispense_complete,
+            'dispense_cancelled': self.on_dispense_cancelled,
+            'dispense_interrupted': self.on_dispense_interrupted,
+            'retract_start': self.on_retract_start,
+            'retract_progress': self.on_retract_progress,
+            'retract_cancel': self.on_retract_cancel,
+            'retract_complete': self.on_retract_complete,
+            'retract_cancelled': self.on_retract_cancelled,
+            'syringe': self.on_syringe,
+            'interlock': self.on_interlock,
+        }
+        
+        # Fleet-wide safety rules, checked on every telemetry sample
+        self.interlocks = InterlockEngine(self.event_bus)
+        try:
+            self.interlocks.set_rules(load_rules(rules_file()))
+        except (OSError, ValueError) as e:
+            log_event(f"Interlock rules not loaded: {e}", SOURCE_MANAGER)
+        if self.interlocks.rules:
+            log_event(self.interlocks.summary(), SOURCE_MANAGER)
+        
+        # OpenMetrics endpoint for the lab's Prometheus (PUMP_METRICS_PORT=0 turns it off)
+        self.metrics_server = None
+        if listeners and metrics_port():
+            fleet_metrics = FleetMetrics(self.pump_windows, self.event_bus)
+            try:
+                self.metrics_server = MetricsServer(fleet_metrics, DEFAULT_HOST,
+                                                    metrics_port()).start()
+                host, port = self.metrics_server.address[:2]
+                log_event(f"Metrics at http://{host}:{port}/metrics", SOURCE_MANAGER)
+            except OSError as e:
+                fleet_metrics.close()
+                log_event(f"Metrics endpoint not started: {e}", SOURCE_MANAGER)
+        
+        # External trigger input (PUMP_TRIGGER_PORT=0 turns it off)
+        self.trigger_input = None
+        if listeners and trigger_port():
+            try:
+                self.trigger_input = TriggerInput(port=trigger_port()).start()
+            except OSError as e:
+                log_event(f"Trigger input not started: {e}", SOURCE_MANAGER)
+        
+        # Pump window calls from scripts on other threads (see pump_client.py)
+        self.gui_thread = threading.current_thread()
+        self.client_calls = queue.Queue()
+        
         # Create manager interface
         self.create_manager_interface()
         
@@ -91,13 +213,21 @@ Click 'Add New Pump' to create a new pump control window."""
         
         self.stop_all_btn.pack(side="left", padx=5)
 
+        self.retract_all_btn = ttk.Button(add_pump_frame, text="Retract All",
+                                          command=self.retract_all)
+        self.retract_all_btn.pack(side="left", padx=5)
+
+        self.emergency_stop_btn = ttk.Button(add_pump_frame, text="EMERGENCY STOP",
+                                             command=self.emergency_stop)
+        self.emergency_stop_btn.pack(side="left", padx=5)
+
         
         # Active pumps list
         pumps_frame = ttk.LabelFrame(main_frame, text="Active Pumps", padding=15)
         pumps_frame.pack(fill="both", expand=True, pady=20)
         
         # Treeview for pump list
-        columns = ("Name", "Status", "Connection", "Activity")
+        columns = ("Name", "Status", "Connection", "Activity", "Syringe")
         self.pump_tree = ttk.Treeview(pumps_frame, columns=columns, show="headings", height=8)
         
         # Define column headings and widths
@@ -105,11 +235,13 @@ Click 'Add New Pump' to create a new pump control window."""
         self.pump_tree.heading("Status", text="Status")
         self.pump_tree.heading("Connection", text="COM Port")
         self.pump_tree.heading("Activity", text="Current Activity")
+        self.pump_tree.heading("Syringe", text="Syringe")
         
         self.pump_tree.column("Name", width=150)
         self.pump_tree.column("Status", width=100)
         self.pump_tree.column("Connection", width=100)
         self.pump_tree.column("Activity", width=150)
+        self.pump_tree.column("Syringe", width=120)
         
         # Scrollbar for treeview
         tree_scroll = ttk.Scrollbar(pumps_frame, orient="vertical", command=self.pump_tree.yview)
@@ -118,6 +250,9 @@ Click 'Add New Pump' to create a new pump control window."""
         self.pump_tree.pack(side="left", fill="both", expand=True)
         tree_scroll.pack(side="right", fill="y")
         
+        self.fleet_totals_var = tk.StringVar(value=self.fleet_counters.summary())
+        ttk.Label(main_frame, textvariable=self.fleet_totals_var).pack(anchor="w")
+        
         # Pump control buttons
         pump_control_frame = ttk.Frame(main_frame)
         pump_control_frame.pack(fill="x", pady=10)
@@ -130,6 +265,27 @@ Click 'Add New Pump' to create a new pump control window."""
                                         command=self.close_selected_pump, state="disabled")
         self.close_pump_btn.pack(side="left", padx=5)
         
+        self.search_logs_btn = ttk.Button(pump_control_frame, text="Search Logs",
+                                          command=self.open_log_search)
+        self.search_logs_btn.pack(side="right")
+        
+        self.ledger_btn = ttk.Button(pump_control_frame, text="Dispense Ledger",
+                                     command=self.open_ledger)
+        self.ledger_btn.pack(side="right", padx=5)
+        
+        self.profile_btn = ttk.Button(pump_control_frame, text="Flow Profile",
+                                      command=self.open_profile)
+        self.profile_btn.pack(side="right")
+        
+        self.trigger_btn = ttk.Button(pump_control_frame, text="Trigger",
+                                      command=self.open_trigger,
+                                      state="normal" if self.trigger_input else "disabled")
+        self.trigger_btn.pack(side="right", padx=5)
+        
+        self.charts_btn = ttk.Button(pump_control_frame, text="Charts",
+                                     command=self.open_charts)
+        self.charts_btn.pack(side="right")
+        
         # Bind treeview selection
         self.pump_tree.bind("<<TreeviewSelect>>", self.on_pump_select)
         self.pump_tree.bind("<Double-1>", self.focus_pump_window)
@@ -141,85 +297,181 @@ Click 'Add New Pump' to create a new pump control window."""
         self.system_log = scrolledtext.ScrolledText(log_frame, height=6)
         self.system_log.pack(fill="x")
         
+        self.system_log_view = TkLogView(self.system_log, SOURCE_MANAGER)
+        self.log_pipeline.add_consumer(self.system_log_view)
+        self.update_system_log()
+        self.process_pump_events()
+        self.check_triggers()
+        self.run_client_calls()
+        
         # Initial log message
         self.log_system_message("Pump Manager started. Click 'Add New Pump' to begin.")
     
-    def add_pump(self):
-        """Add a new pump window"""
-        pump_name = simpledialog.askstring("Add Pump", "Enter pump name:", 
-                                          initialvalue=f"Pump {len(self.pump_windows) + 1}")
+    def add_pump(self, pump_name=None):
+        """
+        Add a new pump window.
+        
+        Args:
+            pump_name: Name for the pump; asks the user when not given
+            
+        Returns:
+            The new PumpWindow, or None if the user cancelled
+        """
+        if pump_name is None:
+            pump_name = simpledialog.askstring("Add Pump", "Enter pump name:", 
+                                              initialvalue=f"Pump {len(self.pump_windows) + 1}")
         if not pump_name:
-            return
+            return None
         
         # Create unique pump ID
         pump_id = str(uuid.uuid4())
         
         # Create pump window
-        pump_window = PumpWindow(pump_id, pump_name, self.pump_callback)
+        pump_window = PumpWindow(pump_id, pump_name, self.event_bus)
         self.pump_windows[pump_id] = pump_window
+        self.interlocks.watch(pump_window)
         
         # Add to treeview
-        self.pump_tree.insert("", "end", iid=pump_id, values=(pump_name, "Disconnected", "None", "Ready"))
+        self.pump_tree.insert("", "end", iid=pump_id, values=(pump_name, "Disconnected", "None", "Ready", "Unknown"))
         
         # Enable buttons if this is first pump
         if len(self.pump_windows) == 1:
             self.focus_btn.config(state="normal")
             self.close_pump_btn.config(state="normal")
         
-        self.log_system_message(f"Added new pump: {pump_name}")
+        self.log_system_message(f"Added new pump: {pump_name}", pump_window)
+        self.update_fleet_size()
+        return pump_window
     
-    def pump_callback(self, event_type, pump_id, data):
-        """
-        Handle callbacks from pump windows.
-        
-        Args:
-            event_type: Type of event (connect, disconnect, rename, etc.)
-            pump_id: Unique identifier for the pump
-            data: Additional data for the event
-        """
-        if pump_id not in self.pump_windows:
-            return
-        
-        pump = self.pump_windows[pump_id]
-        
-        # Update treeview based on event
-        if event_type == 'connect':
-            self.pump_tree.set(pump_id, "Status", "Connected")
-            self.pump_tree.set(pump_id, "Connection", data['port'])
-            self.log_system_message(f"{pump.name}: Connected to {data['port']}")
-        
-        elif event_type == 'disconnect':
-            self.pump_tree.set(pump_id, "Status", "Disconnected")
-            self.pump_tree.set(pump_id, "Connection", "None")
-            self.pump_tree.set(pump_id, "Activity", "Ready")
-            self.log_system_message(f"{pump.name}: Disconnected")
-        
-        elif event_type == 'rename':
-            self.pump_tree.set(pump_id, "Name", data['new_name'])
-            self.log_system_message(f"Pump renamed: {data['old_name']} → {data['new_name']}")
-        
-        elif event_type == 'dispense_start':
-            self.pump_tree.set(pump_id, "Activity", f"Dispensing {data['volume']}mL")
-            self.log_system_message(f"{pump.name}: Started dispensing {data['volume']}mL at {data['rate']}mL/min")
-        
-        elif event_type == 'dispense_complete':
-            self.pump_tree.set(pump_id, "Activity", "Complete")
-            self.log_system_message(f"{pump.name}: Dispensing completed")
-        
-        elif event_type == 'dispense_cancel':
-            self.pump_tree.set(pump_id, "Activity", "Cancelled")
-            self.log_system_message(f"{pump.name}: Dispensing cancelled")
-        
-        elif event_type == 'close':
-            # Remove from treeview and dictionary
-            self.pump_tree.delete(pump_id)
-            del self.pump_windows[pump_id]
-            self.log_system_message(f"{pump.name}: Window closed")
-            
-            # Disable buttons if no pumps left
-            if not self.pump_windows:
-                self.focus_btn.config(state="disabled")
-                self.close_pump_btn.config(state="disabled")
+    # ----------------- pump events -----------------
+    
+    def process_pump_events(self):
+        """Apply queued pump events to the tree and system log (Tk after() loop)"""
+        for event in self.gui_events.drain(EVENTS_PER_TICK):
+            pump = self.pump_windows.get(event.pump_id)
+            handler = self.event_handlers.get(event.kind)
+            if pump is not None and handler is not None:
+                handler(pump, event.data)
+        self.fleet_totals_var.set(self.fleet_counters.summary())
+        self.root.after(EVENT_POLL_MS, self.process_pump_events)
+    
+    def on_pump_connect(self, pump, data):
+        """Show the port a pump connected to"""
+        self.pump_tree.set(pump.pump_id, "Status", "Connected")
+        self.pump_tree.set(pump.pump_id, "Connection", data['port'])
+        self.log_system_message(f"{pump.name}: Connected to {data['port']}", pump)
+    
+    def on_pump_disconnect(self, pump, data):
+        """Mark a pump disconnected and idle"""
+        self.pump_tree.set(pump.pump_id, "Status", "Disconnected")
+        self.pump_tree.set(pump.pump_id, "Connection", "None")
+        self.pump_tree.set(pump.pump_id, "Activity", "Ready")
+        self.log_system_message(f"{pump.name}: Disconnected", pump)
+    
+    def on_pump_rename(self, pump, data):
+        """Show a pump's new name and recompile the interlock rules"""
+        self.pump_tree.set(pump.pump_id, "Name", data['new_name'])
+        self.log_system_message(f"Pump renamed: {data['old_name']} → {data['new_name']}", pump)
+        self.interlocks.compile()
+    
+    def on_link_lost(self, pump, data):
+        """Mark a pump whose link dropped as reconnecting"""
+        self.pump_tree.set(pump.pump_id, "Status", "Reconnecting")
+        self.log_system_message(f"{pump.name}: Link lost, reconnecting ({data['error']})", pump)
+    
+    def on_reconnect(self, pump, data):
+        """Mark a pump connected again after a link loss"""
+        self.pump_tree.set(pump.pump_id, "Status", "Connected")
+        self.log_system_message(f"{pump.name}: Reconnected to {data['port']} after "
+                                f"{data['downtime']:.1f} s", pump)
+    
+    def on_dispense_start(self, pump, data):
+        """Show a dispense that started"""
+        self.pump_tree.set(pump.pump_id, "Activity", f"Dispensing {data['volume']}mL")
+        self.log_system_message(f"{pump.name}: Started dispensing {data['volume']}mL at {data['rate']}mL/min", pump)
+    
+    def on_dispense_complete(self, pump, data):
+        """Show a dispense that completed"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Complete")
+        self.log_system_message(f"{pump.name}: Dispensing completed", pump)
+    
+    def on_dispense_cancel(self, pump, data):
+        """Show that CANCEL was sent (the Arduino confirms with DISPENSE_CANCELLED)"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Cancelling")
+    
+    def on_dispense_cancelled(self, pump, data):
+        """Show a cancelled dispense and how much it delivered"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Cancelled")
+        self.log_system_message(f"{pump.name}: Dispensing cancelled ({data['delivered']:.3f} of "
+                                f"{data['volume']:.3f}mL delivered)", pump)
+    
+    def on_dispense_interrupted(self, pump, data):
+        """Show a dispense cut short by link loss"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Interrupted")
+        dispensed = "unknown" if data['dispensed'] is None else f"{data['dispensed']:.3f}mL"
+        self.log_system_message(f"{pump.name}: Dispense interrupted by link loss "
+                                f"({dispensed} of {data['volume']:.3f}mL delivered)", pump)
+    
+    def on_retract_start(self, pump, data):
+        """Show a retract that started"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Retracting")
+        self.log_system_message(f"{pump.name}: Retracting", pump)
+    
+    def on_retract_progress(self, pump, data):
+        """Show how far a retract has got"""
+        self.pump_tree.set(pump.pump_id, "Activity", f"Retracting {data['progress']:.0f}%")
+    
+    def on_retract_cancel(self, pump, data):
+        """Show that a retract is being cancelled"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Cancelling retract")
+    
+    def on_retract_complete(self, pump, data):
+        """Show a completed retract (syringe refilled)"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Refilled")
+        self.log_system_message(f"{pump.name}: Retract complete", pump)
+    
+    def on_retract_cancelled(self, pump, data):
+        """Show a cancelled retract and where it stopped"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Retract cancelled")
+        self.log_system_message(f"{pump.name}: Retract cancelled at "
+                                f"{data['position']} steps", pump)
+    
+    def on_syringe(self, pump, data):
+        """Show a pump's syringe volume left and time to refill"""
+        if data['available'] is None:
+            syringe_text = "Unknown"
+        elif data['refill_minutes'] is None:
+            syringe_text = f"{data['available']:.1f}mL left"
+        else:
+            syringe_text = f"{data['available']:.1f}mL / {data['refill_minutes']:.0f}min"
+        self.pump_tree.set(pump.pump_id, "Syringe", syringe_text)
+    
+    def on_interlock(self, pump, data):
+        """Show a pump cancelled by an interlock rule"""
+        self.pump_tree.set(pump.pump_id, "Activity", "Interlock")
+        message = f"{pump.name}: Cancelled by interlock {data['rule']}"
+        if data['error']:
+            message += f" (CANCEL not written: {data['error']})"
+        self.log_system_message(message, pump)
+    
+    def on_pump_close(self, pump, data):
+        """Remove a closed pump window from the table"""
+        self.pump_tree.delete(pump.pump_id)
+        del self.pump_windows[pump.pump_id]
+        self.interlocks.unwatch(pump)
+        self.log_system_message(f"{pump.name}: Window closed", pump)
+        
+        self.update_fleet_size()
+        
+        # Disable buttons if no pumps left
+        if not self.pump_windows:
+            self.focus_btn.config(state="disabled")
+            self.close_pump_btn.config(state="disabled")
+    
+    def update_fleet_size(self):
+        """Let every pump scale its telemetry rate to the size of the fleet"""
+        for pump in self.pump_windows.values():
+            pump.set_fleet_size(len(self.pump_windows))
     
     def on_pump_select(self, event):
         """Handle pump selection in treeview"""
@@ -248,18 +500,111 @@ Click 'Add New Pump' to create a new pump control window."""
             pump_window = self.pump_windows[pump_id]
             pump_window.on_closing()
     
-    def log_system_message(self, message):
+    def open_log_search(self):
+        """Open the log search panel"""
+        LogQueryWindow(self.log_store)
+    
+    def open_ledger(self):
+        """Open the dispense ledger totals"""
+        LedgerWindow(self.ledger)
+    
+    def open_charts(self):
+        """Open the fleet flow and volume charts"""
+        FleetChartWindow(self.pump_windows)
+    
+    def open_trigger(self):
+        """Open the external trigger arming window"""
+        TriggerWindow(self.trigger_input, self.pump_windows)
+    
+    def check_triggers(self):
+        """Log the triggers that fired (Tk after() loop); the pump windows track the dispenses"""
+        while self.trigger_input:
+            try:
+                result = self.trigger_input.results.get_nowait()
+            except queue.Empty:
+                break
+            self.log_system_message(result.summary())
+        self.root.after(EVENT_POLL_MS, self.check_triggers)
+    
+    def client(self, name):
+        """
+        Script interface to a pump window, sharing its connection.
+        
+        Args:
+            name: Pump name or pump_id
+            
+        Returns:
+            PumpClient; close() it to detach
+            
+        Raises:
+            KeyError: No such pump
+        """
+        for pump in self.pump_windows.values():
+            if name in (pump.name, pump.pump_id):
+                return PumpClient(pump.name, pump_window=pump, call_soon=self.call_on_gui)
+        raise KeyError(f"No pump named {name!r}")
+    
+    def call_on_gui(self, function):
+        """Run a function on the Tk thread: now if called there, else from run_client_calls"""
+        if threading.current_thread() is self.gui_thread:
+            function()
+        else:
+            self.client_calls.put(function)
+    
+    def run_client_calls(self):
+        """Run pump window calls queued by scripts (Tk after() loop)"""
+        while True:
+            try:
+                function = self.client_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                function()
+            except Exception as e:
+                self.log_system_message(f"Script call failed: {e}")
+        self.root.after(EVENT_POLL_MS, self.run_client_calls)
+    
+    def open_profile(self):
+        """Open the gradient/ratio profile window"""
+        ProfileWindow(self.pump_windows)
+    
+    def record_dispense(self, pump_event):
+        """
+        Append a dispense event to the ledger and update the fleet totals.
+        
+        Runs on the ledger subscription's thread; the Tk loop shows the totals.
+        """
+        data = pump_event.data
+        event, delivered_key = LEDGER_EVENTS[pump_event.kind]
+        if data['dispense_id'] is None:
+            # Not started by this host (another program, TEST, a replayed transcript)
+            log_event(f"{pump_event.kind} without a dispense id not recorded in the ledger",
+                      SOURCE_MANAGER, pump_event.pump_id, pump_event.pump_name)
+            return
+        row = self.ledger.record(event, data['dispense_id'], pump_event.pump_id,
+                                 pump_event.pump_name, data.get('syringe', ""),
+                                 commanded_ml=data['volume'],
+                                 delivered_ml=data[delivered_key] if delivered_key else None,
+                                 rate=data.get('rate'), ts=pump_event.time)
+        self.fleet_counters.add(row)
+    
+    def log_system_message(self, message, pump=None):
         """
         Add a message to the system log.
         
         Args:
             message: The message to log
+            pump: PumpWindow the message is about, if any
         """
-        import time
-        timestamp = time.strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
-        self.system_log.insert(tk.END, log_entry)
-        self.system_log.see(tk.END)
+        if pump is None:
+            log_event(message, SOURCE_MANAGER)
+        else:
+            log_event(message, SOURCE_MANAGER, pump.pump_id, pump.name)
+    
+    def update_system_log(self):
+        """Copy buffered log lines into the system log widget"""
+        self.system_log_view.update_widget()
+        self.root.after(100, self.update_system_log)
 
 
     def dispense_all(self):
@@ -269,13 +614,47 @@ Click 'Add New Pump' to create a new pump control window."""
                 pump.start_dispense()
 
     def stop_all(self):
-        """Trigger cancel_dispense on all currently dispensing pumps."""
+        """Trigger cancel_dispense on all currently dispensing or retracting pumps."""
         for pump in self.pump_windows.values():
-            if pump.is_connected and pump.is_dispensing:
+            if pump.is_connected and (pump.is_dispensing or pump.is_retracting):
                 pump.cancel_dispense()
+
+    def retract_all(self):
+        """Retract (refill) every connected idle pump at once; progress shows in the list."""
+        pumps = [pump for pump in self.pump_windows.values()
+                 if pump.is_connected and not pump.is_dispensing and not pump.is_retracting]
+        if not pumps:
+            return
+        if not messagebox.askyesno("Retract All", f"Retract {len(pumps)} pump(s) to zero?"):
+            return
+        for pump in pumps:
+            pump.start_retract()
     
         
     
+    def emergency_stop(self):
+        """Broadcast CANCEL to every open port in parallel, bypassing the normal queues"""
+        pumps = list(self.pump_windows.values())
+        threading.Thread(target=lambda: self.emergency_results.put(
+            self.emergency_stopper.trigger(pumps)), daemon=True).start()
+        
+        for pump in pumps:
+            if pump.is_connected:
+                self.pump_tree.set(pump.pump_id, "Activity", "Emergency stop")
+            if pump.resync is not None:
+                # Reconnecting: cancel instead of resuming once the port is back
+                pump.resync['stop'] = True
+        self.root.after(50, self.check_emergency_stop)
+    
+    def check_emergency_stop(self):
+        """Log the emergency stop result once every pump has replied or timed out"""
+        try:
+            result = self.emergency_results.get_nowait()
+        except queue.Empty:
+            self.root.after(50, self.check_emergency_stop)
+            return
+        self.log_system_message(result.summary())
+    
     def on_closing(self):
         """Handle main window closing"""
         # Close all pump windows
@@ -283,7 +662,15 @@ Click 'Add New Pump' to create a new pump control window."""
             pump_window = self.pump_windows[pump_id]
             if pump_window.is_connected:
                 pump_window.disconnect_from_arduino()
-            pump_window.window.destroy()
-        
-        # Close main window
-        self.root.destroy() 
\ No newline at end of file
+            pump_window.destroy()
+        
+        # Close main window, flushing the log files
+        self.root.destroy()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.trigger_input:
+            self.trigger_input.close()
+        self.event_bus.close()
+        stop_logging()
+        self.log_store.close()
+        self.ledger.close() 
\ No newline at end of file
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Pump Multiplexer Module
+======================================================
+
+This module lets several pumps share one serial link using the addressed
+protocol of sketch_Final.ino (see "Shared Links" in README_MODULAR.md for
+the links that can carry it; a plain RS-485 bus cannot):
+commands are sent as "@<addr>:<command>" and every reply line comes back
+as "@<addr>:<line>".
+
+A pump window opens a shared pump with a port name of the form
+"<port>@<address>", e.g. "COM3@2" or "SIM1@5". All windows on the same
+port share one SharedLink; each gets a LinkChannel that looks like a
+pyserial port, so the rest of PumpWindow works unchanged.
+
+Features:
+- One reader thread per link routing lines to per-pump channels
+- Address-prefixed writes serialized per link
+- Reference-counted links, closed with their last channel
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import threading
+import time
+
+from line_framer import LineFramer
+
+ADDRESS_SEPARATOR = "@"
+
+_links = {}
+_links_lock = threading.Lock()
+
+
+def is_shared_port(port):
+    """Whether a port name addresses a pump on a shared link ("COM3@2")"""
+    return ADDRESS_SEPARATOR in port
+
+
+def split_port(port):
+    """Split "COM3@2" into ("COM3", 2)"""
+    base, address = port.rsplit(ADDRESS_SEPARATOR, 1)
+    address = int(address)
+    if not 1 <= address <= 254:
+        raise ValueError(f"Bus address must be 1-254, got {address}")
+    return base, address
+
+
+def open_channel(port, open_link):
+    """
+    Open a channel to one pump on a shared link, opening the link if needed.
+
+    Args:
+        port: "<port>@<address>"
+        open_link: Function that opens the underlying port by name
+
+    Returns:
+        LinkChannel
+    """
+    base, address = split_port(port)
+    with _links_lock:
+        link = _links.get(base)
+        if link is None or not link.is_open:
+            link = SharedLink(base, open_link(base))
+            _links[base] = link
+        return link.open_channel(address)
+
+
+class SharedLink:
+    """
+    One serial port carrying several addressed pumps.
+    """
+
+    def __init__(self, port, serial_connection):
+        """
+        Start routing lines from an open port.
+
+        Args:
+            port: Port name (for diagnostics)
+            serial_connection: Open pyserial-compatible port
+        """
+        self.port = port
+        self.serial_connection = serial_connection
+        self.channels = {}
+        self.unrouted = 0
+        self.routed = 0
+        self.framer = LineFramer()
+        self.is_open = True
+        self.write_lock = threading.Lock()
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+
+    def open_channel(self, address):
+        """Create (or reuse) the channel for a bus address"""
+        channel = self.channels.get(address)
+        if channel is None or not channel.is_open:
+            channel = LinkChannel(self, address)
+            self.channels[address] = channel
+        return channel
+
+    def release(self, channel):
+        """Forget a closed channel; close the port with the last one"""
+        with _links_lock:
+            if self.channels.get(channel.address) is channel:
+                del self.channels[channel.address]
+            if not self.channels and self.is_open:
+                self.is_open = False
+                self.serial_connection.close()
+                if _links.get(self.port) is self:
+                    del _links[self.port]
+
+    def write_line(self, address, data):
+        """Write bytes for one pump, prefixing every line with its address"""
+        prefix = f"{ADDRESS_SEPARATOR}{address}:".encode()
+        lines = data.split(b"\n")
+        framed = b"\n".join(prefix + line if line else line for line in lines)
+        with self.write_lock:
+            self.serial_connection.write(framed)
+        return len(data)
+
+    def route(self, line):
+        """Deliver one received line to the channel it is addressed to"""
+        if line.startswith(ADDRESS_SEPARATOR):
+            head, sep, rest = line[1:].partition(":")
+            if sep and head.isdigit():
+                channel = self.channels.get(int(head))
+                if channel is not None:
+                    channel.deliver(rest)
+                    self.routed += 1
+                    return
+        self.unrouted += 1
+
+    def _read_loop(self):
+        """Read lines from the port and route them until it closes"""
+        while self.is_open:
+            try:
+                waiting = self.serial_connection.in_waiting
+                if waiting:
+                    for line in self.framer.feed(self.serial_connection.read(waiting)):
+                        self.route(line)
+                else:
+                    time.sleep(0.005)
+            except Exception as e:
+                # Every pump on the link sees the error, like a failed own port;
+                # their reconnects open a fresh link
+                with _links_lock:
+                    self.is_open = False
+                    if _links.get(self.port) is self:
+                        del _links[self.port]
+                try:
+                    self.serial_connection.close()
+                except Exception:
+                    pass
+                for channel in list(self.channels.values()):
+                    channel.fail(e)
+                return
+
+
+class LinkChannel:
+    """
+    pyserial-compatible view of one pump on a SharedLink.
+    """
+
+    def __init__(self, link, address):
+        self.link = link
+        self.address = address
+        self.timeout = 1
+        self.is_open = True
+        self.received = bytearray()
+        self.error = None
+        self.available = threading.Condition()
+
+    @property
+    def port(self):
+        return f"{self.link.port}{ADDRESS_SEPARATOR}{self.address}"
+
+    def deliver(self, line):
+        """Called by the link's reader thread"""
+        with self.available:
+            self.received += (line + "\r\n").encode()
+            self.available.notify()
+
+    def fail(self, error):
+        """Called by the link's reader thread when the port fails"""
+        with self.available:
+            self.error = error
+            self.available.notify_all()
+
+    @property
+    def in_waiting(self):
+        if self.error is not None:
+            raise OSError(f"Shared link {self.link.port} failed: {self.error}")
+        return len(self.received)
+
+    def _take(self, find_end):
+        """Wait up to timeout for data, then take find_end(buffer) bytes"""
+        with self.available:
+            if not self.received and self.error is None:
+                self.available.wait(self.timeout)
+            if self.error is not None:
+                raise OSError(f"Shared link {self.link.port} failed: {self.error}")
+            end = find_end(self.received)
+            data = bytes(self.received[:end])
+            del self.received[:end]
+            return data
+
+    def readline(self):
+        def line_end(buffer):
+            index = buffer.find(b"\n")
+            return index + 1 if index >= 0 else len(buffer)
+        return self._take(line_end)
+
+    def read(self, size=1):
+        return self._take(lambda buffer: min(size, len(buffer)))
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError("Channel is closed")
+        return self.link.write_line(self.address, data)
+
+    def reset_input_buffer(self):
+        with self.available:
+            self.received.clear()
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.link.release(self)
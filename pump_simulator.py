@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Pump Simulator Module
+====================================================
+
+This module contains a software stand-in for an Arduino running
+sketch_Final.ino, exposed through the same interface as a pyserial port.
+
+It lets the manager, benchmarks and soak tests run without hardware.
+Open a port named "SIM..." (for example "SIM1") from a pump window, or set
+PUMP_SIMULATOR_PORTS=<n> to list n simulated ports next to the real ones.
+A simulated port is also a bus: lines addressed "@<n>:..." reach a pump
+with bus address n, created on first use (see pump_multiplexer.py).
+
+Features:
+- Same command set and reply lines as the sketch
+- AccelStepper trapezoid motion (shared with the host motion model)
+- Optional time scaling for accelerated runs
+- Addressed pumps sharing one simulated link
+- Timed rate segments (SEG, SET_RATE) for flow profiles; segments switch
+  speed instantly instead of ramping
+- millis() timestamps on telemetry and SYNC replies for clock sync
+- Non-blocking RETRACT with progress and CANCEL
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import collections
+import os
+import threading
+import time
+
+from motion_model import MotionModel
+from syringe_model import DEFAULT_STEPS_PER_ML, MAX_STEPS, MIN_STEPS, firmware_steps
+
+SIMULATED_PORT_PREFIX = "SIM"
+
+DEFAULT_INTERVAL_MS = 50
+MIN_INTERVAL_MS = 20
+MAX_INTERVAL_MS = 5000
+
+# sketch_Final.ino: SEG_CAPACITY, MAX_STEP_RATE, FIRMWARE_VERSION
+SEG_CAPACITY = 16
+MAX_STEP_RATE = 4000.0
+FIRMWARE_VERSION = "2.0"
+
+# sketch_Final.ino setup(): stepper.setMaxSpeed(200), setAcceleration(100)
+BOOT_MAX_SPEED = 200.0
+BOOT_ACCEL_FACTOR = 0.5
+
+
+def simulated_ports():
+    """Simulated port names to list, from the PUMP_SIMULATOR_PORTS environment variable"""
+    try:
+        count = int(os.environ.get("PUMP_SIMULATOR_PORTS", "0"))
+    except ValueError:
+        count = 0
+    return [f"{SIMULATED_PORT_PREFIX}{i + 1}" for i in range(count)]
+
+
+def is_simulated_port(port):
+    """Whether a port name refers to the simulator"""
+    return port.startswith(SIMULATED_PORT_PREFIX)
+
+
+class SimulatedArduino:
+    """
+    State machine of one simulated pump, advanced lazily from a clock.
+    """
+
+    def __init__(self, clock=time.monotonic, time_scale=1.0, address=0):
+        """
+        Initialize the simulated Arduino.
+
+        Args:
+            clock: Function returning the current time in seconds
+            time_scale: Simulated seconds per real second
+            address: Bus address (0 = alone on its port)
+        """
+        self.address = address
+        self.clock = clock
+        self.time_scale = time_scale
+        self.origin = clock()
+
+        self.steps_per_ml = DEFAULT_STEPS_PER_ML
+        self.position = 0
+        self.status = "IDLE"
+        self.volume = 0.0
+        self.rate = 0.0
+        self.progress = 0.0
+        self.interval_ms = DEFAULT_INTERVAL_MS
+
+        self.move = None
+        self.move_start_position = 0
+        self.move_distance = 0
+        self.move_started_at = 0.0
+        self.last_report = 0.0
+
+        # Constant-speed motion once a segment or SET_RATE takes over (move is None)
+        self.speed = 0.0
+        self.anchor_time = 0.0
+        self.anchor_position = 0
+
+        # Queued SEG:<ms>,<rate> segments as (seconds, rate)
+        self.segments = collections.deque()
+        self.seg_active = False
+        self.seg_started = 0.0
+        self.seg_duration = 0.0
+        self.seg_index = 0
+
+        # RETRACT reuses the stepper's last max speed, as AccelStepper does
+        self.max_speed = BOOT_MAX_SPEED
+        self.accel_factor = BOOT_ACCEL_FACTOR
+        self.retract = None
+        self.retract_start_position = 0
+        self.retract_started_at = 0.0
+
+        self.output = collections.deque()
+        self.boot()
+
+    def now(self):
+        """Simulated time in seconds since power-up"""
+        return (self.clock() - self.origin) * self.time_scale
+
+    def millis(self):
+        """Simulated Arduino millis()"""
+        return int(self.now() * 1000)
+
+    def println(self, line):
+        """Queue a line of Arduino output, prefixed with the bus address if set"""
+        if self.address:
+            line = f"@{self.address}:{line}"
+        self.output.append(line)
+
+    def boot(self):
+        """Startup banner, as printed by setup()"""
+        self.send_status()
+        self.println("Ready for DISPENSE:<vol_ml>,<rate_ml_per_min> or CANCEL or STATUS")
+        self.println("MICROSTEPPING MODE: 1/16")
+        self.println("steps_per_rev = 3200.00")
+
+    # ----------------- commands -----------------
+
+    def accept_bus_command(self, command):
+        """
+        Strip the "@<addr>:" prefix of a line for this pump.
+
+        Returns:
+            The command, or None if the line is for another pump
+        """
+        if command.startswith("@"):
+            head, sep, rest = command[1:].partition(":")
+            if not sep or int(self.to_float(head)) != self.address:
+                return None
+            return rest
+        return command if self.address == 0 else None
+
+    def handle_command(self, command):
+        """Process one command line, as loop() does"""
+        self.advance()
+        command = self.accept_bus_command(command.strip())
+        if not command:
+            return
+        if command.startswith("SYNC:"):
+            # Answered before the echo so the reply is not queued behind it
+            self.println(f"SYNC: {command[5:]},{self.millis()}")
+            return
+        self.println(f"[COMMAND RECEIVED] >{command}<")
+
+        if command.startswith("DISPENSE:"):
+            self.handle_dispense(command)
+        elif command == "CANCEL":
+            self.handle_cancel()
+        elif command == "STATUS":
+            self.send_status()
+        elif command == "GET_CONFIG":
+            self.println(f"CONFIG: version={FIRMWARE_VERSION},steps_per_ml={self.steps_per_ml:.3f},"
+                         f"microstep=16,steps_per_rev=3200,min_steps={MIN_STEPS},"
+                         f"max_steps={MAX_STEPS},max_step_rate={MAX_STEP_RATE:.0f},"
+                         f"seg_capacity={SEG_CAPACITY},min_interval={MIN_INTERVAL_MS},"
+                         f"max_interval={MAX_INTERVAL_MS},address={self.address}")
+        elif command == "GET_POS":
+            self.println(f"POSITION: {self.position}")
+        elif command.startswith("SET_VOL:"):
+            volume = self.to_float(command[8:])
+            self.position = firmware_steps(volume, self.steps_per_ml)
+            self.println(f"Offset set: {volume:.2f} mL")
+        elif command.startswith("SET_POS:"):
+            self.position = int(self.to_float(command[8:]))
+            self.println(f"Position set to {self.position}")
+        elif command == "RETRACT":
+            self.handle_retract()
+        elif command.startswith("SEG:"):
+            self.handle_segment(command)
+        elif command == "SEG_CLEAR":
+            self.clear_segments()
+            self.println("SEG_CLEARED")
+        elif command.startswith("SET_RATE:"):
+            rate = self.to_float(command[9:])
+            if self.status != "DISPENSING":
+                self.println("ERROR: SET_RATE needs an active dispense")
+            elif rate < 0:
+                self.println("ERROR: Rate cannot be negative")
+            elif rate / 60.0 * self.steps_per_ml > MAX_STEP_RATE:
+                self.println("ERROR: Rate exceeds the maximum step rate")
+            else:
+                self.apply_rate(rate, self.now())
+                self.println(f"RATE_SET: {self.rate:.3f}")
+        elif command.startswith("SET_INTERVAL:"):
+            interval = int(self.to_float(command[13:]))
+            self.interval_ms = min(MAX_INTERVAL_MS, max(MIN_INTERVAL_MS, interval))
+            self.println(f"INTERVAL_SET: {self.interval_ms}")
+        elif command.startswith("SET_ADDR:"):
+            address = int(self.to_float(command[9:]))
+            if 0 <= address <= 254:
+                self.address = address
+                self.println(f"ADDRESS_SET: {self.address}")
+            else:
+                self.println("ERROR: Address must be 0-254")
+
+    @staticmethod
+    def to_float(text):
+        """Arduino String.toFloat(): 0.0 when the text is not a number"""
+        try:
+            return float(text)
+        except ValueError:
+            return 0.0
+
+    def handle_dispense(self, command):
+        """DISPENSE:<volume>,<rate>"""
+        if self.status == "DISPENSING":
+            self.println("ERROR: Already dispensing. Send CANCEL first.")
+            return
+        if self.status == "RETRACTING":
+            self.println("ERROR: Retracting. Send CANCEL first.")
+            return
+
+        comma = command.find(',')
+        if comma <= 9:
+            self.println("ERROR: Invalid DISPENSE format. Use DISPENSE:volume,rate")
+            self.status = "ERROR"
+            self.send_status()
+            return
+
+        volume = self.to_float(command[9:comma])
+        rate = self.to_float(command[comma + 1:])
+        if volume <= 0 or rate <= 0:
+            self.println("ERROR: Volume and rate must be positive")
+            self.status = "ERROR"
+            self.send_status()
+            return
+
+        if rate / 60.0 * self.steps_per_ml > MAX_STEP_RATE:
+            self.println("ERROR: Rate exceeds the maximum step rate")
+            self.status = "ERROR"
+            self.send_status()
+            return
+
+        steps_to_move = firmware_steps(volume, self.steps_per_ml)
+        self.println(f"steps_to_move = {steps_to_move}")
+        self.println(f"speed_steps_per_sec = {rate / 60.0 * self.steps_per_ml:.3f}")
+
+        target = self.position + steps_to_move
+        clamped = min(MAX_STEPS, max(MIN_STEPS, target))
+        if clamped != target:
+            self.println(f"WARNING: Target clamped from {target} to {clamped}")
+
+        self.volume = volume
+        self.rate = rate
+        self.max_speed = rate / 60.0 * self.steps_per_ml
+        self.accel_factor = 2.0
+        self.progress = 0.0
+        self.status = "DISPENSING"
+        self.move_start_position = self.position
+        self.move_distance = clamped - self.position
+        self.move = MotionModel(self.move_distance / self.steps_per_ml, rate,
+                                self.steps_per_ml, self.now())
+        self.move_started_at = self.now()
+        self.run_segments(self.now())
+        self.send_status()
+
+    def handle_cancel(self):
+        """CANCEL: stop at the current position"""
+        if self.status == "RETRACTING":
+            self.println("CANCEL_REQUESTED")
+            self.position = self.retract_position_at(self.now())
+            self.retract = None
+            self.status = "CANCELLED"
+            self.println("RETRACT_CANCELLED")
+            self.send_status()
+        elif self.status == "DISPENSING":
+            self.println("CANCEL_REQUESTED")
+            self.position = self.position_at(self.now())
+            self.move = None
+            self.clear_segments()
+            self.status = "CANCELLED"
+            self.println("DISPENSE_CANCELLED")
+            self.progress = 0.0
+            self.send_status()
+        else:
+            self.println("INFO: No active dispensing to cancel")
+
+    # ----------------- retract -----------------
+
+    def handle_retract(self):
+        """RETRACT: move back to 0 at the stepper's current max speed"""
+        if self.status in ("DISPENSING", "RETRACTING"):
+            self.println("ERROR: Pump is moving. Send CANCEL first.")
+            return
+        if self.position == MIN_STEPS:
+            self.println("RETRACT_COMPLETE")
+            return
+        now = self.now()
+        self.retract_start_position = self.position
+        self.retract = MotionModel((self.position - MIN_STEPS) / self.steps_per_ml,
+                                   self.max_speed / self.steps_per_ml * 60.0, self.steps_per_ml,
+                                   now, self.accel_factor)
+        self.retract_started_at = now
+        self.status = "RETRACTING"
+        self.progress = 0.0
+        self.last_report = 0.0
+        self.println(f"RETRACT_STARTED: {self.position}steps")
+
+    def retract_position_at(self, t):
+        return self.retract_start_position - int(self.retract.steps_at(t - self.retract_started_at))
+
+    def advance_retract(self):
+        """loop() during a retract: progress and completion"""
+        now = self.now()
+        self.position = self.retract_position_at(now)
+        distance = self.retract_start_position - MIN_STEPS
+        self.progress = 100.0 * (self.retract_start_position - self.position) / distance
+        if self.position <= MIN_STEPS:
+            self.retract = None
+            self.status = "IDLE"
+            self.progress = 100.0
+            self.println("RETRACT_COMPLETE")
+            self.send_status()
+            return
+        if (now - self.last_report) * 1000 >= self.interval_ms:
+            self.last_report = now
+            speed = self.retract.speed_at(now - self.retract_started_at) / self.steps_per_ml * 60.0
+            self.println(f"RETRACT_PROGRESS: {self.progress:.1f}%,{self.position}steps,"
+                         f"{speed:.1f}mL/min,{int(now * 1000)}ms")
+
+    # ----------------- flow profile segments -----------------
+
+    def handle_segment(self, command):
+        """SEG:<duration_ms>,<rate>"""
+        comma = command.find(',')
+        if comma <= 4:
+            self.println("ERROR: Invalid SEG format. Use SEG:duration_ms,rate")
+            return
+        if len(self.segments) >= SEG_CAPACITY:
+            self.println("ERROR: Segment queue full")
+            return
+        duration = int(self.to_float(command[4:comma]))
+        rate = self.to_float(command[comma + 1:])
+        if duration <= 0 or rate < 0:
+            self.println("ERROR: Segment needs duration > 0 and rate >= 0")
+            return
+        if rate / 60.0 * self.steps_per_ml > MAX_STEP_RATE:
+            self.println("ERROR: Rate exceeds the maximum step rate")
+            return
+        self.segments.append((duration / 1000.0, rate))
+        self.println(f"SEG_QUEUED: {SEG_CAPACITY - len(self.segments)}")
+
+    def clear_segments(self):
+        self.segments.clear()
+        self.seg_active = False
+        self.seg_index = 0
+
+    def exact_position_at(self, t):
+        """Fractional plunger position at simulated time t (AccelStepper keeps sub-step time)"""
+        if self.move is not None:
+            return self.move_start_position + self.move.steps_at(t - self.move_started_at)
+        return min(self.move_start_position + self.move_distance,
+                   self.anchor_position + self.speed * (t - self.anchor_time))
+
+    def position_at(self, t):
+        """Plunger position at simulated time t during the current dispense"""
+        return int(self.exact_position_at(t))
+
+    def speed_at(self, t):
+        """Stepper speed in steps/s at simulated time t"""
+        if self.move is not None:
+            return self.move.speed_at(t - self.move_started_at)
+        return self.speed
+
+    def apply_rate(self, rate, t):
+        """Switch to constant-speed motion at rate (mL/min) from simulated time t"""
+        self.anchor_position = self.exact_position_at(t)
+        self.anchor_time = t
+        self.move = None
+        self.speed = rate / 60.0 * self.steps_per_ml
+        self.rate = rate
+
+    def run_segments(self, now):
+        """Start every segment whose start time has come, back to back"""
+        while True:
+            if self.seg_active and now - self.seg_started < self.seg_duration:
+                return
+            if not self.segments:
+                if self.seg_active:
+                    self.seg_active = False
+                    self.println("SEG_UNDERRUN")
+                return
+            start = self.seg_started + self.seg_duration if self.seg_active else now
+            self.seg_duration, rate = self.segments.popleft()
+            self.seg_started = start
+            self.seg_active = True
+            self.apply_rate(rate, start)
+            self.println(f"SEG_START: {self.seg_index},{rate:.3f}")
+            self.seg_index += 1
+
+    # ----------------- telemetry -----------------
+
+    def advance(self):
+        """Run loop() up to the current time: telemetry and completion"""
+        if self.status == "RETRACTING":
+            self.advance_retract()
+            return
+        if self.status != "DISPENSING":
+            return
+
+        now = self.now()
+        self.run_segments(now)
+        elapsed = now - self.move_started_at
+        self.position = self.position_at(now)
+        steps = self.position - self.move_start_position
+        if self.move_distance > 0:
+            self.progress = min(100.0, 100.0 * steps / self.move_distance)
+
+        if steps >= self.move_distance:
+            self.move = None
+            self.clear_segments()
+            self.status = "IDLE"
+            self.println("DISPENSE_COMPLETE")
+            self.progress = 100.0
+            self.send_status()
+            return
+
+        if (now - self.last_report) * 1000 >= self.interval_ms:
+            self.last_report = now
+            self.send_comprehensive_update(now, elapsed, steps)
+
+    def send_status(self):
+        """STATUS: line"""
+        if self.status == "DISPENSING":
+            self.println(f"STATUS: DISPENSING - {self.volume:.2f}mL @ {self.rate:.2f}mL/min - "
+                         f"{self.progress:.1f}%")
+        elif self.status == "RETRACTING":
+            self.println(f"STATUS: RETRACTING - {self.progress:.1f}%")
+        else:
+            self.println(f"STATUS: {self.status}")
+
+    def send_comprehensive_update(self, now, elapsed, steps):
+        """PROGRESS_DETAILED: line followed by the PROGRESS: summary"""
+        dispensed = self.volume * self.progress / 100.0
+        remaining = self.volume - dispensed
+        speed = self.speed_at(now) / self.steps_per_ml * 60.0
+        eta = remaining / self.rate if self.rate > 0 else 0.0
+        self.println(f"PROGRESS_DETAILED: {self.progress:.1f}%,{dispensed:.2f}mL,"
+                     f"{remaining:.2f}mL,{elapsed / 60.0:.1f}min,{eta:.1f}min,"
+                     f"{speed:.1f}mL/min,{self.position}steps,"
+                     f"{self.move_distance - steps}steps_remaining,{int(now * 1000)}ms")
+        self.println(f"PROGRESS: {self.progress:.1f}% - {dispensed:.2f}/{self.volume:.2f}mL")
+
+
+class SimulatedSerial:
+    """
+    pyserial-compatible port backed by a SimulatedArduino.
+    """
+
+    def __init__(self, port, baudrate=115200, timeout=1, write_timeout=None,
+                 time_scale=1.0, device=None):
+        """
+        Open the simulated port.
+
+        Args:
+            port: Port name (SIM...)
+            baudrate: Ignored; kept for pyserial compatibility
+            timeout: Seconds readline() waits for a line
+            write_timeout: Ignored; simulated writes never block
+            time_scale: Simulated seconds per real second
+            device: Existing SimulatedArduino to attach to
+        """
+        self.port = port
+        self.timeout = timeout
+        self.time_scale = time_scale
+        self.device = device or SimulatedArduino(time_scale=time_scale)
+        self.devices = [self.device]  # every pump on the link
+        self.is_open = True
+        self._lock = threading.Lock()
+        self._tx = b""
+        self._rx = bytearray()
+
+    def _fill(self):
+        """Advance the devices and move their output into the receive buffer (lock held)"""
+        for device in self.devices:
+            device.advance()
+            while device.output:
+                self._rx += (device.output.popleft() + "\r\n").encode()
+
+    def _attach(self, line):
+        """Add a pump for an address nobody on the link answers to yet (lock held)"""
+        head, sep, _ = line[1:].partition(":")
+        if not sep or not head.isdigit() or not 1 <= int(head) <= 254:
+            return
+        address = int(head)
+        if all(device.address != address for device in self.devices):
+            device = SimulatedArduino(time_scale=self.time_scale, address=address)
+            self.devices.append(device)
+
+    @property
+    def in_waiting(self):
+        """Bytes ready to read"""
+        with self._lock:
+            self._fill()
+            return len(self._rx)
+
+    def write(self, data):
+        """Feed command bytes to the simulated Arduino"""
+        if not self.is_open:
+            raise OSError("Port is closed")
+        with self._lock:
+            self._tx += data
+            while b"\n" in self._tx:
+                line, self._tx = self._tx.split(b"\n", 1)
+                line = line.decode(errors="replace").strip()
+                if line.startswith("@"):
+                    self._attach(line)
+                for device in self.devices:
+                    device.handle_command(line)
+        return len(data)
+
+    def _take(self, find_end):
+        """Wait up to timeout for find_end(buffer) to return a length, then take it"""
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            with self._lock:
+                self._fill()
+                end = find_end(self._rx)
+                if end or not self.is_open or time.monotonic() >= deadline:
+                    # On timeout return whatever arrived, like pyserial
+                    end = end or len(self._rx)
+                    data = bytes(self._rx[:end])
+                    del self._rx[:end]
+                    return data
+            time.sleep(0.001)
+
+    def readline(self):
+        """Return the next output line (with CRLF), waiting up to timeout"""
+        def line_end(buffer):
+            index = buffer.find(b"\n")
+            return index + 1 if index >= 0 else 0
+        return self._take(line_end)
+
+    def read(self, size=1):
+        """Read up to size bytes, waiting up to timeout for the first one"""
+        return self._take(lambda buffer: min(size, len(buffer)))
+
+    def reset_input_buffer(self):
+        """Discard pending output"""
+        with self._lock:
+            for device in self.devices:
+                device.output.clear()
+            self._rx.clear()
+
+    def close(self):
+        """Close the port"""
+        self.is_open = False
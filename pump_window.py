@@ -9,6 +9,7 @@ for controlling individual Arduino syringe pumps.
 Features:
 - Individual pump control interface
 - Real-time progress tracking
+- Rolling flow and volume charts
 - Serial communication with Arduino
 - Enhanced status monitoring
 
@@ -23,6 +24,81 @@ import serial.tools.list_ports
 import threading
 import time
 import queue
+import re
+import uuid
+from syringe_model import SyringeModel, SyringeLimitError
+from serial_writer import SerialWriter
+from report_rate import choose_report_interval, DEFAULT_INTERVAL_MS
+from motion_model import MotionModel
+from pump_simulator import SimulatedSerial, is_simulated_port, simulated_ports
+from pump_multiplexer import is_shared_port, open_channel
+from link_supervisor import (LinkSupervisor, reconcile_dispense, OUTCOME_CONTINUING,
+                             OUTCOME_COMPLETED, COMPLETE_TOLERANCE_ML)
+from pump_logging import log_event, start_logging, TkLogView, SOURCE_PUMP
+from clock_sync import ClockSync
+from device_profile import DeviceProfile, CommandError
+from event_bus import PumpEvent
+from metrics import PumpMetrics
+from line_framer import LineFramer
+from strip_chart import StripChart, SPAN_LABELS, DEFAULT_SPAN
+from trigger import ArmedDispense
+from campaign_window import CampaignWindow
+
+# Display refresh period while dispensing (~60 fps)
+ANIMATION_INTERVAL_MS = 16
+
+# How often the GUI checks on a reconnect in progress
+RECONNECT_POLL_MS = 200
+
+# Seconds to wait for the reader thread of a closed connection
+READER_JOIN_TIMEOUT = 1.0
+
+# Clock sync: a quick burst after connecting, then a steady trickle
+SYNC_BURST = 8
+SYNC_BURST_INTERVAL_MS = 100
+SYNC_INTERVAL_MS = 2000
+
+# Leading number of a telemetry field such as "12.5%" or "1234steps"
+NUMBER_PATTERN = re.compile(r"[-+]?\d*\.?\d+")
+
+
+def parse_number(field):
+    """Parse the numeric part of a telemetry field, ignoring its unit suffix"""
+    match = NUMBER_PATTERN.match(field.strip())
+    if not match:
+        raise ValueError(f"No number in field: {field!r}")
+    return float(match.group())
+
+
+def open_port(port, reset=True):
+    """
+    Open a serial port, or a simulated pump for SIM... port names.
+    
+    "<port>@<address>" opens one pump on a link shared by several
+    addressed pumps (see pump_multiplexer.py).
+    
+    Args:
+        port: Port name
+        reset: False to keep DTR low so the Arduino is not reset, where
+            the driver allows it (used when reconnecting mid-run)
+        
+    Returns:
+        An open pyserial-compatible connection
+    """
+    if is_shared_port(port):
+        return open_channel(port, lambda base: open_port(base, reset))
+    if is_simulated_port(port):
+        return SimulatedSerial(port, 115200, timeout=1, write_timeout=1)
+    
+    if reset:
+        connection = serial.Serial(port, 115200, timeout=1, write_timeout=1)
+    else:
+        connection = serial.Serial(None, 115200, timeout=1, write_timeout=1)
+        connection.port = port
+        connection.dtr = False
+        connection.open()
+    time.sleep(2)  # Wait for Arduino to initialize
+    return connection
 
 class PumpWindow:
     """
@@ -30,28 +106,48 @@ class PumpWindow:
     a single Arduino syringe pump.
     """
     
-    def __init__(self, pump_id, name, manager_callback):
+    def __init__(self, pump_id, name, event_bus):
         """
         Initialize the pump window.
         
         Args:
             pump_id: Unique identifier for this pump
             name: Display name for the pump
-            manager_callback: Callback function to notify the manager
+            event_bus: EventBus the window publishes its PumpEvents on
         """
         self.pump_id = pump_id
         self.name = name
-        self.manager_callback = manager_callback
+        self.event_bus = event_bus
         
         # Connection state
         self.serial_connection = None
+        self.serial_writer = None
+        self.reading_thread = None
         self.is_connected = False
         self.is_dispensing = False
+        self.is_retracting = False
+        self.retract_percent = None
         self.port = ""
         
         # Message queue for this pump
         self.message_queue = queue.Queue()
         
+        # Reassembles received bytes into lines and drops noise (reader thread)
+        self.framer = LineFramer()
+        
+        # Called on the reader thread for every line, before the GUI sees it;
+        # replaced (never mutated) under the lock, so the reader needs none
+        self.line_listeners = ()
+        self.line_listeners_lock = threading.Lock()
+        
+        # Maps the Arduino's millis() telemetry stamps onto the host clock
+        self.clock_sync = ClockSync()
+        self.add_line_listener(self.clock_sync.handle_reply)
+        
+        # Counters and histograms for the metrics endpoint
+        self.metrics = PumpMetrics()
+        self.add_line_listener(self.metrics.line_received)
+        
         # Real-time data storage
         self.current_progress = 0.0
         self.dispensed_volume = 0.0
@@ -60,11 +156,45 @@ class PumpWindow:
         self.estimated_remaining_time = 0.0
         self.current_speed = 0.0
         
+        # Volume delivered by finished dispenses since the window opened (charts)
+        self.delivered_total = 0.0
+        
+        # Host-side mirror of the plunger position and step limits
+        self.syringe = SyringeModel()
+        self.commanded_volume = 0.0
+        # Set while a DISPENSE we sent awaits its steps_to_move echo; other
+        # echoes (TEST) must not teach steps_per_ml
+        self.dispense_echo_pending = False
+        # Volume of the last SET_VOL sent; its echo is rounded to 0.01 mL
+        self.commanded_syringe_volume = None
+        
+        # Firmware configuration (GET_CONFIG); sketch defaults until the pump answers
+        self.profile = DeviceProfile()
+        self.dispense_rate = 0.0
+        self.dispense_target_position = None
+        self.dispense_id = None
+        
+        # Reconnect after serial errors, then resync the Arduino's state
+        self.link_supervisor = None
+        self.resync = None
+        
+        # Extrapolates progress between sparse telemetry samples
+        self.motion_model = None
+        self.motion_start_position = None
+        self.animating = False
+        
+        # Negotiated progress reporting interval (SET_INTERVAL)
+        self.report_interval = DEFAULT_INTERVAL_MS
+        self.window_visible = True
+        self.fleet_size = 1
+        
         # Create pump window
         self.create_window()
         
         # Start message processing for this pump
         self.process_messages()
+        self.update_link_stats()
+        self.sync_clock()
         
         # Refresh COM ports on startup
         self.refresh_ports()
@@ -73,12 +203,16 @@ class PumpWindow:
         """Create the pump control window"""
         self.window = tk.Toplevel()
         self.window.title(f"Pump Control - {self.name}")
-        self.window.geometry("500x600")
+        self.window.geometry("520x820")
         self.window.resizable(True, True)
         
         # Handle window closing
         self.window.protocol("WM_DELETE_WINDOW", self.on_closing)
         
+        # Report less often while the window is minimized
+        self.window.bind("<Map>", self.on_visibility_change)
+        self.window.bind("<Unmap>", self.on_visibility_change)
+        
         # Main frame
         main_frame = ttk.Frame(self.window, padding=10)
         main_frame.pack(fill="both", expand=True)
@@ -123,6 +257,13 @@ class PumpWindow:
         self.status_label = ttk.Label(conn_frame, textvariable=self.status_var, foreground="red")
         self.status_label.pack(anchor="w", pady=5)
         
+        self.link_stats_var = tk.StringVar(value="Write latency: -")
+        ttk.Label(conn_frame, textvariable=self.link_stats_var).pack(anchor="w")
+        
+        self.resume_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(conn_frame, text="Resume an interrupted dispense after reconnecting",
+                        variable=self.resume_var).pack(anchor="w")
+        
         # Control Frame
         control_frame = ttk.LabelFrame(main_frame, text="Dispenser Control", padding=10)
         control_frame.pack(fill="x", pady=5)
@@ -157,6 +298,33 @@ class PumpWindow:
                                     command=self.get_status, state="disabled")
         self.status_btn.pack(side="left", padx=5)
         
+        # Syringe Frame
+        syringe_frame = ttk.LabelFrame(main_frame, text="Syringe", padding=10)
+        syringe_frame.pack(fill="x", pady=5)
+        
+        ttk.Label(syringe_frame, text="Volume (mL):").pack(side="left")
+        self.syringe_volume_var = tk.StringVar(value="0.0")
+        syringe_entry = ttk.Entry(syringe_frame, textvariable=self.syringe_volume_var, width=10)
+        syringe_entry.pack(side="left", padx=5)
+        
+        self.set_volume_btn = ttk.Button(syringe_frame, text="Set Volume", 
+                                        command=self.set_syringe_volume, state="disabled")
+        self.set_volume_btn.pack(side="left", padx=5)
+        
+        self.retract_btn = ttk.Button(syringe_frame, text="Retract (Refill)",
+                                      command=self.start_retract, state="disabled")
+        self.retract_btn.pack(side="left", padx=5)
+        
+        ttk.Button(syringe_frame, text="Plan...", command=self.open_campaign).pack(side="left")
+        
+        self.syringe_var = tk.StringVar(value="Available: unknown")
+        ttk.Label(syringe_frame, textvariable=self.syringe_var).pack(side="left", padx=10)
+        
+        # Free-text syringe label, recorded in the dispense ledger
+        ttk.Label(syringe_frame, text="Label:").pack(side="left")
+        self.syringe_label_var = tk.StringVar(value="")
+        ttk.Entry(syringe_frame, textvariable=self.syringe_label_var, width=10).pack(side="left", padx=5)
+        
         # Progress Frame
         progress_frame = ttk.LabelFrame(main_frame, text="Real-Time Progress", padding=10)
         progress_frame.pack(fill="x", pady=5)
@@ -200,7 +368,29 @@ class PumpWindow:
         speed_frame.pack(side="left", fill="x", expand=True, padx=(5, 0))
         
         self.speed_var = tk.StringVar(value="Current: 0.0 mL/min")
+        self.position_var = tk.StringVar(value="Position: - steps")
         ttk.Label(speed_frame, textvariable=self.speed_var).pack(anchor="w")
+        ttk.Label(speed_frame, textvariable=self.position_var).pack(anchor="w")
+        
+        # Charts Frame
+        chart_frame = ttk.LabelFrame(main_frame, text="Charts", padding=10)
+        chart_frame.pack(fill="x", pady=5)
+        
+        span_frame = ttk.Frame(chart_frame)
+        span_frame.pack(fill="x")
+        ttk.Label(span_frame, text="Span:").pack(side="left")
+        self.chart_span_var = tk.StringVar(value=DEFAULT_SPAN)
+        span_combo = ttk.Combobox(span_frame, textvariable=self.chart_span_var, values=SPAN_LABELS,
+                                  state="readonly", width=8)
+        span_combo.pack(side="left", padx=5)
+        span_combo.bind("<<ComboboxSelected>>", self.set_chart_span)
+        
+        self.flow_chart = StripChart(chart_frame, "Flow (mL/min)")
+        self.flow_chart.canvas.pack(anchor="w", pady=(5, 0))
+        self.volume_chart = StripChart(chart_frame, "Delivered (mL)")
+        self.volume_chart.canvas.pack(anchor="w", pady=(5, 0))
+        for chart in (self.flow_chart, self.volume_chart):
+            chart.add_series(self.pump_id)
         
         # Log Frame
         log_frame = ttk.LabelFrame(main_frame, text="Communication Log", padding=10)
@@ -209,6 +399,11 @@ class PumpWindow:
         self.log_text = scrolledtext.ScrolledText(log_frame, height=12, width=60)
         self.log_text.pack(fill="both", expand=True)
         
+        # The log widget is one consumer of the shared logging pipeline
+        self.log_pipeline = start_logging()
+        self.log_view = TkLogView(self.log_text, SOURCE_PUMP, self.pump_id)
+        self.log_pipeline.add_consumer(self.log_view)
+        
         # Log control buttons
         log_btn_frame = ttk.Frame(log_frame)
         log_btn_frame.pack(fill="x", pady=5)
@@ -230,6 +425,8 @@ class PumpWindow:
         """Update window title with current status"""
         status = "Connected" if self.is_connected else "Disconnected"
         dispensing = " - Dispensing" if self.is_dispensing else ""
+        if self.is_retracting:
+            dispensing = " - Retracting"
         self.window.title(f"Pump Control - {self.name} ({status}){dispensing}")
     
     def rename_pump(self, event=None):
@@ -241,11 +438,11 @@ class PumpWindow:
             self.update_window_title()
             self.log_message(f"Pump renamed from '{old_name}' to '{new_name}'")
             # Notify manager of name change
-            self.manager_callback('rename', self.pump_id, {'old_name': old_name, 'new_name': new_name})
+            self.publish('rename', {'old_name': old_name, 'new_name': new_name})
     
     def refresh_ports(self):
         """Refresh available COM ports"""
-        ports = [port.device for port in serial.tools.list_ports.comports()]
+        ports = [port.device for port in serial.tools.list_ports.comports()] + simulated_ports()
         self.port_combo['values'] = ports
         if ports and not self.port_var.get():
             self.port_combo.set(ports[0])
@@ -268,7 +465,7 @@ class PumpWindow:
         self.status_btn.config(state="normal")
         self.update_window_title()
         self.log_message(f"Connected to FAKE_PORT (SIMULATED)")
-        self.manager_callback('connect', self.pump_id, {'port': "FAKE_PORT"})
+        self.publish('connect', {'port': "FAKE_PORT"})
 
     """
     def connect_to_arduino(self):
@@ -279,42 +476,80 @@ class PumpWindow:
             return
         
         try:
-            self.serial_connection = serial.Serial(port, 115200, timeout=1)
-            time.sleep(2)  # Wait for Arduino to initialize
-            
-            self.is_connected = True
             self.port = port
-            self.connect_btn.config(text="Disconnect")
-            self.status_var.set(f"Status: Connected to {port}")
-            self.status_label.config(foreground="green")
-            
-            # Enable control buttons
-            self.dispense_btn.config(state="normal")
-            self.status_btn.config(state="normal")
-            
-            # Update window title
-            self.update_window_title()
-            
-            # Start reading thread
-            self.reading_thread = threading.Thread(target=self.read_serial, daemon=True)
-            self.reading_thread.start()
-            
+            self.attach_connection(self.open_serial(port))
             self.log_message(f"Connected to {port}")
-            self.manager_callback('connect', self.pump_id, {'port': port})
+            self.publish('connect', {'port': port})
             
         except Exception as e:
             messagebox.showerror("Connection Error", f"Failed to connect: {str(e)}")
             self.log_message(f"Connection failed: {str(e)}")
     
+    def attach_connection(self, connection):
+        """
+        Start the writer and reader threads on an open port and enable the controls.
+        
+        Args:
+            connection: Open pyserial-compatible connection
+        """
+        self.serial_connection = connection
+        self.clock_sync.reset()
+        
+        # All writes go through the writer thread so a stuck port never blocks Tk
+        self.serial_writer = SerialWriter(
+            connection, lambda error: self.report_link_error(connection, f"Write error: {error}"),
+            on_written=self.command_written)
+        self.serial_writer.start()
+        
+        self.is_connected = True
+        self.report_interval = DEFAULT_INTERVAL_MS  # opening the port resets the Arduino
+        self.connect_btn.config(text="Disconnect")
+        self.status_var.set(f"Status: Connected to {self.port}")
+        self.status_label.config(foreground="green")
+        
+        # Enable control buttons
+        self.dispense_btn.config(state="normal")
+        self.status_btn.config(state="normal")
+        self.set_volume_btn.config(state="normal")
+        self.retract_btn.config(state="normal")
+        
+        # Update window title
+        self.update_window_title()
+        
+        # Start reading thread (the previous connection's reader has been joined)
+        self.stop_reader()
+        self.reading_thread = threading.Thread(target=self.read_serial, args=(connection,),
+                                               daemon=True)
+        self.reading_thread.start()
+        
+        # Ask for the firmware configuration; asked again after the boot banner
+        self.send_command("GET_CONFIG")
+    
 
+    def open_serial(self, port, reset=True):
+        """Open this pump's port (see open_port)"""
+        return open_port(port, reset)
+    
     def disconnect_from_arduino(self):
         """Disconnect from Arduino"""
+        if self.link_supervisor:
+            self.link_supervisor.cancel()
+            self.link_supervisor = None
+        self.resync = None
+        
+        if self.serial_writer:
+            self.serial_writer.stop()
+            self.serial_writer = None
+        
         if self.serial_connection:
             self.serial_connection.close()
             self.serial_connection = None
         
         self.is_connected = False
+        self.stop_reader()
         self.is_dispensing = False
+        self.is_retracting = False
+        self.motion_model = None
         self.connect_btn.config(text="Connect")
         self.status_var.set("Status: Disconnected")
         self.status_label.config(foreground="red")
@@ -323,6 +558,8 @@ class PumpWindow:
         self.dispense_btn.config(state="disabled")
         self.cancel_btn.config(state="disabled")
         self.status_btn.config(state="disabled")
+        self.set_volume_btn.config(state="disabled")
+        self.retract_btn.config(state="disabled")
         
         # Reset progress
         self.progress_var.set("Ready")
@@ -332,7 +569,7 @@ class PumpWindow:
         self.update_window_title()
         
         self.log_message("Disconnected")
-        self.manager_callback('disconnect', self.pump_id, {})
+        self.publish('disconnect', {})
     
     """"
     def start_dispense(self):
@@ -403,83 +640,650 @@ class PumpWindow:
                 messagebox.showerror("Invalid Input", "Volume and rate must be positive numbers")
                 return
 
-            command = f"DISPENSE:{volume},{rate}\n"
-            self.serial_connection.write(command.encode())
-
-            self.is_dispensing = True
-            self.dispense_btn.config(state="disabled")
-            self.cancel_btn.config(state="normal")
+            try:
+                self.profile.check_dispense(volume, rate)
+            except CommandError as e:
+                messagebox.showerror("Invalid Input", str(e))
+                self.log_message(f"Rejected dispense: {e}")
+                return
 
-            # Update window title
-            self.update_window_title()
+            # The firmware clamps at MAX_STEPS silently, so check the stroke first
+            try:
+                self.dispense_target_position = self.syringe.check_dispense(volume)
+            except SyringeLimitError as e:
+                if e.available_volume < 0.001:
+                    messagebox.showerror("Syringe Limit", f"{e}. Refill the syringe first.")
+                    self.log_message(f"Rejected dispense: {e}")
+                    return
+                first_chunk = int(e.available_volume * 1000) / 1000
+                if not messagebox.askyesno("Syringe Limit",
+                                           f"{e}.\n\nDispense {first_chunk:.3f} mL now and refill "
+                                           f"for the remaining {volume - first_chunk:.3f} mL?"):
+                    self.log_message(f"Rejected dispense: {e}")
+                    return
+                refills = len(self.syringe.split_dispense(volume)) - 1
+                volume = first_chunk
+                self.dispense_target_position = self.syringe.check_dispense(volume)
+                self.log_message(f"Split dispense: {volume:.3f} mL now, "
+                                 f"{refills} refill(s) needed for the rest")
 
-            self.log_message(f"Sent: {command.strip()}")
-            self.manager_callback('dispense_start', self.pump_id, {'volume': volume, 'rate': rate})
+            self.begin_dispense(volume, rate)
 
         except ValueError:
             messagebox.showerror("Invalid Input", "Please enter valid numbers for volume and rate")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to send command: {str(e)}")
+
+    def begin_dispense(self, volume, rate, track_motion=True, sent_at=None):
+        """
+        Send a checked DISPENSE and start tracking it.
+        
+        Args:
+            volume: Volume in mL
+            rate: Rate in mL/min
+            track_motion: Animate from a constant-rate motion model; pass False
+                when the rate will change (flow profiles) so telemetry drives the display
+            sent_at: time.monotonic() at which a trigger already wrote the
+                DISPENSE (see trigger.py); it is then not sent again
+        """
+        self.current_progress = 0.0
+        self.update_report_rate()
+        command = f"DISPENSE:{volume},{rate}"
+        if sent_at is not None:
+            self.log_message(f"Sent by trigger: {command}")
+        elif not self.send_command(command):
+            return
+        self.log_message(f"Expected duration: {self.profile.dispense_time(volume, rate):.1f} s "
+                         f"for {self.profile.delivered_volume(volume):.4f} mL")
+
+        self.commanded_volume = volume
+        self.dispense_echo_pending = True
+        self.dispense_rate = rate
+        self.dispense_id = uuid.uuid4().hex
+        self.motion_model = None
+        if track_motion:
+            self.motion_model = MotionModel(volume, rate, self.syringe.steps_per_ml,
+                                            time.monotonic() if sent_at is None else sent_at)
+        self.motion_start_position = self.syringe.position
+        self.is_dispensing = True
+        self.dispense_btn.config(state="disabled")
+        self.cancel_btn.config(state="normal")
+
+        # Update window title
+        self.update_window_title()
+        self.start_animation()
+
+        self.publish('dispense_start', {'volume': volume, 'rate': rate, 'dispense_id': self.dispense_id,
+                                        'syringe': self.syringe_label_var.get()})
+
+    def track_triggered(self, armed):
+        """
+        Start (or abandon) tracking a dispense a trigger wrote.
+        
+        The trigger thread queues the ArmedDispense before writing it and
+        again if the write fails (see trigger.py), so this runs before any
+        reply to the DISPENSE is handled.
+        
+        Args:
+            armed: trigger.ArmedDispense
+        """
+        if armed.tracking is None:
+            if armed.error:
+                armed.tracking = False
+                self.log_message(f"Trigger DISPENSE not written: {armed.error}")
+                return
+            armed.tracking = True
+            self.dispense_target_position = armed.target_position
+            self.begin_dispense(armed.volume, armed.rate, sent_at=armed.written_mono)
+            armed.dispense_id = self.dispense_id
+        elif armed.tracking and armed.error:
+            armed.tracking = False
+            self.log_message(f"Trigger DISPENSE not written: {armed.error}")
+            if self.is_dispensing and self.dispense_id == armed.dispense_id:
+                self.finish_dispense("DISPENSE_CANCELLED")
+
+    def start_retract(self):
+        """Pull the plunger back to zero (refill); runs like a dispense and can be cancelled"""
+        if not self.is_connected or not self.serial_connection:
+            return
+        if self.is_dispensing or self.is_retracting:
+            return
+        
+        self.send_command("RETRACT")
+        self.set_retracting(True)
+        self.progress_var.set("Retracting...")
+        self.publish('retract_start', {})
+    
+    def set_retracting(self, retracting):
+        """Switch the controls between a retract and idle"""
+        self.is_retracting = retracting
+        self.retract_percent = None
+        self.dispense_btn.config(state="disabled" if retracting else "normal")
+        self.retract_btn.config(state="disabled" if retracting else "normal")
+        self.cancel_btn.config(state="normal" if retracting else "disabled")
+        self.update_window_title()
+    
+    def finish_retract(self, message):
+        """RETRACT_COMPLETE or RETRACT_CANCELLED"""
+        completed = message == "RETRACT_COMPLETE"
+        if completed:
+            self.syringe.set_position(self.syringe.min_steps)
+            self.update_syringe_display()
+        was_retracting = self.is_retracting
+        self.set_retracting(False)
+        self.progress_bar['value'] = 100 if completed else 0
+        self.progress_var.set("Retract complete" if completed else "Retract cancelled")
+        if was_retracting or completed:
+            self.publish('retract_complete' if completed else 'retract_cancelled',
+                         {'position': self.syringe.position})
+    
+    def measured_delivery(self):
+        """Volume moved since the dispense started, from the plunger position (None if unknown)"""
+        if self.motion_start_position is None or self.syringe.position is None:
+            return None
+        return max(0.0, (self.syringe.position - self.motion_start_position) / self.syringe.steps_per_ml)
 
     def cancel_dispense(self):
         """Cancel current dispensing"""
         if not self.is_connected or not self.serial_connection:
             return
 
-        try:
-            self.serial_connection.write(b"CANCEL\n")
-            self.log_message("Sent: CANCEL")
-            self.manager_callback('dispense_cancel', self.pump_id, {})
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to send cancel: {str(e)}")
+        self.send_command("CANCEL")
+        if self.is_retracting:
+            self.publish('retract_cancel', {})
+        else:
+            self.publish('dispense_cancel', {})
 
     def get_status(self):
         """Request status from Arduino"""
         if not self.is_connected or not self.serial_connection:
             return
 
+        self.send_command("STATUS")
+
+    def update_report_rate(self):
+        """Negotiate a new progress interval with the Arduino if the ideal one changed"""
+        link = getattr(self.serial_connection, 'link', None)
+        interval = choose_report_interval(self.window_visible, self.fleet_size,
+                                          self.current_progress,
+                                          len(link.channels) if link else 1)
+        if interval != self.report_interval and self.serial_writer:
+            self.report_interval = interval
+            self.send_command(f"SET_INTERVAL:{interval}")
+    
+    def set_fleet_size(self, fleet_size):
+        """Called by the manager when pumps are added or removed"""
+        self.fleet_size = fleet_size
+        if self.is_dispensing:
+            self.update_report_rate()
+    
+    def on_visibility_change(self, event):
+        """Track whether the window is shown (minimized windows get slow telemetry)"""
+        if event.widget is not self.window:
+            return
+        self.window_visible = event.type == tk.EventType.Map
+        if self.is_dispensing:
+            self.update_report_rate()
+            self.start_animation()
+    
+    def command_written(self, command, written_at, latency):
+        """Writer thread: a command left the host"""
+        self.clock_sync.written(command, written_at)
+        self.metrics.command_written(latency)
+    
+    def publish(self, kind, data):
+        """
+        Report an event to the manager and any other subscribers.
+        
+        Args:
+            kind: Event type (see event_bus.EVENT_FIELDS)
+            data: Event data
+        """
+        self.event_bus.publish(PumpEvent(kind, self.pump_id, self.name, data))
+    
+    def send_command(self, command):
+        """
+        Queue a command for the writer thread and log it.
+        
+        Args:
+            command: Command line without the trailing newline
+        
+        Returns:
+            True if the command was queued; commands the firmware would
+            reject (see DeviceProfile.validate_command) are logged instead
+        """
+        if not self.serial_writer:
+            return False
+        
         try:
-            self.serial_connection.write(b"STATUS\n")
-            self.log_message("Sent: STATUS")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to get status: {str(e)}")
+            command = self.profile.validate_command(command)
+        except CommandError as e:
+            self.log_message(f"Rejected {command}: {e}")
+            return False
+        
+        if self.serial_writer.send(command):
+            self.log_message(f"Sent: {command}")
+            return True
+        return False
+    
+    def animate_progress(self):
+        """Redraw the progress display from the motion model at ~60 fps"""
+        if not self.motion_model or not self.window_visible or not self.window.winfo_exists():
+            self.animating = False
+            return
+        
+        self.animating = True
+        predicted = self.motion_model.predict(time.monotonic())
+        position = None
+        if self.motion_start_position is not None:
+            position = self.motion_start_position + predicted['steps']
+        self.show_progress(predicted['progress'], predicted['dispensed'], predicted['remaining'],
+                           predicted['elapsed'], predicted['eta'], predicted['speed'], position)
+        self.window.after(ANIMATION_INTERVAL_MS, self.animate_progress)
+    
+    def start_animation(self):
+        """Start the display loop unless it is already running"""
+        if not self.animating:
+            self.animate_progress()
+    
+    def show_progress(self, progress, dispensed, remaining, elapsed, eta, speed, position=None):
+        """Update the progress bar and labels"""
+        self.progress_bar['value'] = progress
+        self.progress_var.set(f"Progress: {progress:.1f}%")
+        self.dispensed_var.set(f"Dispensed: {dispensed:.2f} mL")
+        self.remaining_var.set(f"Remaining: {remaining:.2f} mL")
+        self.elapsed_var.set(f"Elapsed: {elapsed:.1f} min")
+        self.remaining_time_var.set(f"ETA: {eta:.1f} min")
+        self.speed_var.set(f"Current: {speed:.1f} mL/min")
+        if position is not None:
+            self.position_var.set(f"Position: {position:.0f} steps")
+
+    def set_syringe_volume(self):
+        """Tell the Arduino how much liquid is in the syringe (SET_VOL)"""
+        if not self.is_connected or not self.serial_connection:
+            return
+
+        try:
+            volume = float(self.syringe_volume_var.get())
+            if volume < 0:
+                messagebox.showerror("Invalid Input", "Syringe volume cannot be negative")
+                return
+
+            if self.send_command(f"SET_VOL:{volume}"):
+                self.commanded_syringe_volume = volume
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Please enter a valid number for the syringe volume")
 
+    def open_campaign(self):
+        """Plan where refills fall in a sequence of dispenses"""
+        CampaignWindow(self)
+
+    def update_syringe_display(self):
+        """Show the volume left before the syringe limit and notify the manager"""
+        available = self.syringe.available_volume()
+        try:
+            refill_minutes = self.syringe.time_until_refill(float(self.rate_var.get()))
+        except ValueError:
+            refill_minutes = None
         
+        if available is None:
+            self.syringe_var.set("Available: unknown")
+        elif refill_minutes is None:
+            self.syringe_var.set(f"Available: {available:.2f} mL")
+        else:
+            self.syringe_var.set(f"Available: {available:.2f} mL (refill in {refill_minutes:.1f} min)")
+        self.publish('syringe', {'available': available, 'refill_minutes': refill_minutes})
+
 
             
-    def read_serial(self):
-        """Read serial data in separate thread"""
-        while self.is_connected and self.serial_connection:
+    def read_serial(self, connection):
+        """Read serial data in separate thread until the connection is replaced or fails"""
+        self.framer.reset()
+        while self.is_connected and self.serial_connection is connection:
             try:
-                if self.serial_connection.in_waiting:
-                    message = self.serial_connection.readline().decode().strip()
-                    if message:
+                waiting = connection.in_waiting
+                if waiting:
+                    lines = self.framer.feed(connection.read(waiting))
+                    received_at = time.perf_counter()
+                    for message in lines:
+                        for listener in self.line_listeners:
+                            listener(message, received_at)
                         self.message_queue.put(message)
-                time.sleep(0.1)
+                else:
+                    # Only idle when nothing is waiting, so stop replies are not held back
+                    time.sleep(0.01)
             except Exception as e:
-                self.message_queue.put(f"Read error: {str(e)}")
+                self.report_link_error(connection, f"Read error: {str(e)}")
                 break
     
+    def stop_reader(self):
+        """
+        Wait for the reader thread of a closed connection to exit.
+        
+        The reader notices within one poll that its connection was replaced,
+        so this is quick; a thread that does not exit is logged, not leaked
+        silently.
+        """
+        thread, self.reading_thread = self.reading_thread, None
+        if thread is None or thread is threading.current_thread():
+            return
+        thread.join(READER_JOIN_TIMEOUT)
+        if thread.is_alive():
+            self.log_message("Reader thread of the old connection did not exit")
+    
+    def report_link_error(self, connection, message):
+        """Queue a read/write error for the GUI thread, unless the connection was already replaced"""
+        if self.serial_connection is connection:
+            self.message_queue.put(message)
+    
+    def link_lost(self, error):
+        """
+        Close a failed link and start reconnecting (GUI thread).
+        
+        Args:
+            error: The read or write error message
+        """
+        if not self.is_connected or self.link_supervisor:
+            return
+        self.metrics.link_errors += 1
+        
+        # Remember the dispense in flight so it can be reconciled afterwards
+        inflight = None
+        if self.is_dispensing:
+            start_position = self.motion_start_position
+            if start_position is None and self.syringe.position is not None:
+                start_position = self.syringe.position - round(
+                    self.dispensed_volume * self.syringe.steps_per_ml)
+            inflight = {'volume': self.commanded_volume, 'rate': self.dispense_rate,
+                        'dispense_id': self.dispense_id,
+                        'start_position': start_position,
+                        'target_position': self.dispense_target_position,
+                        'motion_model': self.motion_model}
+        self.resync = {'inflight': inflight, 'position': self.syringe.position,
+                       'status': None, 'reset': False, 'reopened_at': None, 'stop': False}
+        
+        if self.serial_writer:
+            self.serial_writer.stop()
+            self.serial_writer = None
+        connection, self.serial_connection = self.serial_connection, None
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self.stop_reader()
+        
+        self.is_dispensing = False
+        # A retract still running is picked up again from STATUS after the reconnect
+        self.is_retracting = False
+        self.motion_model = None
+        self.dispense_btn.config(state="disabled")
+        self.cancel_btn.config(state="disabled")
+        self.status_btn.config(state="disabled")
+        self.set_volume_btn.config(state="disabled")
+        self.retract_btn.config(state="disabled")
+        self.status_var.set(f"Status: Link lost - reconnecting to {self.port}")
+        self.status_label.config(foreground="orange")
+        
+        self.log_message(f"Link lost ({error}); reconnecting")
+        self.publish('link_lost', {'error': error})
+        
+        self.link_supervisor = LinkSupervisor(lambda port: self.open_serial(port, reset=False),
+                                              self.port)
+        self.link_supervisor.start()
+        self.window.after(RECONNECT_POLL_MS, self.poll_reconnect)
+    
+    def poll_reconnect(self):
+        """Check whether the supervisor has reopened the port (GUI thread)"""
+        supervisor = self.link_supervisor
+        if supervisor is None or not self.window.winfo_exists():
+            return
+        
+        connection = supervisor.result()
+        if connection is None:
+            self.status_var.set(f"Status: Link lost - reconnecting to {self.port} "
+                                f"(attempt {supervisor.attempts})")
+            self.window.after(RECONNECT_POLL_MS, self.poll_reconnect)
+            return
+        
+        self.link_supervisor = None
+        self.attach_connection(connection)
+        self.log_message(f"Reconnected to {self.port} after {supervisor.downtime:.1f} s "
+                         f"({supervisor.attempts} attempt(s))")
+        self.publish('reconnect', {'port': self.port, 'downtime': supervisor.downtime})
+        
+        # The POSITION reply comes after the STATUS reply and any boot banner
+        self.resync['reopened_at'] = time.monotonic()
+        self.send_command("STATUS")
+        self.send_command("GET_POS")
+    
+    def finish_resync(self, reported_position):
+        """
+        Reconcile the host's view with the Arduino after a reconnect.
+        
+        Args:
+            reported_position: Position from the GET_POS reply (steps)
+        """
+        resync, self.resync = self.resync, None
+        inflight = resync['inflight']
+        
+        position = measured = reported_position
+        if resync['reset']:
+            # The Arduino restarted from the position saved at its last stop. The motor
+            # stopped at the reset, somewhere after the last sample we saw, so the last
+            # reported position is only a lower bound: delivery is unknown, and SET_POS
+            # (saved in EEPROM) is only sent if the operator confirms it.
+            measured = None
+            last_known = resync['position']
+            if last_known is not None and last_known != reported_position:
+                if messagebox.askyesno(
+                        "Arduino Restarted",
+                        f"Pump '{self.name}' restarted and reports position {reported_position} "
+                        f"steps. The last position it reported before the link was lost was "
+                        f"{last_known} steps; if a dispense was running the plunger may have "
+                        f"moved further before the reset.\n\n"
+                        f"Set the Arduino's position to {last_known} steps?"):
+                    self.log_message(f"Arduino restarted; restoring position {last_known} steps "
+                                     f"(it reported {reported_position})")
+                    self.send_command(f"SET_POS:{last_known}")
+                    position = last_known
+                else:
+                    self.log_message(f"Arduino restarted; keeping its position "
+                                     f"{reported_position} steps")
+        self.syringe.set_position(position)
+        self.update_syringe_display()
+        
+        if inflight is None:
+            return
+        if resync['status'] is None:
+            self.log_message("Arduino state unknown after reconnect; not resuming the dispense")
+            return
+        
+        result = reconcile_dispense(inflight, resync['status'] == "DISPENSING", measured,
+                                    self.syringe.steps_per_ml)
+        if resync['stop'] and result['outcome'] != OUTCOME_CONTINUING:
+            # Emergency stop while the link was down
+            self.log_message("Emergency stop during reconnect: not resuming")
+            return
+        
+        if result['outcome'] == OUTCOME_CONTINUING:
+            self.dispense_id = inflight['dispense_id']
+            self.commanded_volume = inflight['volume']
+            self.dispense_rate = inflight['rate']
+            self.dispense_target_position = inflight['target_position']
+            self.motion_model = inflight['motion_model']
+            self.motion_start_position = inflight['start_position']
+            self.is_dispensing = True
+            self.dispense_btn.config(state="disabled")
+            self.cancel_btn.config(state="normal")
+            self.update_window_title()
+            self.update_report_rate()
+            self.start_animation()
+            if resync['stop']:
+                # Emergency stop while the link was down; DISPENSE_CANCELLED ends it
+                self.send_command("CANCEL")
+                self.log_message("Emergency stop during reconnect: not resuming")
+                return
+            self.log_message("Dispense still running after reconnect")
+            return
+        
+        self.dispense_id = inflight['dispense_id']
+        self.commanded_volume = inflight['volume']
+        if result['outcome'] == OUTCOME_COMPLETED:
+            self.log_message("Dispense completed while the link was down")
+            self.dispense_target_position = inflight['target_position']
+            self.motion_start_position = inflight['start_position']
+            self.finish_dispense("DISPENSE_COMPLETE")
+            return
+        
+        # Interrupted
+        if result['dispensed'] is None:
+            self.log_message("Dispense interrupted by the link loss; delivered volume unknown, "
+                             "not resuming")
+        else:
+            self.log_message(f"Dispense interrupted by the link loss: {result['dispensed']:.3f} of "
+                             f"{inflight['volume']:.3f} mL delivered")
+        self.progress_var.set("Dispense interrupted")
+        self.publish('dispense_interrupted',
+                     {'volume': inflight['volume'], 'dispensed': result['dispensed'],
+                      'dispense_id': inflight['dispense_id'],
+                      'syringe': self.syringe_label_var.get()})
+        self.dispense_id = None
+        
+        remaining = result['remaining']
+        if remaining is not None and remaining > COMPLETE_TOLERANCE_ML and self.resume_var.get():
+            try:
+                self.dispense_target_position = self.syringe.check_dispense(remaining)
+            except SyringeLimitError as e:
+                self.log_message(f"Not resuming: {e}")
+                return
+            if not messagebox.askyesno(
+                    "Resume Dispense",
+                    f"Pump '{self.name}' delivered {result['dispensed']:.3f} of "
+                    f"{inflight['volume']:.3f} mL before the link was lost.\n\n"
+                    f"Dispense the remaining {remaining:.3f} mL at {inflight['rate']} mL/min?"):
+                self.dispense_target_position = None
+                self.log_message("Resume declined")
+                return
+            self.log_message(f"Resuming: {remaining:.3f} mL at {inflight['rate']} mL/min")
+            self.begin_dispense(round(remaining, 4), inflight['rate'])
+    
+    def add_line_listener(self, listener):
+        """
+        Register a callback for every received line (any thread).
+        
+        Args:
+            listener: Called on the reader thread as listener(message, perf_counter_time);
+                it must be quick and must not touch Tk
+        """
+        with self.line_listeners_lock:
+            self.line_listeners = self.line_listeners + (listener,)
+    
+    def remove_line_listener(self, listener):
+        """Unregister a callback added with add_line_listener (any thread)"""
+        with self.line_listeners_lock:
+            self.line_listeners = tuple(l for l in self.line_listeners if l is not listener)
+    
     def process_messages(self):
         """Process incoming serial messages"""
+        self.drain_messages()
+        self.log_view.update_widget()
+        self.update_charts()
+        
+        # Schedule next check
+        if hasattr(self, 'window') and self.window.winfo_exists():
+            self.window.after(100, self.process_messages)
+    
+    def drain_messages(self):
+        """Handle every message waiting in the queue"""
+        self.metrics.draining()
         try:
             while True:
                 message = self.message_queue.get_nowait()
-                self.handle_arduino_message(message)
+                if isinstance(message, ArmedDispense):
+                    self.track_triggered(message)
+                else:
+                    self.handle_arduino_message(message)
         except queue.Empty:
             pass
+    
+    def chart_values(self):
+        """Current flow (mL/min) and volume delivered since the window opened (mL)"""
+        if not self.is_dispensing:
+            return 0.0, self.delivered_total
+        return self.current_speed, self.delivered_total + self.dispensed_volume
+    
+    def update_charts(self):
+        """Add a sample to the flow and volume charts"""
+        flow, volume = self.chart_values()
+        now = time.monotonic()
+        self.flow_chart.add({self.pump_id: flow}, now)
+        self.volume_chart.add({self.pump_id: volume}, now)
+    
+    def set_chart_span(self, event=None):
+        """Show the span chosen in the Charts frame"""
+        for chart in (self.flow_chart, self.volume_chart):
+            chart.set_span(self.chart_span_var.get())
+    
+    def update_link_stats(self):
+        """Show how quickly queued writes leave the host"""
+        stats = self.serial_writer.latency_stats() if self.serial_writer else {}
+        if stats:
+            self.link_stats_var.set(f"Write latency: p50 {stats['p50_ms']:.1f} ms, "
+                                    f"p95 {stats['p95_ms']:.1f} ms, "
+                                    f"queued {self.serial_writer.depth}, "
+                                    f"{self.clock_sync.summary()}")
         
-        # Schedule next check
-        if hasattr(self, 'window') and self.window.winfo_exists():
-            self.window.after(100, self.process_messages)
+        if self.window.winfo_exists():
+            self.window.after(1000, self.update_link_stats)
+    
+    def sync_clock(self):
+        """Send a SYNC exchange, quickly after connecting and then every few seconds"""
+        if self.is_connected and self.serial_writer:
+            # Not logged: one line every two seconds per pump is just noise
+            self.serial_writer.send(self.clock_sync.request())
+        
+        burst = self.is_connected and self.clock_sync.exchanges < SYNC_BURST
+        if self.window.winfo_exists():
+            self.window.after(SYNC_BURST_INTERVAL_MS if burst else SYNC_INTERVAL_MS,
+                              self.sync_clock)
+    
+    def telemetry_time(self, parts, received_at):
+        """
+        Host perf_counter time of a PROGRESS_DETAILED sample.
+        
+        Args:
+            parts: The line's comma-separated fields
+            received_at: Time the line was read, used until the clock is synced
+        
+        Returns:
+            The Arduino's millis() stamp on the host clock, or received_at
+        """
+        if len(parts) >= 9:
+            try:
+                aligned = self.clock_sync.to_host(int(parse_number(parts[8])))
+            except ValueError:
+                aligned = None
+            if aligned is not None:
+                return aligned
+        return received_at
     
     def handle_arduino_message(self, message):
         """Handle incoming Arduino messages"""
+        if message.startswith("SYNC: "):
+            return  # taken by the clock sync on the reader thread
+        
         self.log_message(f"Received: {message}")
         
-        if message.startswith("STATUS:"):
+        if message.startswith(("Read error:", "Write error:")):
+            self.link_lost(message)
+        
+        elif message.startswith("STATUS:"):
             status = message[7:].strip()
-            if "DISPENSING" in status:
+            if self.resync is not None:
+                self.resync['status'] = status.split()[0] if status else status
+            if status.startswith("RETRACTING"):
+                self.progress_var.set(f"Retracting: {status}")
+                if not self.is_retracting:
+                    self.set_retracting(True)
+            elif "DISPENSING" in status:
                 self.progress_var.set(f"Dispensing: {status}")
                 if not self.is_dispensing:
                     self.is_dispensing = True
@@ -490,35 +1294,45 @@ class PumpWindow:
                 self.progress_var.set(f"Status: {status}")
                 if self.is_dispensing and status in ["IDLE", "CANCELLED", "ERROR"]:
                     self.is_dispensing = False
+                    self.dispense_echo_pending = False
                     self.dispense_btn.config(state="normal")
                     self.cancel_btn.config(state="disabled")
                     self.progress_bar['value'] = 0
                     self.reset_progress_variables()
                     self.update_window_title()
+                if self.is_retracting and status in ["IDLE", "CANCELLED", "ERROR"]:
+                    self.set_retracting(False)
         
         elif message.startswith("PROGRESS_DETAILED:"):
             # Parse detailed progress information
             try:
                 parts = message[18:].split(',')  # Remove "PROGRESS_DETAILED: " prefix
-                if len(parts) >= 9:
-                    self.current_progress = float(parts[0])
-                    self.dispensed_volume = float(parts[1])
-                    self.remaining_volume = float(parts[2])
-                    self.elapsed_time = float(parts[3])
-                    self.estimated_remaining_time = float(parts[4])
-                    self.current_speed = float(parts[5])
+                if len(parts) >= 8:
+                    self.current_progress = parse_number(parts[0])
+                    self.dispensed_volume = parse_number(parts[1])
+                    self.remaining_volume = parse_number(parts[2])
+                    self.elapsed_time = parse_number(parts[3])
+                    self.estimated_remaining_time = parse_number(parts[4])
+                    self.current_speed = parse_number(parts[5])
+                    self.syringe.set_position(parse_number(parts[6]))
+                    self.update_syringe_display()
+                    self.update_report_rate()
                     
-                    # Update GUI elements
-                    self.progress_bar['value'] = self.current_progress
-                    self.progress_var.set(f"Progress: {self.current_progress:.1f}%")
-                    self.dispensed_var.set(f"Dispensed: {self.dispensed_volume:.2f} mL")
-                    self.remaining_var.set(f"Remaining: {self.remaining_volume:.2f} mL")
-                    self.elapsed_var.set(f"Elapsed: {self.elapsed_time:.1f} min")
-                    self.remaining_time_var.set(f"ETA: {self.estimated_remaining_time:.1f} min")
-                    self.speed_var.set(f"Current: {self.current_speed:.1f} mL/min")
+                    if self.motion_model:
+                        # The animation loop draws; the sample only corrects the model
+                        self.motion_model.correct(time.monotonic(), self.dispensed_volume)
+                        self.start_animation()
+                    else:
+                        self.show_progress(self.current_progress, self.dispensed_volume,
+                                           self.remaining_volume, self.elapsed_time,
+                                           self.estimated_remaining_time, self.current_speed,
+                                           self.syringe.position)
             except (ValueError, IndexError) as e:
                 self.log_message(f"Error parsing detailed progress: {e}")
         
+        elif message.startswith("PROGRESS:") and self.motion_model:
+            pass  # Summary line; the motion model already drives the display
+        
         elif message.startswith("PROGRESS:"):
             # Extract progress percentage (backward compatibility)
             try:
@@ -529,21 +1343,152 @@ class PumpWindow:
             except:
                 self.progress_var.set(f"Progress: {message[9:]}")
         
+        elif message.startswith("Offset set: "):
+            # Echo of SET_VOL, printed to 0.01 mL: use the exact volume we sent
+            try:
+                volume = parse_number(message[12:])
+            except ValueError:
+                volume = None
+            commanded, self.commanded_syringe_volume = self.commanded_syringe_volume, None
+            if commanded is not None and (volume is None or abs(commanded - volume) <= 0.005 + 1e-9):
+                volume = commanded
+            if volume is not None:
+                self.syringe.set_volume(volume)
+                self.update_syringe_display()
+        
+        elif message.startswith("Position set to "):
+            # Echo of SET_POS
+            try:
+                self.syringe.set_position(parse_number(message[16:]))
+                self.update_syringe_display()
+            except ValueError:
+                pass
+        
+        elif message.startswith("steps_to_move = "):
+            # Echo of the step count for our DISPENSE; keeps steps_per_ml in sync
+            pending = self.dispense_echo_pending
+            self.dispense_echo_pending = False
+            if pending and not self.profile.from_device:
+                try:
+                    self.syringe.learn_steps_per_ml(parse_number(message[16:]), self.commanded_volume)
+                except ValueError:
+                    pass
+        
+        elif message.startswith("CALIBRATION COMPLETE: steps_per_ml = "):
+            try:
+                self.syringe.steps_per_ml = parse_number(message[37:])
+                self.update_syringe_display()
+            except ValueError:
+                pass
+            self.send_command("GET_CONFIG")
+        
+        elif message.startswith("CONFIG: "):
+            # Reply to GET_CONFIG
+            try:
+                self.profile = DeviceProfile.parse(message)
+            except ValueError:
+                self.log_message(f"Could not parse the configuration: {message}")
+            else:
+                self.profile.apply_to(self.syringe)
+                self.log_message(f"Device profile: {self.profile.summary()}")
+                self.update_syringe_display()
+        
+        elif message.startswith("POSITION: "):
+            # Reply to GET_POS
+            try:
+                position = int(parse_number(message[10:]))
+            except ValueError:
+                position = None
+            if self.resync is not None and self.resync['reopened_at'] is not None:
+                self.finish_resync(position)
+            elif position is not None:
+                self.syringe.set_position(position)
+                self.update_syringe_display()
+        
+        elif message.startswith("Ready for DISPENSE"):
+            # Boot banner: the Arduino restarted
+            if self.resync is not None:
+                self.resync['reset'] = True
+            self.send_command("GET_CONFIG")
+        
+        elif message.startswith("INTERVAL_SET: "):
+            try:
+                self.report_interval = int(parse_number(message[14:]))
+            except ValueError:
+                pass
+        
+        elif message.startswith("RETRACT_PROGRESS:"):
+            # <percent>%,<position>steps,<speed>mL/min,<millis>ms
+            try:
+                parts = message[17:].split(',')
+                percent = parse_number(parts[0])
+                position = parse_number(parts[1])
+                speed = parse_number(parts[2])
+            except (ValueError, IndexError) as e:
+                self.log_message(f"Error parsing retract progress: {e}")
+            else:
+                if not self.is_retracting:
+                    self.set_retracting(True)
+                self.syringe.set_position(position)
+                self.progress_bar['value'] = percent
+                self.progress_var.set(f"Retracting: {percent:.1f}%")
+                self.speed_var.set(f"Current: {speed:.1f} mL/min")
+                self.position_var.set(f"Position: {position:.0f} steps")
+                if speed > 0:
+                    eta = (position - self.syringe.min_steps) / self.syringe.steps_per_ml / speed
+                    self.remaining_time_var.set(f"ETA: {eta:.1f} min")
+                self.update_syringe_display()
+                # The manager list only needs whole percents
+                if self.retract_percent != int(percent):
+                    self.retract_percent = int(percent)
+                    self.publish('retract_progress', {'progress': percent})
+        
+        elif message in ("RETRACT_COMPLETE", "RETRACT_CANCELLED"):
+            self.finish_retract(message)
+        
         elif message in ["DISPENSE_COMPLETE", "DISPENSE_CANCELLED"]:
-            self.is_dispensing = False
-            self.dispense_btn.config(state="normal")
-            self.cancel_btn.config(state="disabled")
-            self.progress_bar['value'] = 0 if "CANCELLED" in message else 100
-            self.progress_var.set(message.replace("_", " ").title())
-            self.reset_progress_variables()
-            self.update_window_title()
-            
-            # Notify manager
-            event_type = 'dispense_complete' if 'COMPLETE' in message else 'dispense_cancelled'
-            self.manager_callback(event_type, self.pump_id, {})
+            if self.is_dispensing:
+                self.finish_dispense(message)
+            else:
+                # Not a dispense this host started (TEST, another program, a repeated line)
+                self.log_message(f"{message} with no dispense in progress; not recorded")
+    
+    def finish_dispense(self, message):
+        """
+        Mark the dispense finished and notify the manager.
+        
+        Args:
+            message: DISPENSE_COMPLETE or DISPENSE_CANCELLED
+        """
+        self.dispense_echo_pending = False
+        if message == "DISPENSE_COMPLETE" and self.dispense_target_position is not None:
+            # The last progress sample may predate the final steps
+            self.syringe.set_position(self.dispense_target_position)
+            self.update_syringe_display()
+        delivered = self.measured_delivery()
+        if delivered is None:
+            delivered = self.commanded_volume if "COMPLETE" in message else self.dispensed_volume
+        self.delivered_total += delivered
+        
+        self.dispense_target_position = None
+        self.motion_model = None
+        self.is_dispensing = False
+        self.dispense_btn.config(state="normal")
+        self.cancel_btn.config(state="disabled")
+        self.progress_bar['value'] = 0 if "CANCELLED" in message else 100
+        self.progress_var.set(message.replace("_", " ").title())
+        self.reset_progress_variables()
+        self.update_window_title()
+        
+        # Notify manager
+        event_type = 'dispense_complete' if 'COMPLETE' in message else 'dispense_cancelled'
+        self.publish(event_type, {'dispense_id': self.dispense_id, 'volume': self.commanded_volume,
+                                  'delivered': delivered, 'syringe': self.syringe_label_var.get()})
+        self.dispense_id = None
     
     def reset_progress_variables(self):
         """Reset all progress variables when dispensing stops"""
+        self.motion_model = None
         self.current_progress = 0.0
         self.dispensed_volume = 0.0
         self.remaining_volume = 0.0
@@ -559,11 +1504,8 @@ class PumpWindow:
         self.speed_var.set("Current: 0.0 mL/min")
     
     def log_message(self, message):
-        """Add message to log with timestamp"""
-        timestamp = time.strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
-        self.log_text.insert(tk.END, log_entry)
-        self.log_text.see(tk.END)
+        """Log a message for this pump (shown in the window's log and written to disk)"""
+        log_event(message, SOURCE_PUMP, self.pump_id, self.name)
     
     def clear_log(self):
         """Clear the communication log"""
@@ -575,8 +1517,13 @@ class PumpWindow:
             if messagebox.askyesno("Close Window", 
                                  f"Pump '{self.name}' is still connected. Disconnect and close?"):
                 self.disconnect_from_arduino()
-                self.manager_callback('close', self.pump_id, {})
-                self.window.destroy()
+                self.publish('close', {})
+                self.destroy()
         else:
-            self.manager_callback('close', self.pump_id, {})
-            self.window.destroy() 
\ No newline at end of file
+            self.publish('close', {})
+            self.destroy()
+    
+    def destroy(self):
+        """Detach from the logging pipeline and destroy the window"""
+        self.log_pipeline.remove_consumer(self.log_view)
+        self.window.destroy() 
\ No newline at end of file
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Report Rate Module
+=================================================
+
+This module decides how often each pump should send progress telemetry.
+
+The sketch used to send progress every 50 ms regardless of how many pumps
+were attached or whether anyone was watching. The host now negotiates the
+interval per pump with SET_INTERVAL:<ms>.
+
+Features:
+- Slow reporting for hidden (minimized) pump windows
+- A fleet-wide telemetry budget that stretches intervals for large fleets
+- Fast reporting near the end of a dispense, where accuracy counts
+- A wire budget for pumps sharing one serial link
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+# Firmware accepts SET_INTERVAL values in this range (ms)
+MIN_INTERVAL_MS = 20
+MAX_INTERVAL_MS = 5000
+
+# Firmware default before anything is negotiated
+DEFAULT_INTERVAL_MS = 50
+
+# The motion model interpolates between samples, so 4 Hz keeps the display smooth
+VISIBLE_INTERVAL_MS = 250
+HIDDEN_INTERVAL_MS = 1000
+FINAL_PHASE_INTERVAL_MS = 50
+
+# Progress (%) after which a dispense is in its final phase
+FINAL_PHASE_PERCENT = 90.0
+
+# Total progress lines per second the host wants across the whole fleet
+FLEET_LINE_BUDGET = 200.0
+
+# Pumps sharing one link (pump_multiplexer.py) split its bandwidth. 115200 baud
+# is ~11500 bytes/s; telemetry may use half, leaving room for replies and
+# commands. A PROGRESS_DETAILED + PROGRESS pair with address prefixes is
+# about 150 bytes. If the Arduino's transmit buffer fills, Serial.print
+# blocks and the stepper stalls, so this limit also applies in the final phase.
+LINK_BYTE_BUDGET = 115200 / 10 * 0.5
+SAMPLE_BYTES = 150
+
+
+def choose_report_interval(visible, fleet_size, progress_percent, link_size=1):
+    """
+    Pick the progress reporting interval for one dispensing pump.
+
+    Args:
+        visible: Whether the pump's window is shown
+        fleet_size: Number of pumps in the manager
+        progress_percent: Current dispense progress, 0-100
+        link_size: Number of pumps on this pump's serial link
+
+    Returns:
+        Interval in milliseconds
+    """
+    link_interval = 1000.0 * SAMPLE_BYTES * link_size / LINK_BYTE_BUDGET if link_size > 1 else 0
+    if progress_percent >= FINAL_PHASE_PERCENT:
+        return int(min(MAX_INTERVAL_MS, max(FINAL_PHASE_INTERVAL_MS, link_interval)))
+
+    interval = VISIBLE_INTERVAL_MS if visible else HIDDEN_INTERVAL_MS
+    fleet_interval = 1000.0 * max(1, fleet_size) / FLEET_LINE_BUDGET
+    interval = max(interval, fleet_interval, link_interval)
+    return int(min(MAX_INTERVAL_MS, max(MIN_INTERVAL_MS, interval)))
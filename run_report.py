@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Run Report
+=========================================
+
+This script computes post-run statistics for every dispense in a set of
+recorded transcripts (the tab-separated and JSON-lines formats read by
+transcript_replay.py) and writes a compact JSON summary.
+
+A run is one dispense on one pump: from the firmware's
+"STATUS: DISPENSING - <volume>mL @ <rate>mL/min" to DISPENSE_COMPLETE or
+DISPENSE_CANCELLED. That line rounds to 0.01, so the commanded volume and
+rate come from the host's "Sent: DISPENSE:<volume>,<rate>" log line, or,
+in firmware-only transcripts, from the steps_to_move and
+speed_steps_per_sec echoes when they agree with it. Reading the files is one pass per line that only sorts
+lines into flat lists; the telemetry is then parsed and every statistic
+computed for all runs at once with NumPy (bincount over samples sorted by
+run), so thousands of runs cost about as much as one long one.
+
+Per run:
+- delivered vs commanded volume, from the plunger positions and the
+  steps_to_move / clamp echoes (a cancelled run counts to its last sample)
+- rate accuracy and jitter: mean and dt-weighted standard deviation of the
+  rate between consecutive samples (position over the Arduino's millis())
+  while the reported speed is at cruise, against the commanded rate
+- time in acceleration (start to first cruise sample) and deceleration
+  (last cruise sample to the end)
+- stalls: intervals in which the plunger did not move although the
+  commanded rate should have moved it at least MIN_STALL_STEPS; count and
+  total time. Zero-rate segments of a flow profile count as stalls
+- start skew: runs in the same transcript that start within
+  START_GROUP_SECONDS of each other form a group; skew is each start minus
+  the group's first start, on the host receive clock
+
+Usage:
+    python run_report.py logs/pumps.jsonl --output report.json
+    python run_report.py runs/ --output report.json --runs runs.csv
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from device_profile import DeviceProfile
+from pump_window import parse_number
+from transcript_replay import load_transcript, SENT_PREFIX
+
+TRANSCRIPT_SUFFIXES = (".tsv", ".txt", ".jsonl", ".jsonl.gz")
+
+# Reported speed at or above this fraction of the commanded rate is cruise
+CRUISE_FRACTION = 0.95
+
+# Ignore "no movement" over intervals too short to move this many steps
+MIN_STALL_STEPS = 2
+
+# Starts closer than this (seconds, same transcript) belong to one group
+START_GROUP_SECONDS = 1.0
+
+PERCENTILES = (50, 95, 99)
+WORST_RUNS = 5
+
+STATUS_COMPLETE = "complete"
+STATUS_CANCELLED = "cancelled"
+STATUS_INCOMPLETE = "incomplete"
+
+DISPENSING_PATTERN = re.compile(r"STATUS: DISPENSING - ([\d.]+)mL @ ([\d.]+)mL/min")
+# Half the last digit of the STATUS line's volume and rate
+STATUS_ROUNDING = 0.005 + 1e-9
+SENT_DISPENSE = SENT_PREFIX + "DISPENSE:"
+CLAMP_PATTERN = re.compile(r"WARNING: Target clamped from (-?\d+) to (-?\d+)")
+# Unit suffixes in PROGRESS_DETAILED fields ("12.5%", "1234steps_remaining", ...)
+UNIT_BYTES = bytes(c for c in range(256) if c not in b"0123456789.,-\n")
+
+# PROGRESS_DETAILED columns
+PROGRESS, DISPENSED, REMAINING, ELAPSED, ETA, SPEED, POSITION, STEPS_REMAINING, MILLIS = range(9)
+
+# Per-run columns, in CSV order
+RUN_FIELDS = ("source", "pump", "status", "start_s", "duration_s", "samples",
+              "commanded_ml", "delivered_ml", "volume_error_ml", "volume_error_pct",
+              "commanded_rate", "cruise_rate", "rate_error_pct", "rate_jitter", "rate_jitter_pct",
+              "accel_s", "decel_s", "stall_count", "stall_s", "group", "group_size", "start_skew_s")
+
+
+class RunTable:
+    """
+    Runs and their telemetry lines from a set of transcripts, as flat lists.
+    """
+
+    def __init__(self):
+        self.sources = []
+        # Per run
+        self.run_source = []
+        self.run_pump = []
+        self.run_status = []
+        self.run_start = []
+        self.run_end = []
+        self.run_volume = []
+        self.run_rate = []
+        self.run_steps_per_ml = []
+        self.run_planned_steps = []
+        # Per PROGRESS_DETAILED line
+        self.sample_run = []
+        self.sample_time = []
+        self.sample_payload = []
+
+    def add_transcript(self, path):
+        """
+        Read one transcript.
+
+        Args:
+            path: File accepted by transcript_replay.load_transcript
+        """
+        source = len(self.sources)
+        self.sources.append(path)
+        open_runs = {}
+        steps_per_ml = {}
+        planned = {}
+        # Per pump: (volume, rate) sent by the host, and the firmware's echoes
+        sent = {}
+        echoed_steps = {}
+        echoed_speed = {}
+        default_steps_per_ml = DeviceProfile().steps_per_ml
+        sample_run = self.sample_run
+        sample_time = self.sample_time
+        sample_payload = self.sample_payload
+
+        for t, pump, line in load_transcript(path, sent=True):
+            if line.startswith("PROGRESS_DETAILED:"):
+                run = open_runs.get(pump)
+                if run is not None:
+                    sample_run.append(run)
+                    sample_time.append(t)
+                    sample_payload.append(line[18:])
+            elif line.startswith("STATUS: DISPENSING"):
+                match = DISPENSING_PATTERN.match(line)
+                if match and pump not in open_runs:
+                    pump_steps_per_ml = steps_per_ml.get(pump, default_steps_per_ml)
+                    volume, rate = commanded_values(
+                        float(match.group(1)), float(match.group(2)), sent.pop(pump, None),
+                        echoed_steps.pop(pump, None), echoed_speed.pop(pump, None),
+                        pump_steps_per_ml)
+                    open_runs[pump] = self.open_run(source, pump, t, volume, rate,
+                                                    pump_steps_per_ml, planned.pop(pump, np.nan))
+            elif line.startswith(SENT_DISPENSE):
+                try:
+                    volume, rate = line[len(SENT_DISPENSE):].split(",")
+                    sent[pump] = (float(volume), float(rate))
+                except ValueError:
+                    pass
+            elif line.startswith("steps_to_move = "):
+                try:
+                    planned[pump] = echoed_steps[pump] = float(line[16:])
+                except ValueError:
+                    pass
+            elif line.startswith("speed_steps_per_sec = "):
+                try:
+                    echoed_speed[pump] = float(line[22:])
+                except ValueError:
+                    pass
+            elif line.startswith("WARNING: Target clamped"):
+                match = CLAMP_PATTERN.match(line)
+                if match and pump in planned:
+                    # The move ends at the limit instead of start + steps_to_move
+                    target, clamped = int(match.group(1)), int(match.group(2))
+                    planned[pump] += clamped - target
+            elif line.startswith("CONFIG: "):
+                try:
+                    steps_per_ml[pump] = DeviceProfile.parse(line).steps_per_ml
+                except ValueError:
+                    pass
+            elif line in ("DISPENSE_COMPLETE", "DISPENSE_CANCELLED"):
+                run = open_runs.pop(pump, None)
+                if run is not None:
+                    self.run_end[run] = t
+                    self.run_status[run] = (STATUS_COMPLETE if line == "DISPENSE_COMPLETE"
+                                            else STATUS_CANCELLED)
+
+    def open_run(self, source, pump, t, volume, rate, steps_per_ml, planned_steps):
+        """Start a run; returns its index"""
+        self.run_source.append(source)
+        self.run_pump.append(pump)
+        self.run_status.append(STATUS_INCOMPLETE)
+        self.run_start.append(t)
+        self.run_end.append(np.nan)
+        self.run_volume.append(volume)
+        self.run_rate.append(rate)
+        self.run_steps_per_ml.append(steps_per_ml)
+        self.run_planned_steps.append(planned_steps)
+        return len(self.run_source) - 1
+
+    def __len__(self):
+        return len(self.run_source)
+
+    def samples(self):
+        """
+        Parse the telemetry lines in batches.
+
+        Returns:
+            (run index, host time, values) with values of shape (samples, 9);
+            lines without the millis() field use the host time there, and
+            malformed lines are left out
+        """
+        run = np.asarray(self.sample_run, dtype=np.int64)
+        host_time = np.asarray(self.sample_time, dtype=float)
+        values = np.full((len(run), 9), np.nan)
+        fields = np.fromiter((payload.count(",") + 1 for payload in self.sample_payload),
+                             dtype=np.int64, count=len(run))
+        for width in (8, 9):
+            index = np.flatnonzero(fields == width)
+            if not len(index):
+                continue
+            payloads = [self.sample_payload[i] for i in index]
+            values[index, :width] = parse_payloads(payloads, width)
+        # Firmware without the millis() field: fall back to the receive time
+        values[:, MILLIS] = np.where(fields == 8, host_time * 1000.0, values[:, MILLIS])
+        keep = ~np.isnan(values).any(axis=1)
+        return run[keep], host_time[keep], values[keep]
+
+
+def commanded_values(status_volume, status_rate, sent, steps, speed, steps_per_ml):
+    """
+    Commanded volume and rate of a run.
+
+    Args:
+        status_volume, status_rate: From the STATUS: DISPENSING line (0.01 steps)
+        sent: (volume, rate) from the host's DISPENSE log line, or None
+        steps, speed: steps_to_move and speed_steps_per_sec echoes, or None
+        steps_per_ml: The pump's calibration
+
+    Returns:
+        (volume mL, rate mL/min): the host's values if known, else each echo
+        that rounds to the STATUS value, else the STATUS value
+    """
+    if sent is not None:
+        return sent
+    volume, rate = status_volume, status_rate
+    if steps is not None and abs(steps / steps_per_ml - volume) <= STATUS_ROUNDING:
+        volume = steps / steps_per_ml
+    if speed is not None and abs(speed * 60.0 / steps_per_ml - rate) <= STATUS_ROUNDING:
+        rate = speed * 60.0 / steps_per_ml
+    return volume, rate
+
+
+def parse_payloads(payloads, width):
+    """PROGRESS_DETAILED payloads with width fields each -> array (len(payloads), width)"""
+    text = "\n".join(payloads).encode("ascii", "replace").translate(None, UNIT_BYTES)
+    try:
+        return np.array(text.replace(b"\n", b",").split(b","), dtype=float).reshape(-1, width)
+    except ValueError:
+        # A damaged field somewhere: parse line by line and mark the bad ones
+        rows = np.full((len(payloads), width), np.nan)
+        for i, payload in enumerate(payloads):
+            try:
+                rows[i] = [parse_number(field) for field in payload.split(",")]
+            except ValueError:
+                pass
+        return rows
+
+
+def compute_runs(table):
+    """
+    Per-run statistics for every run in the table.
+
+    Returns:
+        Dict of RUN_FIELDS name -> array (one entry per run)
+    """
+    n = len(table)
+    source = np.asarray(table.run_source, dtype=np.int64)
+    start = np.asarray(table.run_start, dtype=float)
+    end = np.asarray(table.run_end, dtype=float)
+    volume = np.asarray(table.run_volume, dtype=float)
+    rate = np.asarray(table.run_rate, dtype=float)
+    steps_per_ml = np.asarray(table.run_steps_per_ml, dtype=float)
+    planned = np.asarray(table.run_planned_steps, dtype=float)
+    status = np.asarray(table.run_status)
+    complete = status == STATUS_COMPLETE
+
+    run, host_time, values = table.samples()
+    order = np.argsort(run, kind="stable")
+    run, host_time, values = run[order], host_time[order], values[order]
+    counts = np.bincount(run, minlength=n)
+    has_samples = counts > 0
+    first = np.cumsum(counts) - counts
+    last = first + counts - 1
+    position = values[:, POSITION]
+    speed = values[:, SPEED]
+    device_time = values[:, MILLIS] / 1000.0
+
+    # Delivered volume from positions: target = position + steps_remaining
+    if len(values):
+        first_sample = np.where(has_samples, first, 0)
+        last_sample = np.where(has_samples, last, 0)
+        target = position[first_sample] + values[first_sample, STEPS_REMAINING]
+        last_position = position[last_sample]
+        last_time = host_time[last_sample]
+    else:
+        # No telemetry at all (older firmware, or every run too short)
+        target = last_position = last_time = np.full(n, np.nan)
+    planned = np.where(np.isnan(planned), np.round(volume * steps_per_ml), planned)
+    moved = np.where(complete, planned, last_position - (target - planned))
+    moved = np.where(has_samples | complete, moved, np.nan)
+    delivered = moved / steps_per_ml
+    volume_error = delivered - volume
+
+    finished = np.where(np.isnan(end), np.where(has_samples, last_time, start), end)
+
+    # Intervals between consecutive samples of the same run
+    same = run[1:] == run[:-1]
+    dt = np.diff(device_time)
+    valid = same & (dt > 0)
+    interval_run = run[:-1]
+    r = interval_run[valid]
+    dt_v = dt[valid]
+    steps = np.diff(position)[valid]
+    interval_rate = steps / steps_per_ml[r] / dt_v * 60.0
+
+    cruising = speed >= CRUISE_FRACTION * rate[run]
+    cruise = (cruising[:-1] & cruising[1:])[valid]
+    cruise_time = np.bincount(r[cruise], dt_v[cruise], minlength=n)
+    cruise_steps = np.bincount(r[cruise], steps[cruise], minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cruise_rate = cruise_steps / steps_per_ml / cruise_time * 60.0
+        deviation = interval_rate[cruise] - cruise_rate[r[cruise]]
+        jitter = np.sqrt(np.bincount(r[cruise], dt_v[cruise] * deviation ** 2, minlength=n)
+                         / cruise_time)
+        rate_error_pct = (cruise_rate - rate) / rate * 100.0
+
+    # First and last cruise sample of each run (samples are sorted by run)
+    cruise_index = np.flatnonzero(cruising)
+    first_cruise = np.full(n, np.nan)
+    last_cruise = np.full(n, np.nan)
+    if len(cruise_index):
+        runs_cruising, first_at = np.unique(run[cruise_index], return_index=True)
+        first_cruise[runs_cruising] = host_time[cruise_index[first_at]]
+        last_at = np.r_[first_at[1:], len(cruise_index)] - 1
+        last_cruise[runs_cruising] = host_time[cruise_index[last_at]]
+    accel = np.where(np.isnan(first_cruise), finished - start, first_cruise - start)
+    decel = np.where(np.isnan(last_cruise), np.nan, finished - last_cruise)
+
+    # Stalls: no movement where the commanded rate would have moved the plunger
+    expected_steps = rate[interval_run] / 60.0 * steps_per_ml[interval_run] * dt
+    stalled = valid & (np.diff(position) <= 0) & (expected_steps >= MIN_STALL_STEPS)
+    stall_start = stalled & ~np.r_[False, stalled[:-1]]
+    stall_time = np.bincount(interval_run[stalled], dt[stalled], minlength=n)
+    stall_count = np.bincount(interval_run[stall_start], minlength=n)
+
+    group, group_size, skew = start_groups(source, start)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            'source': source,
+            'pump': np.asarray(table.run_pump, dtype=object),
+            'status': status,
+            'start_s': start,
+            'duration_s': finished - start,
+            'samples': counts,
+            'commanded_ml': volume,
+            'delivered_ml': delivered,
+            'volume_error_ml': volume_error,
+            'volume_error_pct': volume_error / volume * 100.0,
+            'commanded_rate': rate,
+            'cruise_rate': cruise_rate,
+            'rate_error_pct': rate_error_pct,
+            'rate_jitter': jitter,
+            'rate_jitter_pct': jitter / rate * 100.0,
+            'accel_s': accel,
+            'decel_s': decel,
+            'stall_count': stall_count,
+            'stall_s': stall_time,
+            'group': group,
+            'group_size': group_size,
+            'start_skew_s': skew,
+        }
+
+
+def start_groups(source, start):
+    """
+    Group runs that start together.
+
+    Returns:
+        (group index, group size, start minus the group's first start) per run
+    """
+    n = len(start)
+    if not n:
+        empty = np.zeros(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty
+    order = np.lexsort((start, source))
+    sorted_start = start[order]
+    sorted_source = source[order]
+    new_group = np.r_[True, (np.diff(sorted_start) > START_GROUP_SECONDS)
+                      | (sorted_source[1:] != sorted_source[:-1])]
+    group_sorted = np.cumsum(new_group) - 1
+    group_first = sorted_start[new_group]
+    group = np.empty(n, dtype=np.int64)
+    group[order] = group_sorted
+    group_size = np.bincount(group_sorted)[group]
+    return group, group_size, start - group_first[group]
+
+
+def distribution(values):
+    """Mean, percentiles and worst absolute value of the finite values"""
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return None
+    summary = {'count': int(len(values)), 'mean': round_float(values.mean())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{percentile}"] = round_float(value)
+    summary['max_abs'] = round_float(np.abs(values).max())
+    return summary
+
+
+def round_float(value):
+    return float(f"{value:.6g}")
+
+
+def summarize(table, runs):
+    """
+    The compact report.
+
+    Args:
+        table: RunTable
+        runs: compute_runs(table)
+
+    Returns:
+        JSON-serializable dict
+    """
+    status = runs['status']
+    complete = status == STATUS_COMPLETE
+    group_first = runs['start_skew_s'] == 0
+    grouped = runs['group_size'] > 1
+    # Spread of each multi-pump group: its largest skew
+    group_spread = np.zeros(int(runs['group'].max()) + 1 if len(status) else 0)
+    np.maximum.at(group_spread, runs['group'], runs['start_skew_s'])
+    multi_groups = np.unique(runs['group'][grouped])
+
+    pumps = {}
+    names = runs['pump']
+    for name in sorted(set(names)):
+        mine = names == name
+        pumps[name] = {
+            'runs': int(mine.sum()),
+            'completed': int((mine & complete).sum()),
+            'volume_error_pct': distribution(runs['volume_error_pct'][mine & complete]),
+            'rate_error_pct': distribution(runs['rate_error_pct'][mine]),
+            'stall_s': round_float(runs['stall_s'][mine].sum()),
+        }
+
+    worst = np.argsort(-np.nan_to_num(np.abs(runs['volume_error_pct']), nan=-1.0))[:WORST_RUNS]
+    return {
+        'sources': len(table.sources),
+        'runs': len(status),
+        'samples': int(runs['samples'].sum()),
+        'completed': int(complete.sum()),
+        'cancelled': int((status == STATUS_CANCELLED).sum()),
+        'incomplete': int((status == STATUS_INCOMPLETE).sum()),
+        'volume_error_ml': distribution(runs['volume_error_ml'][complete]),
+        'volume_error_pct': distribution(runs['volume_error_pct'][complete]),
+        'rate_error_pct': distribution(runs['rate_error_pct']),
+        'rate_jitter_pct': distribution(runs['rate_jitter_pct']),
+        'accel_s': distribution(runs['accel_s']),
+        'decel_s': distribution(runs['decel_s'][complete]),
+        'runs_with_stalls': int((runs['stall_count'] > 0).sum()),
+        'stall_s': distribution(runs['stall_s'][runs['stall_count'] > 0]),
+        'start_groups': int(len(multi_groups)),
+        'start_skew_s': distribution(runs['start_skew_s'][grouped & ~group_first]),
+        'start_spread_s': distribution(group_spread[multi_groups]),
+        'pumps': pumps,
+        'worst_volume_error': [
+            {'source': table.sources[runs['source'][i]], 'pump': names[i],
+             'start_s': round_float(runs['start_s'][i]), 'status': status[i],
+             'volume_error_pct': round_float(runs['volume_error_pct'][i])}
+            for i in worst if np.isfinite(runs['volume_error_pct'][i])
+        ],
+    }
+
+
+def write_runs_csv(path, table, runs):
+    """One row per run"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(RUN_FIELDS)
+        columns = [runs[field] for field in RUN_FIELDS]
+        for i in range(len(table)):
+            row = []
+            for field, column in zip(RUN_FIELDS, columns):
+                value = column[i]
+                if field == 'source':
+                    value = table.sources[value]
+                elif isinstance(value, (float, np.floating)):
+                    value = "" if np.isnan(value) else f"{value:.6g}"
+                row.append(value)
+            writer.writerow(row)
+
+
+def find_transcripts(paths):
+    """Files, and transcripts inside directories (recursively)"""
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for root, _, files in os.walk(path):
+            found.extend(os.path.join(root, name) for name in sorted(files)
+                         if name.endswith(TRANSCRIPT_SUFFIXES))
+    return found
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Post-run statistics for recorded dispenses")
+    parser.add_argument("paths", nargs="+", help="transcripts or directories of transcripts")
+    parser.add_argument("--output", default="run_report.json", help="summary JSON file")
+    parser.add_argument("--runs", help="also write one CSV row per run")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    table = RunTable()
+    for path in find_transcripts(args.paths):
+        try:
+            table.add_transcript(path)
+        except (OSError, ValueError) as e:
+            print(f"Skipped {path}: {e}", file=sys.stderr)
+    read = time.perf_counter()
+    runs = compute_runs(table)
+    report = summarize(table, runs)
+    computed = time.perf_counter()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    if args.runs:
+        write_runs_csv(args.runs, table, runs)
+    print(f"{report['runs']} runs ({report['completed']} complete) from {report['sources']} "
+          f"transcripts: read {read - started:.2f} s, computed {computed - read:.3f} s "
+          f"-> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Serial Writer Module
+===================================================
+
+This module contains the SerialWriter class which moves all serial writes
+for a pump off the Tk thread.
+
+A slow or stuck USB adapter used to freeze the whole manager, because every
+write happened on the GUI thread, and a CANCEL could sit behind a STATUS.
+Each pump now owns a writer thread fed by a priority queue.
+
+Features:
+- CANCEL and STOP jump ahead of everything else
+- Repeated STATUS polls are coalesced into one pending write
+- Write timeouts and stale-command expiry never block the GUI
+- Host-side write latency measurement (enqueue to bytes written)
+- Urgent writes from other threads (emergency stop, interlocks) share the
+  writer's lock, so lines never interleave on the port
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import collections
+import itertools
+import queue
+import threading
+import time
+
+# Lower value = written first
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_POLL = 2
+
+URGENT_COMMANDS = ("CANCEL", "STOP")
+# Read-only queries: written after other commands and merged while pending
+COALESCED_COMMANDS = ("STATUS", "GET_POS")
+
+# Non-urgent commands older than this when they reach the port are dropped
+DEFAULT_STALE_AFTER = 5.0
+
+
+def command_priority(command):
+    """Return the queue priority for a command line (without newline)"""
+    if command in URGENT_COMMANDS:
+        return PRIORITY_URGENT
+    if command in COALESCED_COMMANDS:
+        return PRIORITY_POLL
+    return PRIORITY_NORMAL
+
+
+class SerialWriter:
+    """
+    Per-pump writer thread with a prioritized, coalescing command queue.
+    """
+
+    def __init__(self, serial_connection, on_error, stale_after=DEFAULT_STALE_AFTER,
+                 on_written=None):
+        """
+        Initialize the writer.
+
+        Args:
+            serial_connection: Open serial port (should have a write_timeout)
+            on_error: Called from the writer thread with an error string
+            stale_after: Seconds after which a queued non-urgent command is dropped
+            on_written: Called from the writer thread as on_written(command,
+                perf_counter_time, latency) once a command's bytes are written
+        """
+        self.serial_connection = serial_connection
+        self.on_error = on_error
+        self.stale_after = stale_after
+        self.on_written = on_written
+
+        self.queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._pending = set()
+        self._lock = threading.Lock()
+        # Held around every write to the port, by the writer thread and by
+        # write_urgent() callers; commands queued before urgent_at are dropped
+        self.write_lock = threading.Lock()
+        self.urgent_at = 0.0
+
+        # Recent enqueue-to-written latencies, in seconds
+        self.latencies = collections.deque(maxlen=1000)
+        self.writes = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Start the writer thread"""
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        """
+        Stop the writer after the commands already queued have been written.
+
+        Args:
+            timeout: Seconds to wait for the queue to drain
+        """
+        self.queue.put((PRIORITY_POLL + 1, next(self._sequence), None, 0.0))
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def clear(self):
+        """
+        Discard every queued command that has not been written yet.
+
+        Returns:
+            Number of commands discarded
+        """
+        kept = []
+        discarded = 0
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[2] is None:
+                kept.append(item)  # stop request
+            else:
+                discarded += 1
+        for item in kept:
+            self.queue.put(item)
+        with self._lock:
+            self._pending.clear()
+        self.dropped += discarded
+        return discarded
+
+    def write_urgent(self, data):
+        """
+        Write bytes now from the calling thread, ahead of everything queued.
+
+        Waits only for a write already in progress (at most the port's
+        write timeout), so the bytes never interleave with a line from the
+        writer thread. Every command queued before the call is discarded,
+        including one the writer thread has taken off the queue but not
+        written yet.
+
+        Args:
+            data: Complete line(s) as bytes
+        """
+        with self.write_lock:
+            self.urgent_at = time.perf_counter()
+            self.clear()
+            self.serial_connection.write(data)
+
+    def write_now(self, data):
+        """
+        Write bytes now from the calling thread, between two of the writer
+        thread's lines; the queue is left as it is.
+
+        Args:
+            data: Complete line(s) as bytes
+        """
+        with self.write_lock:
+            self.serial_connection.write(data)
+
+    @property
+    def depth(self):
+        """Number of commands waiting to be written"""
+        return self.queue.qsize()
+
+    def send(self, command):
+        """
+        Queue a command for writing.
+
+        Args:
+            command: Command line without the trailing newline
+
+        Returns:
+            False if the command was merged into an identical pending one
+        """
+        priority = command_priority(command)
+        if command in COALESCED_COMMANDS:
+            with self._lock:
+                if command in self._pending:
+                    self.coalesced += 1
+                    return False
+                self._pending.add(command)
+        self.queue.put((priority, next(self._sequence), command, time.perf_counter()))
+        return True
+
+    def _run(self):
+        """Write queued commands until stopped"""
+        while True:
+            priority, _, command, queued_at = self.queue.get()
+            if command is None:
+                return
+
+            if command in COALESCED_COMMANDS:
+                with self._lock:
+                    self._pending.discard(command)
+
+            if (priority != PRIORITY_URGENT and
+                    time.perf_counter() - queued_at > self.stale_after):
+                self.dropped += 1
+                self.on_error(f"Dropped stale command {command}")
+                continue
+
+            error = None
+            with self.write_lock:
+                if priority != PRIORITY_URGENT and queued_at < self.urgent_at:
+                    self.dropped += 1  # queued before an urgent write
+                    continue
+                try:
+                    self.serial_connection.write(f"{command}\n".encode())
+                except Exception as e:
+                    error = e
+            if error is not None:
+                self.on_error(f"Failed to write {command}: {error}")
+                continue
+
+            written_at = time.perf_counter()
+            if self.on_written:
+                self.on_written(command, written_at, written_at - queued_at)
+            self.latencies.append(written_at - queued_at)
+            self.writes += 1
+
+    def latency_stats(self):
+        """
+        Summarize recent write latencies.
+
+        Returns:
+            Dict with count, mean_ms, p50_ms, p95_ms and max_ms (empty if no writes)
+        """
+        samples = sorted(self.latencies)
+        if not samples:
+            return {}
+        return {
+            'count': len(samples),
+            'mean_ms': sum(samples) / len(samples) * 1000,
+            'p50_ms': samples[len(samples) // 2] * 1000,
+            'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+            'max_ms': samples[-1] * 1000,
+        }
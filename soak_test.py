@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Soak Test
+========================================
+
+This script runs the full manager against a large fleet of simulated pumps
+(see pump_simulator.py) for hours, doing randomized dispense, cancel,
+refill and reconnect cycles, and checks that no resource keeps growing.
+
+Multi-day runs used to slow down: the Tk log views kept every line ever
+logged, and reconnects left old reader threads behind. Short benchmarks
+cannot see that kind of leak. Here the host's resources are sampled
+periodically and written to a CSV file. At the end, the median of each
+resource over the last third of the run is compared with the median over
+the first third (after a warm-up). The soak fails when anything grew by
+more than its allowance.
+
+Sampled:
+- rss_mb: resident memory of the process
+- threads: live Python threads
+- widgets: Tk widgets under the root window
+- log_view_lines: lines held by all Tk log views
+- log_files_mb: size of the rotated JSON-lines logs (capped by rotation)
+- log_store_mb: size of the SQLite log store; reported only, since the
+  store keeps every event and has no retention
+- read_queue, write_queue, event_queue, log_queue: queue depths
+- write_p50_ms, write_p95_ms: write latency over the fleet
+- reader_lag_p95_ms: reader lag over the fleet (see metrics.py)
+
+The manager logs to a temporary directory with the metrics endpoint and
+trigger input off, so the soak's simulated dispenses never reach the lab's
+log store or dispense ledger. The directory is removed afterwards unless
+--keep-logs is given.
+
+Usage:
+    python soak_test.py                          # 120 pumps for 4 hours
+    python soak_test.py --pumps 200 --hours 24 --csv soak.csv
+    python soak_test.py --pumps 20 --hours 0.1   # quick check
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import argparse
+import csv
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tkinter as tk
+
+from pump_manager import PumpManager
+from pump_logging import LOG_FILE_NAME
+from log_store import STORE_FILE_NAME
+from syringe_model import SyringeLimitError
+from device_profile import CommandError
+
+try:
+    import psutil
+except ImportError:  # optional; /proc is used on Linux
+    psutil = None
+
+DEFAULT_PUMPS = 120
+DEFAULT_HOURS = 4.0
+DEFAULT_SAMPLE_SECONDS = 30.0
+
+# Warm-up excluded from the growth check (fraction of the run)
+WARMUP_FRACTION = 0.1
+
+# Each second, per pump
+ACTION_INTERVAL_MS = 1000
+CANCEL_PROBABILITY = 0.05
+RECONNECT_PROBABILITY = 0.002
+
+# Random dispenses: volume (mL) and rate (mL/min) ranges
+VOLUME_RANGE = (0.02, 0.3)
+RATE_RANGE = (2.0, 30.0)
+
+# Refill when less than this is left in the syringe (mL)
+REFILL_BELOW_ML = 1.0
+
+# Resource -> (absolute, relative) growth allowed from the first third to the last
+GROWTH_LIMITS = {
+    'rss_mb': (50.0, 0.25),
+    'threads': (5, 0.0),
+    'widgets': (0, 0.0),
+    'log_view_lines': (0, 0.05),
+    'log_files_mb': (20.0, 0.5),
+    'read_queue': (50, 0.0),
+    'write_queue': (50, 0.0),
+    'event_queue': (100, 0.0),
+    'log_queue': (1000, 0.0),
+    'write_p95_ms': (20.0, 1.0),
+    'reader_lag_p95_ms': (100.0, 1.0),
+}
+
+
+def rss_mb():
+    """Resident memory of this process in MB (peak RSS where nothing better exists)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1e6
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        import resource
+        scale = 1e6 if sys.platform == "darwin" else 1e3
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def widget_count(widget):
+    """Number of Tk widgets below a widget, itself included"""
+    return 1 + sum(widget_count(child) for child in widget.winfo_children())
+
+
+def directory_mb(path, prefix=""):
+    """Total size of the files in a directory whose names start with prefix (MB)"""
+    total = 0
+    for entry in os.scandir(path) if os.path.isdir(path) else ():
+        if entry.is_file() and entry.name.startswith(prefix):
+            total += entry.stat().st_size
+    return total / 1e6
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def growth_failures(samples, warmup_fraction=WARMUP_FRACTION):
+    """
+    Compare the last third of the run with the first third after the warm-up.
+
+    Args:
+        samples: List of sample dicts in time order
+
+    Returns:
+        (list of failure descriptions, {resource: (first, last)})
+    """
+    steady = samples[int(len(samples) * warmup_fraction):]
+    third = len(steady) // 3
+    if third < 2:
+        return [f"Too few samples ({len(samples)}) to judge growth; run longer"], {}
+    failures = []
+    medians = {}
+    for name, (absolute, relative) in GROWTH_LIMITS.items():
+        first = statistics.median(sample[name] for sample in steady[:third])
+        last = statistics.median(sample[name] for sample in steady[-third:])
+        medians[name] = (first, last)
+        if last - first > absolute + relative * abs(first):
+            failures.append(f"{name} grew from {first:.1f} to {last:.1f}")
+    return failures, medians
+
+
+class SoakTest:
+    """
+    A manager with a fleet of simulated pumps under random load.
+    """
+
+    def __init__(self, pump_count, hours, sample_seconds, csv_path=None,
+                 pumps_per_link=1, seed=None):
+        """
+        Create the manager and connect the pumps.
+
+        Args:
+            pump_count: Number of simulated pumps
+            hours: Length of the run
+            sample_seconds: Time between resource samples
+            csv_path: File to write the samples to (optional)
+            pumps_per_link: Pumps sharing each simulated link (1 = own port)
+            seed: Random seed, for repeatable action sequences
+        """
+        self.random = random.Random(seed)
+        self.duration = hours * 3600
+        self.sample_seconds = sample_seconds
+        self.csv_path = csv_path
+        self.samples = []
+        self.actions = {'dispense': 0, 'cancel': 0, 'refill': 0, 'reconnect': 0, 'rejected': 0}
+
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.log_dir = tempfile.mkdtemp(prefix="pump_soak_")
+        self.manager = PumpManager(self.root, log_dir=self.log_dir, listeners=False)
+        self.pumps = []
+        for i in range(pump_count):
+            pump = self.manager.add_pump(f"Soak {i + 1}")
+            if pumps_per_link > 1:
+                pump.port_var.set(f"SIM{i // pumps_per_link + 1}@{i % pumps_per_link + 1}")
+            else:
+                pump.port_var.set(f"SIM{i + 1}")
+            pump.window.withdraw()
+            pump.connect_to_arduino()
+            self.pumps.append(pump)
+
+    # ----------------- load -----------------
+
+    def act(self):
+        """Give every pump a random next step (Tk after() loop)"""
+        for pump in self.pumps:
+            if not pump.is_connected or pump.link_supervisor:
+                continue
+            if pump.is_dispensing or pump.is_retracting:
+                if self.random.random() < CANCEL_PROBABILITY:
+                    pump.cancel_dispense()
+                    self.actions['cancel'] += 1
+            elif self.random.random() < RECONNECT_PROBABILITY:
+                pump.disconnect_from_arduino()
+                pump.connect_to_arduino()
+                self.actions['reconnect'] += 1
+            else:
+                self.dispense(pump)
+        if self.running():
+            self.root.after(ACTION_INTERVAL_MS, self.act)
+
+    def dispense(self, pump):
+        """Start a random dispense, refilling first when the syringe runs low"""
+        if pump.syringe.position is None:
+            pump.send_command("SET_POS:0")
+            return
+        available = pump.syringe.available_volume()
+        if available is not None and available < REFILL_BELOW_ML:
+            pump.start_retract()
+            self.actions['refill'] += 1
+            return
+        volume = round(self.random.uniform(*VOLUME_RANGE), 3)
+        rate = round(self.random.uniform(*RATE_RANGE), 1)
+        try:
+            pump.profile.check_dispense(volume, rate)
+            pump.dispense_target_position = pump.syringe.check_dispense(volume)
+        except (CommandError, SyringeLimitError):
+            self.actions['rejected'] += 1
+            return
+        pump.begin_dispense(volume, rate)
+        self.actions['dispense'] += 1
+
+    # ----------------- sampling -----------------
+
+    def sample(self):
+        """Record one resource sample (Tk after() loop)"""
+        write_latencies = []
+        reader_lags = []
+        read_queue = write_queue = 0
+        for pump in self.pumps:
+            read_queue += pump.message_queue.qsize()
+            if pump.serial_writer:
+                write_queue += pump.serial_writer.depth
+                write_latencies.extend(pump.serial_writer.latencies)
+            reader_lags.append(pump.metrics.reader_lag)
+
+        views = [pump.log_view for pump in self.pumps] + [self.manager.system_log_view]
+        sample = {
+            'elapsed_s': round(time.monotonic() - self.started, 1),
+            'rss_mb': rss_mb(),
+            'threads': threading.active_count(),
+            'widgets': widget_count(self.root),
+            'log_view_lines': sum(view.line_count() for view in views),
+            'log_files_mb': directory_mb(self.log_dir, LOG_FILE_NAME),
+            'log_store_mb': directory_mb(self.log_dir, STORE_FILE_NAME),
+            'read_queue': read_queue,
+            'write_queue': write_queue,
+            'event_queue': self.manager.gui_events.queue.qsize(),
+            'log_queue': self.manager.log_pipeline.queue.qsize(),
+            'write_p50_ms': percentile(write_latencies, 0.5) * 1000,
+            'write_p95_ms': percentile(write_latencies, 0.95) * 1000,
+            'reader_lag_p95_ms': percentile(reader_lags, 0.95) * 1000,
+        }
+        self.samples.append(sample)
+        self.write_sample(sample)
+        print(f"[{sample['elapsed_s'] / 60:7.1f} min] rss {sample['rss_mb']:.0f} MB, "
+              f"{sample['threads']} threads, {sample['widgets']} widgets, "
+              f"{sample['log_view_lines']} view lines, "
+              f"write p95 {sample['write_p95_ms']:.1f} ms, "
+              f"lag p95 {sample['reader_lag_p95_ms']:.0f} ms", flush=True)
+        if self.running():
+            self.root.after(int(self.sample_seconds * 1000), self.sample)
+        else:
+            self.root.quit()
+
+    def write_sample(self, sample):
+        if not self.csv_path:
+            return
+        new_file = not os.path.exists(self.csv_path)
+        with open(self.csv_path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(sample))
+            if new_file:
+                writer.writeheader()
+            writer.writerow(sample)
+
+    # ----------------- run -----------------
+
+    def running(self):
+        return time.monotonic() - self.started < self.duration
+
+    def run(self):
+        """
+        Run the soak.
+
+        Returns:
+            (list of failure descriptions, {resource: (first, last)})
+        """
+        self.started = time.monotonic()
+        self.root.after(ACTION_INTERVAL_MS, self.act)
+        self.root.after(int(self.sample_seconds * 1000), self.sample)
+        self.root.mainloop()
+        return growth_failures(self.samples)
+
+    def close(self, keep_logs=False):
+        """Disconnect every pump, destroy the manager and remove its logs"""
+        self.manager.on_closing()
+        if keep_logs:
+            print(f"Logs kept in {self.log_dir}")
+        else:
+            shutil.rmtree(self.log_dir, ignore_errors=True)
+        print("Actions: " + ", ".join(f"{name} {count}" for name, count in self.actions.items()))
+        print(f"Threads left after closing: {threading.active_count()}")
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Soak-test the pump manager for resource growth")
+    parser.add_argument("--pumps", type=int, default=DEFAULT_PUMPS, help="simulated pumps")
+    parser.add_argument("--hours", type=float, default=DEFAULT_HOURS, help="length of the run")
+    parser.add_argument("--sample-seconds", type=float, default=DEFAULT_SAMPLE_SECONDS,
+                        help="time between resource samples")
+    parser.add_argument("--csv", help="write the samples to this CSV file")
+    parser.add_argument("--pumps-per-link", type=int, default=1,
+                        help="pumps sharing each simulated serial link (default 1)")
+    parser.add_argument("--seed", type=int, help="random seed")
+    parser.add_argument("--keep-logs", action="store_true",
+                        help="keep the temporary log directory for inspection")
+    args = parser.parse_args()
+
+    soak = SoakTest(args.pumps, args.hours, args.sample_seconds, args.csv,
+                    args.pumps_per_link, args.seed)
+    try:
+        failures, medians = soak.run()
+    finally:
+        soak.close(args.keep_logs)
+
+    for name, (first, last) in medians.items():
+        print(f"{name:>18}: {first:10.1f} -> {last:10.1f}")
+    for failure in failures:
+        print(f"GROWTH: {failure}")
+    if not failures:
+        print("No unbounded growth")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Strip Chart Module
+=================================================
+
+This module contains the StripChart class, a rolling time-series chart on
+a Tk canvas, used for the flow and volume charts in the pump windows and
+the fleet chart window.
+
+Each series keeps one [index, min, max, last] entry per pixel column for
+every selectable time span, in a deque as long as the plot is wide, so
+memory does not grow with the length of the run and switching span does
+not lose history. The canvas only ever holds one line item per series
+per visible column:
+
+- a sample redraws the column being filled (one item per series)
+- when time moves into a new column the view is panned by moving the
+  scroll region, not the items, and the column that left the plot is
+  deleted
+- a value above the y range rescales existing items in one canvas
+  scale() call; the range only grows (1-2-5 steps) until the span
+  changes or the chart is cleared
+
+Only a span change or clear() redraws everything, from the column
+buffers.
+
+Features:
+- Min/max decimation per pixel column
+- Constant memory and drawing work per sample, however long the history
+- 1 min, 10 min, 1 h and 8 h spans
+- Any number of series, added and removed while running
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import collections
+import math
+import time
+import tkinter as tk
+
+# (label, seconds)
+SPANS = (("1 min", 60), ("10 min", 600), ("1 h", 3600), ("8 h", 8 * 3600))
+SPAN_LABELS = tuple(label for label, _ in SPANS)
+DEFAULT_SPAN = "10 min"
+
+# Plot area in pixels; one column per pixel
+PLOT_WIDTH = 400
+PLOT_HEIGHT = 70
+MARGIN_LEFT = 46
+MARGIN_RIGHT = 4
+MARGIN_TOP = 14
+MARGIN_BOTTOM = 4
+
+# Smallest y range, so an idle pump does not chart noise at full height
+MIN_Y_MAX = 1.0
+
+COLORS = ("#1f77b4", "#d62728", "#2ca02c", "#ff7f0e", "#9467bd",
+          "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf")
+
+
+def nice_ceiling(value):
+    """Smallest 1, 2 or 5 x 10^n at or above value (at least MIN_Y_MAX)"""
+    if value <= MIN_Y_MAX:
+        return MIN_Y_MAX
+    power = 10.0 ** math.floor(math.log10(value))
+    for step in (1, 2, 5, 10):
+        if step * power >= value:
+            return step * power
+    return 10 * power
+
+
+class ColumnBuffer:
+    """
+    Min, max and last value per pixel column for one series at one span.
+    """
+
+    def __init__(self, column_seconds, columns):
+        """
+        Args:
+            column_seconds: Time covered by one column
+            columns: Columns kept (the plot width)
+        """
+        self.column_seconds = column_seconds
+        self.columns = collections.deque(maxlen=columns)
+
+    def add(self, t, value):
+        """Add a sample at t seconds since the chart started"""
+        index = int(t // self.column_seconds)
+        columns = self.columns
+        if columns and columns[-1][0] == index:
+            column = columns[-1]
+            if value < column[1]:
+                column[1] = value
+            if value > column[2]:
+                column[2] = value
+            column[3] = value
+        else:
+            columns.append([index, value, value, value])
+
+    def peak(self):
+        """Largest value kept"""
+        return max((column[2] for column in self.columns), default=0.0)
+
+    def clear(self):
+        self.columns.clear()
+
+
+class ChartSeries:
+    """
+    One line on a StripChart.
+    """
+
+    def __init__(self, key, color, number):
+        self.key = key
+        self.color = color
+        self.tag = f"s{number}"
+        self.buffers = {label: ColumnBuffer(seconds / PLOT_WIDTH, PLOT_WIDTH)
+                        for label, seconds in SPANS}
+
+
+class StripChart:
+    """
+    Rolling min/max-decimated time-series chart on a Tk canvas.
+
+    Call add() from the GUI thread with the latest value of each series;
+    the caller decides the sampling rate.
+    """
+
+    def __init__(self, parent, title, span=DEFAULT_SPAN):
+        """
+        Create the chart canvas (pack or grid self.canvas).
+
+        Args:
+            parent: Parent widget
+            title: Text at the top left, e.g. "Flow (mL/min)"
+            span: One of SPAN_LABELS
+        """
+        self.title = title
+        self.origin = time.monotonic()
+        self.series = {}
+        self.series_count = 0
+        self.y_max = MIN_Y_MAX
+        # Column at the right edge of the plot, and columns with items
+        self.column = 0
+        self.drawn = collections.deque()
+        self.view_left = 0
+
+        self.canvas = tk.Canvas(parent, width=MARGIN_LEFT + PLOT_WIDTH + MARGIN_RIGHT,
+                                height=MARGIN_TOP + PLOT_HEIGHT + MARGIN_BOTTOM,
+                                background="white", highlightthickness=0, borderwidth=0)
+        self.bottom = MARGIN_TOP + PLOT_HEIGHT
+        # Fixed decorations, moved along with the view
+        self.canvas.create_rectangle(MARGIN_LEFT, MARGIN_TOP, MARGIN_LEFT + PLOT_WIDTH, self.bottom,
+                                     outline="#c0c0c0", tags="axis")
+        self.canvas.create_text(MARGIN_LEFT, 1, text=title, anchor="nw", tags="axis")
+        self.max_label = self.canvas.create_text(MARGIN_LEFT - 3, MARGIN_TOP, anchor="e",
+                                                 tags="axis")
+        self.canvas.create_text(MARGIN_LEFT - 3, self.bottom, text="0", anchor="e", tags="axis")
+        self.span_label = self.canvas.create_text(MARGIN_LEFT + PLOT_WIDTH, 1, anchor="ne",
+                                                  tags="axis")
+        self.set_span(span)
+
+    def add_series(self, key, color=None):
+        """
+        Add a line.
+
+        Args:
+            key: Any hashable identifier used with add()
+            color: Tk color; the next of COLORS by default
+        """
+        if key in self.series:
+            return
+        if color is None:
+            color = COLORS[self.series_count % len(COLORS)]
+        self.series[key] = ChartSeries(key, color, self.series_count)
+        self.series_count += 1
+
+    def remove_series(self, key):
+        """Remove a line and its items"""
+        series = self.series.pop(key, None)
+        if series:
+            self.canvas.delete(series.tag)
+
+    def add(self, values, now=None):
+        """
+        Record one sample per series and update the plot.
+
+        Args:
+            values: Dict of series key -> value; unknown keys are ignored
+            now: time.monotonic() of the sample (default: now)
+        """
+        t = (time.monotonic() if now is None else now) - self.origin
+        peak = 0.0
+        for key, value in values.items():
+            series = self.series.get(key)
+            if series is None:
+                continue
+            for buffer in series.buffers.values():
+                buffer.add(t, value)
+            if value > peak:
+                peak = value
+        if peak > self.y_max:
+            self.rescale(nice_ceiling(peak))
+
+        index = int(t // self.column_seconds)
+        if index != self.column:
+            self.scroll_to(index)
+        # Redraw the column being filled
+        self.canvas.delete(f"c{index}")
+        if not self.drawn or self.drawn[-1] != index:
+            self.drawn.append(index)
+        for series in self.series.values():
+            columns = series.buffers[self.span].columns
+            if columns and columns[-1][0] == index:
+                previous = columns[-2] if len(columns) > 1 else None
+                self.draw_column(series, columns[-1], previous)
+
+    def set_span(self, span):
+        """Show another time span (redraws from the column buffers)"""
+        self.span = span
+        self.column_seconds = dict(SPANS)[span] / PLOT_WIDTH
+        self.canvas.itemconfigure(self.span_label, text=f"last {span}")
+        self.redraw()
+
+    def clear(self):
+        """Forget all samples"""
+        for series in self.series.values():
+            for buffer in series.buffers.values():
+                buffer.clear()
+        self.redraw()
+
+    def redraw(self):
+        """Draw every column again (span change or clear)"""
+        self.canvas.delete("data")
+        self.drawn.clear()
+        peak = max((series.buffers[self.span].peak() for series in self.series.values()),
+                   default=0.0)
+        self.y_max = nice_ceiling(peak)
+        self.canvas.itemconfigure(self.max_label, text=f"{self.y_max:g}")
+        index = int((time.monotonic() - self.origin) // self.column_seconds)
+        self.scroll_to(index)
+        oldest = index - PLOT_WIDTH
+        drawn = set()
+        for series in self.series.values():
+            previous = None
+            for column in series.buffers[self.span].columns:
+                if column[0] > oldest:
+                    self.draw_column(series, column, previous)
+                    drawn.add(column[0])
+                previous = column
+        self.drawn.extend(sorted(drawn))
+
+    def scroll_to(self, index):
+        """Put column index at the right edge and delete columns that left the plot"""
+        left = index - PLOT_WIDTH + 1 - MARGIN_LEFT
+        self.canvas.move("axis", left - self.view_left, 0)
+        self.view_left = left
+        self.column = index
+        self.canvas.configure(scrollregion=(left, 0, left + MARGIN_LEFT + PLOT_WIDTH + MARGIN_RIGHT,
+                                            self.bottom + MARGIN_BOTTOM))
+        self.canvas.xview_moveto(0)
+        oldest = index - PLOT_WIDTH
+        drawn = self.drawn
+        while drawn and drawn[0] <= oldest:
+            self.canvas.delete(f"c{drawn.popleft()}")
+
+    def rescale(self, y_max):
+        """Grow the y range, rescaling the items already drawn"""
+        self.canvas.scale("data", 0, self.bottom, 1, self.y_max / y_max)
+        self.y_max = y_max
+        self.canvas.itemconfigure(self.max_label, text=f"{y_max:g}")
+
+    def y(self, value):
+        return self.bottom - value / self.y_max * PLOT_HEIGHT
+
+    def draw_column(self, series, column, previous):
+        """
+        One line item from the previous column's last value through this
+        column's min and max to its last value.
+        """
+        index, low, high, last = column
+        y = self.y
+        if previous is not None and previous[0] == index - 1:
+            coords = (index - 1, y(previous[3]))
+        else:
+            coords = (index - 1, y(last))
+        coords += (index, y(low), index, y(high), index, y(last))
+        self.canvas.create_line(*coords, fill=series.color,
+                                tags=("data", series.tag, f"c{index}"))
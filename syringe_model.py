@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Syringe Model Module
+===================================================
+
+This module contains the SyringeModel class which mirrors the plunger
+position and software limits of a pump on the host.
+
+The firmware silently clamps every move to MAX_STEPS and still reports
+DISPENSE_COMPLETE, so a dispense that overruns the syringe just stops
+short. The model lets the host reject (or split) such a dispense before
+it is ever sent, and predict when a syringe needs a refill.
+
+Features:
+- Plunger position tracking from SET_VOL, SET_POS and position telemetry
+- Pre-send limit checks and dispense splitting
+- Refill prediction for planned dispense campaigns
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import struct
+
+# Defaults mirror sketch_Final.ino (1/16 microstepping, 0.5 mL per rev)
+DEFAULT_STEPS_PER_ML = 3200 / 0.5
+MAX_STEPS = 45000 * 20
+MIN_STEPS = 0
+
+# steps_to_move echoes shorter than this say too little about steps_per_ml
+# (the truncated count leaves a 1/steps relative range)
+MIN_LEARN_STEPS = 1000
+
+
+def to_float32(value):
+    """Round a number to the Arduino's 32-bit float"""
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def firmware_steps(volume, steps_per_ml):
+    """
+    Steps the firmware computes for a volume: long steps = volume * steps_per_ml,
+    in 32-bit float arithmetic and truncated (0.145 mL at 6400 steps/mL is
+    928 steps there, but 927 with Python floats).
+    """
+    return int(to_float32(to_float32(volume) * to_float32(steps_per_ml)))
+
+
+class SyringeLimitError(ValueError):
+    """Raised when a dispense would be clamped by the firmware step limits"""
+
+    def __init__(self, message, available_volume):
+        super().__init__(message)
+        self.available_volume = available_volume
+
+
+class SyringeModel:
+    """
+    Host-side mirror of a pump's plunger position.
+
+    Positions are in steps, exactly as the firmware counts them: dispensing
+    moves the plunger towards max_steps and RETRACT returns it to zero.
+    The position is None until SET_VOL, SET_POS or telemetry reports it.
+    """
+
+    def __init__(self, steps_per_ml=DEFAULT_STEPS_PER_ML, max_steps=MAX_STEPS,
+                 min_steps=MIN_STEPS):
+        """
+        Initialize the syringe model.
+
+        Args:
+            steps_per_ml: Microsteps per mL of plunger travel
+            max_steps: Firmware MAX_STEPS software limit
+            min_steps: Firmware MIN_STEPS software limit
+        """
+        self.steps_per_ml = steps_per_ml
+        self.max_steps = max_steps
+        self.min_steps = min_steps
+        self.position = None
+
+    @property
+    def is_known(self):
+        """Whether the plunger position has been reported by the device"""
+        return self.position is not None
+
+    @property
+    def capacity(self):
+        """Volume of a full stroke, in mL"""
+        return (self.max_steps - self.min_steps) / self.steps_per_ml
+
+    def available_volume(self):
+        """Volume that can still be dispensed before MAX_STEPS, in mL"""
+        if self.position is None:
+            return None
+        return max(0.0, (self.max_steps - self.position) / self.steps_per_ml)
+
+    def steps_for_volume(self, volume):
+        """Steps the firmware will move for a volume (it truncates to long)"""
+        return firmware_steps(volume, self.steps_per_ml)
+
+    def set_volume(self, volume):
+        """Mirror SET_VOL:<mL>, which sets the position to volume * steps_per_ml"""
+        self.position = self.steps_for_volume(volume)
+
+    def set_position(self, steps):
+        """Mirror SET_POS:<steps> or a position telemetry sample"""
+        self.position = int(steps)
+
+    def learn_steps_per_ml(self, steps, volume):
+        """
+        Update steps_per_ml from the firmware's steps_to_move echo.
+
+        The echo is truncated, so steps / volume is only a lower bound (a
+        0.001 mL move is 6 steps at 6400 steps/mL, which would give 6000).
+        The current value is kept while it still reproduces the echo, and
+        moves under MIN_LEARN_STEPS are ignored; otherwise the first of
+        steps / volume and the middle of the range that reproduces the
+        echo is taken.
+
+        Returns:
+            True if steps_per_ml changed
+        """
+        if steps < MIN_LEARN_STEPS or volume <= 0:
+            return False
+        if firmware_steps(volume, self.steps_per_ml) == steps:
+            return False
+        for candidate in (steps / volume, (steps + 0.5) / volume):
+            if firmware_steps(volume, candidate) == steps:
+                self.steps_per_ml = candidate
+                return True
+        return False
+
+    def check_dispense(self, volume):
+        """
+        Raise SyringeLimitError if a dispense would hit MAX_STEPS.
+
+        Args:
+            volume: Requested volume in mL
+
+        Returns:
+            The target position in steps, or None if the position is unknown
+        """
+        if self.position is None:
+            return None
+        target = self.position + self.steps_for_volume(volume)
+        if target > self.max_steps:
+            available = self.available_volume()
+            raise SyringeLimitError(
+                f"{volume:.2f} mL exceeds the {available:.2f} mL left before the "
+                f"syringe limit", available)
+        return target
+
+    def split_dispense(self, volume):
+        """
+        Split a dispense into chunks that each fit in the syringe.
+
+        The first chunk uses what is left in the current stroke; every
+        following chunk assumes a refill (RETRACT) to a full stroke.
+
+        Args:
+            volume: Requested volume in mL
+
+        Returns:
+            List of chunk volumes in mL, one per stroke
+        """
+        available = self.available_volume()
+        if available is None or volume <= available:
+            return [volume]
+        chunks = [available] if available > 0 else []
+        remaining = volume - available
+        while remaining > 1e-9:
+            chunk = min(remaining, self.capacity)
+            chunks.append(chunk)
+            remaining -= chunk
+        return chunks
+
+    def time_until_refill(self, rate):
+        """
+        Minutes of continuous dispensing at a rate before a refill is needed.
+
+        Args:
+            rate: Flow rate in mL/min
+
+        Returns:
+            Minutes until MAX_STEPS, or None if the position is unknown
+        """
+        available = self.available_volume()
+        if available is None or rate <= 0:
+            return None
+        return available / rate
+
+    def plan_campaign(self, dispenses):
+        """
+        Predict where refills fall in a sequence of dispenses.
+
+        Args:
+            dispenses: Iterable of (volume, rate) tuples, in run order
+
+        Returns:
+            List of dicts, one per dispense, with 'volume', 'refill_before'
+            and 'start_minute' (dispensing time before it starts, refills
+            excluded)
+        """
+        position = self.position if self.position is not None else self.min_steps
+        plan = []
+        elapsed = 0.0
+        for volume, rate in dispenses:
+            steps = self.steps_for_volume(volume)
+            if steps > self.max_steps - self.min_steps:
+                raise SyringeLimitError(
+                    f"{volume:.2f} mL is larger than a full stroke "
+                    f"({self.capacity:.2f} mL)", self.capacity)
+            refill_before = position + steps > self.max_steps
+            if refill_before:
+                position = self.min_steps
+            plan.append({'volume': volume, 'refill_before': refill_before,
+                         'start_minute': elapsed})
+            position += steps
+            elapsed += volume / rate if rate > 0 else 0.0
+        return plan
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Transcript Replay
+================================================
+
+This script feeds recorded serial transcripts back through the real
+PumpWindow message path (message queue -> drain_messages ->
+handle_arduino_message), without hardware.
+
+Transcripts are either:
+- Tab-separated text: <seconds>\\t<pump name>\\t<received line>
+- The JSON-lines logs written by pump_logging.py (optionally .gz); every
+  "Received: ..." record becomes one line for its pump. A log spans
+  manager restarts and time.monotonic() restarts at reboot, so the log is
+  split into sessions wherever "mono" goes backwards; each session keeps
+  its own mono timing and starts after the previous one, by the wall
+  clock gap between them
+
+The replay runs its manager on a temporary log directory with the metrics
+and trigger listeners off, so replayed lines and dispenses do not reach
+the lab's log store or dispense ledger.
+
+Features:
+- Real-time, N x and as-fast-as-possible replay
+- End-state snapshots for repeatable regression tests
+- Throughput of the parse/state pipeline, measured without hardware
+
+Usage:
+    python transcript_replay.py run.tsv --speed 10
+    python transcript_replay.py logs/pumps.jsonl --speed 0 --save-expected run.expected.json
+    python transcript_replay.py logs/pumps.jsonl --speed 0 --expected run.expected.json
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tkinter as tk
+
+from pump_manager import PumpManager
+
+# "mono" going back by more than this starts a new session (reboot)
+SESSION_BREAK_SECONDS = 1.0
+
+# load_transcript(sent=True) marks commands the host sent with this prefix
+SENT_PREFIX = "> "
+
+
+def open_text(path):
+    """Open a transcript, transparently decompressing .gz files"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def wall_seconds(record):
+    """Wall-clock time of a JSON-lines record in seconds, or None"""
+    try:
+        return datetime.datetime.strptime(record['time'], "%Y-%m-%dT%H:%M:%S.%f").timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def load_transcript(path, sent=False):
+    """
+    Load a transcript.
+
+    Args:
+        path: .tsv/.txt transcript or JSON-lines log (.jsonl, .jsonl.gz)
+        sent: Also return the commands the host sent (JSON-lines logs only),
+            as lines starting with SENT_PREFIX
+
+    Returns:
+        List of (seconds from the first line, pump name, line), in time order
+    """
+    entries = []
+    # JSON-lines sessions: offset of the current one, its first mono and wall time
+    offset = session_mono = first_wall = last_mono = None
+    end = 0.0
+    with open_text(path) as f:
+        for raw in f:
+            raw = raw.rstrip("\n")
+            if not raw.strip() or raw.startswith("#"):
+                continue
+            if raw.startswith("{"):
+                record = json.loads(raw)
+                mono = record['mono']
+                if last_mono is None:
+                    offset, session_mono, first_wall = 0.0, mono, wall_seconds(record)
+                elif mono < last_mono - SESSION_BREAK_SECONDS:
+                    # Rebooted: place the new session after the previous one
+                    wall = wall_seconds(record)
+                    gap = wall - first_wall if wall is not None and first_wall is not None else 0.0
+                    offset, session_mono = max(end, gap), mono
+                last_mono = mono
+                t = offset + mono - session_mono
+                end = max(end, t)
+                message = record.get('message', "")
+                if record.get('source') != "pump":
+                    continue
+                if message.startswith("Received: "):
+                    line = message[10:]
+                elif sent and message.startswith(("Sent: ", "Sent by trigger: ")):
+                    line = SENT_PREFIX + message.partition(": ")[2]
+                else:
+                    continue
+                entries.append((t, record.get('pump') or record.get('pump_id'), line))
+            else:
+                seconds, pump, line = raw.split("\t", 2)
+                entries.append((float(seconds), pump, line))
+
+    entries.sort(key=lambda entry: entry[0])
+    if entries:
+        start = entries[0][0]
+        entries = [(t - start, pump, line) for t, pump, line in entries]
+    return entries
+
+
+def snapshot(pump):
+    """End state of a replayed pump, for regression comparisons"""
+    return {
+        'is_dispensing': pump.is_dispensing,
+        'progress_bar': round(float(pump.progress_bar['value'] or 0), 1),
+        'progress_text': pump.progress_var.get(),
+        'syringe_position': pump.syringe.position,
+        'steps_per_ml': round(pump.syringe.steps_per_ml, 3),
+        'report_interval': pump.report_interval,
+    }
+
+
+class TranscriptReplay:
+    """
+    Replays a transcript into pump windows inside a PumpManager.
+    """
+
+    def __init__(self, manager, entries):
+        """
+        Create one pump window per pump in the transcript.
+
+        Args:
+            manager: PumpManager to add the replay pumps to
+            entries: Output of load_transcript()
+        """
+        self.manager = manager
+        self.entries = entries
+        self.pumps = {}
+        for _, name, _ in entries:
+            if name not in self.pumps:
+                self.pumps[name] = manager.add_pump(name)
+        self.finished = threading.Event()
+        self.elapsed = 0.0
+
+    def run_fast(self):
+        """
+        Push every line through the pipeline as fast as possible (Tk thread).
+
+        Returns:
+            Lines per second
+        """
+        started = time.perf_counter()
+        for _, name, line in self.entries:
+            pump = self.pumps[name]
+            pump.message_queue.put(line)
+            pump.drain_messages()
+        self.elapsed = time.perf_counter() - started
+        self.finished.set()
+        return len(self.entries) / self.elapsed if self.elapsed > 0 else float("inf")
+
+    def start_timed(self, speed):
+        """
+        Feed lines on a background thread at speed x the recorded pace. The
+        pump windows' own after() loops drain them, as with a real port.
+
+        Args:
+            speed: 1.0 for real time, 10.0 for 10 x, ...
+        """
+        def feed():
+            started = time.perf_counter()
+            for t, name, line in self.entries:
+                delay = started + t / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.pumps[name].message_queue.put(line)
+            self.elapsed = time.perf_counter() - started
+            self.finished.set()
+
+        threading.Thread(target=feed, daemon=True).start()
+
+    def snapshots(self):
+        """End state of every replayed pump, keyed by pump name"""
+        return {name: snapshot(pump) for name, pump in self.pumps.items()}
+
+
+def compare_snapshots(actual, expected):
+    """List the differences between two snapshot dicts"""
+    differences = []
+    for name in sorted(set(actual) | set(expected)):
+        if name not in actual or name not in expected:
+            differences.append(f"{name}: only in {'expected' if name in expected else 'replay'}")
+            continue
+        for key, value in expected[name].items():
+            if actual[name].get(key) != value:
+                differences.append(f"{name}.{key}: {actual[name].get(key)!r} != {value!r}")
+    return differences
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Replay serial transcripts through PumpWindow")
+    parser.add_argument("transcript", help="transcript (.tsv) or JSON-lines log")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed (1 = real time, 10 = 10x, 0 = as fast as possible)")
+    parser.add_argument("--expected", help="snapshot JSON to compare the end state with")
+    parser.add_argument("--save-expected", help="write the end state snapshot to this file")
+    args = parser.parse_args()
+
+    entries = load_transcript(args.transcript)
+    if not entries:
+        print("Transcript is empty")
+        return 1
+
+    root = tk.Tk()
+    log_dir = tempfile.mkdtemp(prefix="pump_replay_")
+    manager = PumpManager(root, log_dir=log_dir, listeners=False)
+    replay = TranscriptReplay(manager, entries)
+
+    if args.speed <= 0:
+        rate = replay.run_fast()
+        print(f"Replayed {len(entries)} lines in {replay.elapsed:.3f} s ({rate:.0f} lines/s)")
+    else:
+        replay.start_timed(args.speed)
+
+        def wait_for_finish():
+            if replay.finished.is_set() and all(
+                    pump.message_queue.empty() for pump in replay.pumps.values()):
+                root.quit()
+            else:
+                root.after(100, wait_for_finish)
+
+        root.after(100, wait_for_finish)
+        root.mainloop()
+        print(f"Replayed {len(entries)} lines in {replay.elapsed:.3f} s at {args.speed:g}x")
+
+    # Let the final drain and log consumers catch up
+    for pump in replay.pumps.values():
+        pump.drain_messages()
+    actual = replay.snapshots()
+    manager.on_closing()
+    shutil.rmtree(log_dir, ignore_errors=True)
+
+    if args.save_expected:
+        with open(args.save_expected, "w") as f:
+            json.dump(actual, f, indent=2)
+        print(f"Snapshot saved to {args.save_expected}")
+
+    if args.expected:
+        with open(args.expected) as f:
+            differences = compare_snapshots(actual, json.load(f))
+        for difference in differences:
+            print(f"MISMATCH: {difference}")
+        if differences:
+            return 1
+        print("End state matches")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Trigger Module
+=============================================
+
+This module contains the TriggerInput class which starts pre-armed
+dispenses the moment another instrument (a camera, a valve controller,
+a script) sends a trigger.
+
+Starting a dispense from the GUI goes through validation, logging, the
+writer queue and Tk's event loop, which adds milliseconds of jitter.
+Arming does all of that ahead of time instead. Each selected pump's
+DISPENSE line is checked against its device profile and syringe, encoded
+to bytes, and handed to a writer thread that is already waiting. The
+trigger listener blocks on a local UDP socket. When a datagram arrives it
+timestamps it and releases the writers. Each one checks its pump again
+(the GUI, a PumpClient or a flow profile may have started it since), hands
+the dispense to the pump window's message queue so tracking starts before
+any reply is handled, and writes the line through the pump writer's lock
+ahead of its queue, as the emergency stop does. The GUI only updates its
+displays.
+
+Any datagram on 127.0.0.1:9110 (PUMP_TRIGGER_PORT) fires, for example
+from a shell:
+
+    echo FIRE | nc -u -w0 127.0.0.1 9110
+
+The sender gets "FIRED <pumps> <worst trigger-to-write us>" back, or
+"NOT_ARMED". In-process code can call fire() instead.
+
+Features:
+- Pre-validated, pre-encoded DISPENSE commands on pre-started threads
+- One-shot arming of any set of pumps with their own volume and rate
+- Trigger-to-write latency per pump and over recent triggers
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import collections
+import os
+import queue
+import socket
+import threading
+import time
+
+from device_profile import CommandError
+from syringe_model import SyringeLimitError
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9110
+
+# Seconds the listener waits for the armed writes to finish
+WRITE_TIMEOUT = 1.0
+
+# Triggers kept for the latency statistics
+HISTORY_LENGTH = 1000
+
+
+def trigger_port():
+    """Port from PUMP_TRIGGER_PORT (default 9110); 0 disables the listener"""
+    return int(os.environ.get("PUMP_TRIGGER_PORT", DEFAULT_PORT))
+
+
+class ArmedDispense:
+    """
+    One pump's pre-encoded DISPENSE, waiting for the trigger.
+
+    Attributes:
+        written_at: perf_counter time the bytes were written (None until fired)
+        written_mono: time.monotonic() just before the write, for the motion model
+        error: Why the dispense was not written (busy pump, write error)
+        tracking: Set by the pump window: True once it tracks the dispense,
+            False if it never will (None until it sees it)
+        dispense_id: The pump window's id for the dispense, once tracked
+    """
+
+    def __init__(self, pump, volume, rate):
+        self.pump = pump
+        self.volume = volume
+        self.rate = rate
+        self.target_position = None
+        self.command = f"DISPENSE:{volume},{rate}"
+        self.data = f"{self.command}\n".encode()
+        self.cancelled = False
+        self.written_at = None
+        self.written_mono = None
+        self.error = None
+        self.tracking = None
+        self.dispense_id = None
+
+    def check(self):
+        """
+        Check that the pump can take the dispense now (at arm and fire time).
+
+        Returns:
+            The pump's SerialWriter
+
+        Raises:
+            ValueError: The pump is disconnected or busy, or the dispense
+                would be clamped (SyringeLimitError)
+        """
+        pump = self.pump
+        writer = pump.serial_writer
+        if not pump.is_connected or writer is None:
+            raise ValueError("not connected")
+        if pump.is_dispensing or pump.is_retracting or pump.link_supervisor:
+            raise ValueError("busy")
+        try:
+            self.target_position = pump.syringe.check_dispense(self.volume)
+        except SyringeLimitError as e:
+            raise ValueError(str(e))
+        return writer
+
+
+class TriggerResult:
+    """
+    Outcome of one trigger.
+
+    Attributes:
+        received_at: perf_counter time the trigger arrived
+        source: Sender address, or "local" for fire()
+        dispenses: ArmedDispense objects that were fired
+    """
+
+    def __init__(self, received_at, source, dispenses):
+        self.received_at = received_at
+        self.source = source
+        self.dispenses = dispenses
+
+    @property
+    def latencies(self):
+        """Pump name -> seconds from trigger to bytes written (pumps not started left out)"""
+        return {armed.pump.name: armed.written_at - self.received_at
+                for armed in self.dispenses if armed.written_at is not None}
+
+    @property
+    def errors(self):
+        """Pump name -> why it was not started"""
+        return {armed.pump.name: armed.error for armed in self.dispenses if armed.error}
+
+    @property
+    def worst_case(self):
+        latencies = self.latencies.values()
+        return max(latencies) if latencies else None
+
+    def summary(self):
+        """One-line summary for the system log"""
+        latencies = sorted(self.latencies.values())
+        text = f"Trigger from {self.source}: {len(latencies)}/{len(self.dispenses)} pumps started"
+        if latencies:
+            text += f", trigger-to-write {latencies[0] * 1e6:.0f}-{latencies[-1] * 1e6:.0f} us"
+        if self.errors:
+            text += "; not started: " + ", ".join(f"{name} ({error})"
+                                                  for name, error in self.errors.items())
+        return text
+
+
+class TriggerInput:
+    """
+    Local trigger listener that fires armed dispenses.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Bind the trigger socket.
+
+        Args:
+            host: Interface to listen on (localhost by default)
+            port: UDP port (0 picks a free one)
+
+        Raises:
+            OSError: The port is in use
+        """
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.lock = threading.Lock()
+        self.armed = []
+        self.writers = []
+        self.release = threading.Event()
+        self.results = queue.Queue()
+        self.history = collections.deque(maxlen=HISTORY_LENGTH)
+        self.last_result = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._listen, name="trigger", daemon=True)
+
+    @property
+    def address(self):
+        """(host, port) actually bound"""
+        return self.socket.getsockname()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        """Disarm and stop listening"""
+        self.closed = True
+        self.disarm()
+        self.socket.close()
+
+    # ----------------- arming (GUI thread) -----------------
+
+    def arm(self, requests):
+        """
+        Check and pre-encode dispenses and start their writer threads.
+
+        Args:
+            requests: Iterable of (PumpWindow, volume mL, rate mL/min)
+
+        Returns:
+            Number of pumps armed
+
+        Raises:
+            ValueError: A pump is busy or disconnected, or a dispense would be
+                rejected (CommandError) or clamped (SyringeLimitError); nothing
+                is armed then
+        """
+        armed = []
+        for pump, volume, rate in requests:
+            entry = ArmedDispense(pump, volume, rate)
+            try:
+                entry.check()
+                pump.profile.check_dispense(volume, rate)
+            except (CommandError, ValueError) as e:
+                raise ValueError(f"{pump.name}: {e}")
+            armed.append(entry)
+        if not armed:
+            raise ValueError("Select at least one pump")
+
+        self.disarm()
+        release = threading.Event()
+        writers = [threading.Thread(target=self._write_when_released, args=(entry, release),
+                                    daemon=True) for entry in armed]
+        for thread in writers:
+            thread.start()
+        with self.lock:
+            self.armed, self.writers, self.release = armed, writers, release
+        return len(armed)
+
+    def disarm(self):
+        """Drop the armed dispenses without writing them"""
+        with self.lock:
+            armed, writers, release = self.armed, self.writers, self.release
+            self.armed, self.writers = [], []
+        for entry in armed:
+            entry.cancelled = True
+        release.set()
+        for thread in writers:
+            thread.join(WRITE_TIMEOUT)
+
+    @property
+    def is_armed(self):
+        return bool(self.armed)
+
+    # ----------------- firing -----------------
+
+    def _write_when_released(self, armed, release):
+        """
+        Writer thread: wait for the trigger, check the pump again, then write
+        the pre-encoded line.
+
+        The ArmedDispense goes into the pump window's message queue before
+        the write (and again if the write fails), so the window starts
+        tracking the dispense before it handles any reply to it.
+        """
+        release.wait()
+        if armed.cancelled:
+            return  # disarmed
+        try:
+            writer = armed.check()
+        except ValueError as e:
+            armed.error = str(e)
+            return
+        armed.written_mono = time.monotonic()
+        armed.pump.message_queue.put(armed)
+        try:
+            writer.write_now(armed.data)
+            armed.written_at = time.perf_counter()
+        except Exception as e:
+            armed.error = str(e)
+            armed.pump.message_queue.put(armed)
+
+    def fire(self, source="local", received_at=None):
+        """
+        Fire the armed dispenses now (any thread).
+
+        Args:
+            source: Description of the trigger source for the log
+            received_at: perf_counter time the trigger arrived (default now)
+
+        Returns:
+            TriggerResult, or None if nothing was armed
+        """
+        received_at = time.perf_counter() if received_at is None else received_at
+        with self.lock:
+            armed, writers, release = self.armed, self.writers, self.release
+            self.armed, self.writers = [], []
+        if not armed:
+            return None
+        release.set()
+        for thread in writers:
+            thread.join(WRITE_TIMEOUT)
+
+        result = TriggerResult(received_at, source, armed)
+        self.history.extend(result.latencies.values())
+        self.last_result = result
+        self.results.put(result)
+        return result
+
+    def _listen(self):
+        """Listener thread: every datagram is a trigger"""
+        while not self.closed:
+            try:
+                _, sender = self.socket.recvfrom(256)
+            except OSError:
+                return  # closed
+            received_at = time.perf_counter()
+            result = self.fire(f"{sender[0]}:{sender[1]}", received_at)
+            if result is None:
+                reply = "NOT_ARMED"
+            else:
+                worst = result.worst_case
+                reply = f"FIRED {len(result.latencies)} {worst * 1e6:.0f}" if worst is not None \
+                    else "FIRED 0 -"
+            try:
+                self.socket.sendto(reply.encode(), sender)
+            except OSError:
+                pass
+
+    def latency_stats(self):
+        """
+        Summarize trigger-to-write latencies over recent triggers.
+
+        Returns:
+            Dict with count, p50_us, p99_us and max_us (empty before the first trigger)
+        """
+        samples = sorted(self.history)
+        if not samples:
+            return {}
+        return {
+            'count': len(samples),
+            'p50_us': samples[len(samples) // 2] * 1e6,
+            'p99_us': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6,
+            'max_us': samples[-1] * 1e6,
+        }
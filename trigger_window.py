@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Arduino Syringe-Pump Manager - Trigger Window Module
+====================================================
+
+This module contains the TriggerWindow class which arms pumps for an
+external trigger (see trigger.py) and shows the trigger-to-write latency.
+
+Features:
+- Pump selection; each pump dispenses the volume and rate set in its window
+- Arm / disarm
+- Last trigger and latency statistics
+
+Author: Beidaghi Lab
+Version: 2.0
+"""
+
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+UPDATE_INTERVAL_MS = 500
+
+
+class TriggerWindow:
+    """
+    Trigger arming and latency window.
+    """
+
+    def __init__(self, trigger_input, pump_windows):
+        """
+        Initialize the trigger window.
+
+        Args:
+            trigger_input: The manager's TriggerInput
+            pump_windows: Dict of pump_id -> PumpWindow to choose from
+        """
+        self.trigger_input = trigger_input
+        self.pump_windows = pump_windows
+        self.create_window()
+        self.update_status()
+
+    def create_window(self):
+        """Create the trigger window"""
+        self.window = tk.Toplevel()
+        self.window.title("External Trigger")
+        self.window.geometry("460x420")
+
+        main_frame = ttk.Frame(self.window, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        host, port = self.trigger_input.address[:2]
+        ttk.Label(main_frame, text=f"Any UDP datagram to {host}:{port} fires the armed pumps.",
+                  wraplength=420).pack(anchor="w")
+
+        pump_frame = ttk.LabelFrame(main_frame, text="Pumps (volume and rate from each pump window)",
+                                    padding=10)
+        pump_frame.pack(fill="x", pady=10)
+        self.pump_list = tk.Listbox(pump_frame, selectmode="multiple", height=6, exportselection=False)
+        self.pump_list.pack(fill="x")
+        self.pump_ids = [pump_id for pump_id, pump in self.pump_windows.items() if pump.is_connected]
+        for pump_id in self.pump_ids:
+            self.pump_list.insert("end", self.pump_windows[pump_id].name)
+
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(fill="x")
+        self.arm_btn = ttk.Button(button_frame, text="Arm", command=self.arm)
+        self.arm_btn.pack(side="left")
+        self.disarm_btn = ttk.Button(button_frame, text="Disarm", command=self.disarm)
+        self.disarm_btn.pack(side="left", padx=5)
+
+        status_frame = ttk.LabelFrame(main_frame, text="Status", padding=10)
+        status_frame.pack(fill="both", expand=True, pady=10)
+        self.status_var = tk.StringVar(value="Not armed")
+        ttk.Label(status_frame, textvariable=self.status_var, justify="left",
+                  wraplength=420).pack(anchor="w")
+
+    def arm(self):
+        """Arm the selected pumps with their current volume and rate"""
+        requests = []
+        try:
+            for i in self.pump_list.curselection():
+                pump = self.pump_windows[self.pump_ids[i]]
+                requests.append((pump, float(pump.volume_var.get()), float(pump.rate_var.get())))
+            count = self.trigger_input.arm(requests)
+        except (KeyError, ValueError) as e:
+            messagebox.showerror("Cannot Arm", str(e))
+            return
+        for pump, volume, rate in requests:
+            pump.log_message(f"Armed for trigger: DISPENSE:{volume},{rate}")
+        self.status_var.set(f"Armed: {count} pump(s)")
+
+    def disarm(self):
+        """Drop the armed dispenses"""
+        self.trigger_input.disarm()
+        self.status_var.set("Not armed")
+
+    def update_status(self):
+        """Show the last trigger and the latency statistics"""
+        if not self.window.winfo_exists():
+            return
+        armed = len(self.trigger_input.armed)
+        lines = [f"Armed: {armed} pump(s)" if armed else "Not armed"]
+        if self.trigger_input.last_result:
+            lines.append(f"Last: {self.trigger_input.last_result.summary()}")
+        stats = self.trigger_input.latency_stats()
+        if stats:
+            lines.append(f"Trigger-to-write over {stats['count']} writes: "
+                         f"p50 {stats['p50_us']:.0f} us, p99 {stats['p99_us']:.0f} us, "
+                         f"max {stats['max_us']:.0f} us")
+        self.status_var.set("\n".join(lines))
+        self.window.after(UPDATE_INTERVAL_MS, self.update_status)